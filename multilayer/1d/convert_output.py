@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+r"""Convert output directories of the multilayer runs to stores
+
+Each output directory given on the command line is converted to a store in
+its *store* subdirectory (see multilayer/store.py).  The analysis scripts
+then read the frames from the store instead of the text files, which can be
+removed afterwards.
+
+    python convert_output.py $DATA_PATH/wet_wave_3/ml_e*_n*_output
+"""
+
+import sys
+
+import multilayer as ml
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "Usage: python convert_output.py outdir [outdir ...]"
+        sys.exit(1)
+
+    for outdir in sys.argv[1:]:
+        store_path = ml.store.convert(outdir)
+        print "Converted %s to %s" % (outdir,store_path)
@@ -47,9 +47,14 @@ def dry_state(num_cells,eigen_method,entropy_fix,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method,entropy_fix)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -61,7 +66,10 @@ def dry_state(num_cells,eigen_method,entropy_fix,**kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step function
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,solution)
@@ -76,8 +84,9 @@ def dry_state(num_cells,eigen_method,entropy_fix,**kargs):
     
     x = pyclaw.Dimension('x',0.0,1.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -129,7 +138,7 @@ def dry_state(num_cells,eigen_method,entropy_fix,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    state = ml.checkpoint.run_driver(controller,kargs)
     
     
     # ============
@@ -143,6 +152,8 @@ def dry_state(num_cells,eigen_method,entropy_fix,**kargs):
               file_format=controller.output_format,
               **plot_kargs)
 
+    return controller
+
 if __name__ == "__main__":
     # Run test case for eigen method = 2 turning on and off entropy fix
     # dry_state(500,2,True)
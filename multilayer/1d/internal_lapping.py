@@ -41,9 +41,14 @@ def internal_lapping(num_cells,eigen_method,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -55,7 +60,10 @@ def internal_lapping(num_cells,eigen_method,**kargs):
     solver.aux_bc_upper[0] = 1
 
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step functioning including the wind forcing
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,solution)
@@ -71,8 +79,9 @@ def internal_lapping(num_cells,eigen_method,**kargs):
     
     x = pyclaw.Dimension('x',0.0,1.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -119,7 +128,7 @@ def internal_lapping(num_cells,eigen_method,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    state = ml.checkpoint.run_driver(controller,kargs)
     
     # ============
     # = Plotting =
@@ -130,6 +139,8 @@ def internal_lapping(num_cells,eigen_method,**kargs):
          htmlplot=kargs.get('htmlplot',False),iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
 
 if __name__ == "__main__":
     # Run the test for the 3rd and 4th wave families for each eigen method
@@ -138,7 +149,7 @@ if __name__ == "__main__":
         for value in sys.argv[1:]:
             eig_methods.append(int(value))
     else:
-        eig_methods = [1,2,3,4]
+        eig_methods = [1,2,3,4,5]
 
     # Resolutions for tests
 
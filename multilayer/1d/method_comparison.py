@@ -11,8 +11,6 @@ Note that in order to use this data the individual runs must be executed using
 import os
 
 import numpy as np
-from scipy.linalg import norm
-from scipy import polyfit
 
 # Plot customization
 import matplotlib
@@ -38,7 +36,7 @@ matplotlib.rcParams['savefig.dpi'] = 100
 # Import plotting package now
 import matplotlib.pyplot as plt
 
-from clawpack.pyclaw.solution import Solution
+import multilayer as ml
 
 # General parameters
 data_path = os.path.abspath(os.environ["DATA_PATH"])
@@ -46,6 +44,9 @@ base_resolution = 5000
 base_method = 4
 num_layers = 2
 
+# Convergence studies of each test, see get_study
+studies = {}
+
 # Plot settings for specfic experiments
 styles = ['go','cs','r+','bx','m.']
 plot_settings = {"wet_wave_3":{"xlim":(0.50,0.60),
@@ -69,7 +70,7 @@ plot_settings = {"wet_wave_3":{"xlim":(0.50,0.60),
 # Labels                 
 y_labels = ['Depth','Top Velocity','Bottom Velocity']
 eigen_labels = ['linearized static','linearized dynamic',
-                'velocity difference','LAPACK']
+                'velocity difference','LAPACK','hybrid']
 
 def row_output(field="",method="",order="",latex=False):
     if latex:
@@ -114,7 +115,7 @@ def make_table(methods,fields,order,title,latex=False):
     for (i,field) in enumerate(fields):
         output += row_output(field,methods[0],order[i][0],latex)
         for (m,method) in enumerate(methods[1:]):
-            output += row_output("",method,order[i][m],latex)
+            output += row_output("",method,order[i][m+1],latex)
         output += minor_row_delimiter + new_line
 
     if latex:
@@ -125,97 +126,53 @@ def make_table(methods,fields,order,title,latex=False):
     return output
 
 
-def extract_data(sol,rho=[0.95,1.0],dry_tolerance=1e-3):
-    r"""Extract relevant quantities from solution object sol"""
-
-    # Empty lists for data
-    h = [None,None]
-    u = [None,None]
-    eta = [None,None]
-            
-    b = sol.state.aux[0,:]
-    
-    h[0] = sol.state.q[0,:] / rho[0]
-    h[1] = sol.state.q[2,:] / rho[1]
-    
-    index = np.nonzero(h[1] > dry_tolerance)
-    eta[1] = b
-    eta[1][index] = h[1] + b 
-    eta[0] = h[0] + eta[1]
-
-    index = np.nonzero(h[0] > dry_tolerance)
-    u[0] = np.zeros(h[0].shape)
-    u[0][index] = sol.state.q[1,:] / sol.state.q[0,:]
-
-    index = np.nonzero(h[1] > dry_tolerance)
-    u[1] = np.zeros(h[0].shape)
-    u[1][index] = sol.state.q[3,:] / sol.state.q[2,:]
-
-    x = sol.domain.grid.dimensions[0].centers
-
-    return x,b,h,eta,u
+def get_study(base_path):
+    r"""Return the (cached) convergence study of the test base_path"""
+    if base_path not in studies:
+        studies[base_path] = ml.convergence.ConvergenceStudy(
+                                    os.path.join(data_path,base_path),
+                                    plot_settings[base_path]["frame"],
+                                    base_method=base_method,
+                                    base_resolution=base_resolution)
+    return studies[base_path]
 
 
 def create_convergence_plot(base_path, eigen_methods=[1,2,3,4], 
                                        resolutions=[64], 
-                                       table_file=None, latex_tables=False):
+                                       table_file=None, latex_tables=False,
+                                       norm='L2'):
     r"""Create plots comparing each eigenspace method 
 
+    The errors of all runs are taken from the error tensor of the cached
+    study of base_path in the grid norm *norm*, one of 'L1', 'L2' or
+    'Linf'.
     """
 
     # Parameters
-    fields = 4
     plot_titles = ["Top Layer Depths",
-                   "Top Layer Velocities",
                    "Bottom Layer Depths",
+                   "Top Layer Velocities",
                    "Bottom Layer Velocities"]
     file_names = ['convergence_top_surface',
                   'convergence_bot_surface',
                   'convergence_top_velocity',
                   'convergence_bot_velocity']
+    labels = [eigen_labels[method-1] for method in eigen_methods]
 
-    # Extract data from plot settings dict
-    frame = plot_settings[base_path]["frame"]
-
-    # Calculate error
-    # error[field,eigen_method,resolution]
-    error = np.zeros((fields,len(eigen_methods),len(resolutions)))
-
-    # Extract base solution
-    path = os.path.join(data_path,base_path,
-                                    'ml_e%s_n%s_output' % (4,base_resolution))
-    x_base,b_base,h_base,eta_base,u_base = \
-                        extract_data(Solution(frame,path=path,read_aux=True))
-
-    # Calculate errors
-    for (m,method) in enumerate(eigen_methods):
-        for (n,resolution) in enumerate(resolutions):
-
-            # Load solution and extract data        
-            path = os.path.join(data_path,base_path,
-                                'ml_e%s_n%s_output' % (method,resolution))
-            x,b,h,eta,u = extract_data(Solution(frame,path=path,read_aux=True))
-
-            error[0,m,n] = norm(h[0][:] - np.interp(x,x_base,h_base[0][:]))
-            error[1,m,n] = norm(h[1][:] - np.interp(x,x_base,h_base[1][:]))
-            error[2,m,n] = norm(u[0][:] - np.interp(x,x_base,u_base[0][:]))
-            error[3,m,n] = norm(u[1][:] - np.interp(x,x_base,u_base[1][:]))
-
-    # Calculate order
-    order = [[] for i in xrange(fields)]
-    for field in xrange(fields):
-        for (m,method) in enumerate(eigen_methods):
-            order[field].append(-polyfit(np.log(resolutions),np.log(error[field,m,:]),1)[1])
+    # error[field,eigen_method,resolution] and order[field,eigen_method]
+    study = get_study(base_path)
+    k = ml.convergence.norms.index(norm)
+    error = study.errors(eigen_methods,resolutions)[k]
+    order = study.orders(eigen_methods,resolutions)[k]
 
     # Create figures and axes
-    figs_list = [plt.figure() for n in xrange(fields)]
+    figs_list = [plt.figure() for n in xrange(len(plot_titles))]
     axes_list = [fig.add_subplot(111) for fig in figs_list]
 
     # Plot errors
     for (m,method) in enumerate(eigen_methods):
-        for i in xrange(fields):
-            # import pdb; pdb.set_trace()
-            axes_list[i].loglog(resolutions,error[i,m,:],styles[m],label=eigen_labels[m])
+        for i in xrange(len(plot_titles)):
+            axes_list[i].loglog(resolutions,error[i,m,:],styles[m],label=labels[m])
 
     # Set plot characteristics
     for (i,axes) in enumerate(axes_list):
@@ -223,7 +180,7 @@ def create_convergence_plot(base_path, eigen_methods=[1,2,3,4],
         axes.set_title(plot_titles[i])
         axes.set_xlim([resolutions[0]-8,resolutions[-1]+32])
         axes.set_xlabel("Number of Cells")
-        axes.set_ylabel("L^2 Error")
+        axes.set_ylabel("%s Error" % norm.replace('L','L^'))
         axes.set_xticks(resolutions)
         axes.set_xticklabels(resolutions)
 
@@ -236,10 +193,10 @@ def create_convergence_plot(base_path, eigen_methods=[1,2,3,4],
 
     # Make table, latex is saved to a file
     if table_file:
-        table_file.write(make_table(eigen_labels,plot_titles,order,base_path,latex_tables))
+        table_file.write(make_table(labels,plot_titles,order,base_path,latex_tables))
         table_file.write("\n"*2)
     else:
-        print make_table(eigen_labels,plot_titles,order,base_path,latex_tables)
+        print make_table(labels,plot_titles,order,base_path,latex_tables)
 
 
 def create_eigen_plot(base_path,eigen_methods=[1,2,3,4],resolution=64):
@@ -247,8 +204,8 @@ def create_eigen_plot(base_path,eigen_methods=[1,2,3,4],resolution=64):
     # Extract data from plot settings dict
     x_limits = plot_settings[base_path]["xlim"]
     y_limits = plot_settings[base_path]["ylim"]
-    frame = plot_settings[base_path]["frame"]
     locations = plot_settings[base_path]["locs"]
+    study = get_study(base_path)
 
     # Create figures and axes
     fig_list = [plt.figure() for n in xrange(3)]
@@ -256,9 +213,8 @@ def create_eigen_plot(base_path,eigen_methods=[1,2,3,4],resolution=64):
 
     for (n,method) in enumerate(eigen_methods):
         # Load solution and extract data        
-        path = os.path.join(data_path,base_path,
-                            'ml_e%s_n%s_output' % (method,resolution))
-        x,b,h,eta,u = extract_data(Solution(frame,path=path,read_aux=True))
+        fields = study.fields(method,resolution)
+        x,eta,u = fields['x'],fields['eta'],fields['u']
 
         # Plot data
         axes_list[0].plot(x,eta[0],styles[n],label='_nolegend_')
@@ -267,9 +223,9 @@ def create_eigen_plot(base_path,eigen_methods=[1,2,3,4],resolution=64):
         axes_list[2].plot(x,u[1],styles[n],label=eigen_labels[method-1])
 
     # Plot reference solutions
-    path = os.path.join(data_path,base_path,
-                                'ml_e%s_n%s_output' % (4,base_resolution))
-    x,b,h,eta,u = extract_data(Solution(frame,path=path,read_aux=True))
+    fields = study.base()
+    x,eta,u = fields['x'],fields['eta'],fields['u']
+    study.save()
     axes_list[0].plot(x,eta[0],'k',label='_nolegend_')
     axes_list[0].plot(x,eta[1],'k',label='Base')
     # axes_list[0].plot(x,b,'k:',label="bathymetry")
@@ -299,8 +255,8 @@ def create_resolution_plot(base_path,method=2,resolutions=[64,128,256,512]):
     # Extract data from plot settings dict
     x_limits = plot_settings[base_path]["xlim"]
     y_limits = plot_settings[base_path]["ylim"]
-    frame = plot_settings[base_path]["frame"]
     locations = plot_settings[base_path]["locs"]
+    study = get_study(base_path)
 
     # Create figures and axes
     fig_list = [plt.figure() for n in xrange(3)]
@@ -308,9 +264,8 @@ def create_resolution_plot(base_path,method=2,resolutions=[64,128,256,512]):
 
     for (n,resolution) in enumerate(resolutions):
         # Load solution and extract data        
-        path = os.path.join(data_path,base_path,
-                            'ml_e%s_n%s_output' % (method,resolution))
-        x,b,h,eta,u = extract_data(Solution(frame,path=path,read_aux=True))
+        fields = study.fields(method,resolution)
+        x,eta,u = fields['x'],fields['eta'],fields['u']
 
         # Plot data
         axes_list[0].plot(x,eta[0],styles[n],label='_nolegend_')
@@ -319,9 +274,9 @@ def create_resolution_plot(base_path,method=2,resolutions=[64,128,256,512]):
         axes_list[2].plot(x,u[1],styles[n],label="N = %s" % resolution)
 
     # Plot reference solutions
-    path = os.path.join(data_path,base_path,
-                                'ml_e%s_n%s_output' % (base_method,base_resolution))
-    x,b,h,eta,u = extract_data(Solution(frame,path=path,read_aux=True))
+    fields = study.base()
+    x,eta,u = fields['x'],fields['eta'],fields['u']
+    study.save()
     axes_list[0].plot(x,eta[0],'k',label='_nolegend_')
     axes_list[0].plot(x,eta[1],'k',label='Base')
     # axes_list[0].plot(x,b,'k:',label="bathymetry")
@@ -3,9 +3,23 @@ Package containing various functions related to the multilayer shallow
 water equations.
 """
 
-__all__ = ['aux','bc','qinit','step']
+__all__ = ['aux','bc','checkpoint','convergence','ensemble','frames','gauges',
+           'layers','parallel','qinit','riemann','schedule','step','store',
+           'timing','wind']
 
 import aux
 import bc
+import checkpoint
+import convergence
+import ensemble
+import frames
+import gauges
+import layers
+import parallel
 import qinit
-import step
\ No newline at end of file
+import riemann
+import schedule
+import step
+import store
+import timing
+import wind
@@ -5,7 +5,11 @@ swe computations."""
 
 import numpy as np
 
-# Define aux array indices
+from layers import state_layout
+from wind import get_oscillatory_wind
+
+# Define aux array indices for two layers, see multilayer.layers.LayerLayout
+# for the general case
 bathy_index = 0
 wind_index = 1
 h_hat_index = [2,3]
@@ -15,24 +19,29 @@ kappa_index = 4
 # = Sets values of h_hat for linearized solver =
 # ==============================================
 def set_h_hat(state,jump_location,eta_left,eta_right):
-    """Set the initial surfaces for Riemann solver use"""
-    b = state.aux[bathy_index,:]
+    """Set the initial surfaces for Riemann solver use
+    
+    *eta_left* and *eta_right* contain one surface per layer ordered from the
+    top down.  Where the bathymetry is above a surface the layers below it
+    are dry and the layer above extends down to the bathymetry.
+    """
+    layout = state_layout(state)
+    b = layout.bathy(state.aux)
+    x = state.grid.dimensions[0].centers
+
+    # Pick the surfaces on each side of the jump
+    left = x < jump_location
+    eta_left = np.asarray(eta_left,dtype=float)
+    eta_right = np.asarray(eta_right,dtype=float)
+    eta = np.where(left,eta_left[:,np.newaxis],eta_right[:,np.newaxis])
 
-    for (i,x) in enumerate(state.grid.dimensions[0].centers):
-        if x < jump_location:
-            if eta_left[1] > b[i]:
-                state.aux[h_hat_index[0],i] = eta_left[0] - eta_left[1]
-                state.aux[h_hat_index[1],i] = eta_left[1] - b[i]
-            else:
-                state.aux[h_hat_index[0],i] = eta_left[0] - b[i]
-                state.aux[h_hat_index[1],i] = 0.0
-        else:
-            if eta_right[1] > b[i]:
-                state.aux[h_hat_index[0],i] = eta_right[0] - eta_right[1]
-                state.aux[h_hat_index[1],i] = eta_right[1] - b[i]
-            else:
-                state.aux[h_hat_index[0],i] = eta_right[0] - b[i]
-                state.aux[h_hat_index[1],i] = 0.0
+    # Surfaces bounding each layer from below are clipped to the bathymetry,
+    # the depths are then differences of consecutive surfaces
+    surfaces = np.empty((layout.num_layers + 1,) + b.shape)
+    surfaces[0,...] = eta[0,...]
+    surfaces[1:-1,...] = np.maximum(eta[1:,...],b)
+    surfaces[-1,...] = b
+    layout.h_hat(state.aux)[...] = surfaces[:-1,...] - surfaces[1:,...]
 
 
 # ==================
@@ -52,11 +61,10 @@ def set_oscillatory_wind(state,A=5.0,N=2.0,omega=2.0,t_length=10.0):
      - *omega* (float)
      - *t_length* (float)
      
+    The spatial profile is cached per grid, see
+    :class:`multilayer.wind.OscillatoryWind`.
     """
-    L = state.grid.upper[0] - state.grid.lower[0]
-    x = state.grid.dimensions[0].centers
-    state.aux[wind_index,:] = A * np.sin(np.pi*N*x/L) \
-                       * np.sin(2.0*np.pi*omega/t_length*state.t)
+    get_oscillatory_wind(A,N,omega,t_length)(state)
 
 
 # ========================
@@ -4,28 +4,87 @@ r"""
 Module containing boundary condition routines for the multilayer
 shallow water equations.
 
+All routines work on whole ghost regions of *qbc* with array slicing.  The
+extent of the ghost regions is taken from the shape of *qbc* so that the
+routines are also correct for the local arrays of a PetClaw decomposition,
+where they only act on processes that own the physical boundary.
+
 :Available Routines:
     - Wall boundary conditions
+    - Reflecting boundary conditions (2D)
 """
 
-# ==========================
-# = 1 Dimensional Routines =
-# ==========================
+from layers import state_layout
+import parallel
+
+def _dimension_axis(state,dim,qbc):
+    r"""Return the axis of qbc and the index of the dimension dim
+
+    The grid's axes are the last ones of qbc, any axes between them and the
+    equation axis hold the members of an ensemble.
+    """
+    names = [dimension.name for dimension in state.grid.dimensions]
+    index = names.index(dim.name)
+    return qbc.ndim - len(names) + index,index
+
+
+def _wall_qbc(state,dim,qbc,num_ghost,lower,mirror=False):
+    r"""Fill the ghost cells on one side of dim with a wall condition
+
+    The ghost cells are either set to the first interior cell or, if *mirror*
+    is True, to the mirror image of the interior cells.  In both cases the
+    momentum normal to the wall is negated in every layer.
+    """
+    axis,index = _dimension_axis(state,dim,qbc)
+    if not parallel.on_boundary(state,index,lower):
+        return
+    layout = state_layout(state)
+    n = qbc.shape[axis]
+
+    ghost = [slice(None)] * qbc.ndim
+    interior = [slice(None)] * qbc.ndim
+    if lower:
+        ghost[axis] = slice(0,num_ghost)
+        if mirror:
+            interior[axis] = slice(2*num_ghost - 1,num_ghost - 1,-1)
+        else:
+            interior[axis] = slice(num_ghost,num_ghost + 1)
+    else:
+        ghost[axis] = slice(n - num_ghost,n)
+        if mirror:
+            stop = n - 2*num_ghost - 1
+            interior[axis] = slice(n - num_ghost - 1,
+                                   stop if stop >= 0 else None,-1)
+        else:
+            interior[axis] = slice(n - num_ghost - 1,n - num_ghost)
+
+    qbc[tuple(ghost)] = qbc[tuple(interior)]
+    ghost[0] = layout.momentum_rows(index)
+    qbc[tuple(ghost)] *= -1.0
+
+# =================
+# = Wall Routines =
+# =================
 def wall_qbc_lower(state,dim,t,qbc,num_ghost):
-    for i in xrange(num_ghost):
-        qbc[0,i] = qbc[0,num_ghost]
-        qbc[1,i] = -qbc[1,num_ghost]
-        qbc[2,i] = qbc[2,num_ghost]
-        qbc[3,i] = -qbc[3,num_ghost]
-    
+    r"""Wall boundary at the lower face of dim, in 1D or 2D"""
+    _wall_qbc(state,dim,qbc,num_ghost,lower=True)
+
 def wall_qbc_upper(state,dim,t,qbc,num_ghost):
-    for i in xrange(num_ghost + dim.num_cells,
-                    2*num_ghost + dim.num_cells):
-        qbc[0,i] = qbc[0,num_ghost + dim.num_cells-1]
-        qbc[1,i] = -qbc[1,num_ghost + dim.num_cells-1]
-        qbc[2,i] = qbc[2,num_ghost + dim.num_cells-1]
-        qbc[3,i] = -qbc[3,num_ghost + dim.num_cells-1]
+    r"""Wall boundary at the upper face of dim, in 1D or 2D"""
+    _wall_qbc(state,dim,qbc,num_ghost,lower=False)
+
+# The wall routines do not depend on the dimension, the 2D names are kept for
+# the existing callers
+wall_qbc_lower_2d = wall_qbc_lower
+wall_qbc_upper_2d = wall_qbc_upper
 
 # ==========================
 # = 2 Dimensional Routines =
 # ==========================
+def reflect_qbc_lower_2d(state,dim,t,qbc,num_ghost):
+    r"""Reflecting boundary mirroring the cells at the lower x or y face"""
+    _wall_qbc(state,dim,qbc,num_ghost,lower=True,mirror=True)
+
+def reflect_qbc_upper_2d(state,dim,t,qbc,num_ghost):
+    r"""Reflecting boundary mirroring the cells at the upper x or y face"""
+    _wall_qbc(state,dim,qbc,num_ghost,lower=False,mirror=True)
@@ -0,0 +1,291 @@
+# encoding: utf-8
+
+r"""Checkpointing and restarting of the multilayer runs
+
+:func:`run` replaces *controller.run()* in the drivers.  The output frames
+are computed in segments of *checkpoint_interval* frames and after each
+segment the state at the last output frame is written to a checkpoint file
+in the output directory.  A checkpoint holds the full precision q and aux
+arrays, the time, the frame number, the time step of the solver and the
+step count and logs of the :class:`multilayer.step.Workspace`.  Restarting
+loads the checkpoint and continues from its frame so the output is numbered
+as in an uninterrupted run.
+
+With *output_store* the frames are written to a :mod:`multilayer.store` in
+the output directory instead of the text files, the store is flushed before
+each checkpoint and truncated to the checkpoint's frame on restart.  A
+*scheduler* (see :mod:`multilayer.schedule`) writes the frames to the store
+when the solution changes instead, the output frames of the controller then
+only mark the checkpoints.  *gauges* (see :mod:`multilayer.gauges`) are
+flushed and truncated in the same way, also under PetClaw.
+
+Under PetClaw every process writes and reads the checkpoint of its own part
+of the grid, a run can then only be restarted with the same number of
+processes.
+
+:func:`run_driver` is the run sequence shared by the drivers, it takes the
+options of :func:`run`, the gauges and the profiling from the driver's
+keyword arguments and writes the step logs of the run afterwards.
+
+:Available Routines:
+    - :func:`run` - Run a controller, checkpointing and optionally restarting
+    - :func:`run_driver` - Run a driver's controller as set by its arguments
+    - :func:`write_checkpoint` - Write the checkpoint of a controller
+    - :func:`read_checkpoint` - Read the checkpoint of an output directory
+    - :func:`restore_checkpoint` - Restore a controller from a checkpoint
+"""
+
+import os
+
+import numpy as np
+
+import gauges
+import parallel
+import step
+import store
+import timing
+
+def checkpoint_path(outdir,comm=None):
+    r"""Path of the checkpoint file of this process in outdir"""
+    if comm is None:
+        return os.path.join(outdir,'checkpoint.npz')
+    return os.path.join(outdir,'checkpoint.%s.npz' % comm.rank)
+
+
+def write_checkpoint(controller,frame):
+    r"""Write the checkpoint of the current state of controller
+
+    The state is assumed to be that of output frame *frame*.  The file is
+    written next to the checkpoint and then moved over it so a run killed
+    while writing keeps its previous checkpoint.
+    """
+    solver = controller.solver
+    state = controller.solution.state
+    comm = parallel.communicator(state)
+    data = {'q':state.q,'aux':state.aux,'t':controller.solution.t,
+            'frame':frame,'dt':solver.dt,
+            'num_processes':1 if comm is None else comm.size}
+    workspace = getattr(solver,'workspace',None)
+    if workspace is not None:
+        data['num_steps'] = workspace.num_steps
+        data['hyperbolicity'] = workspace.hyperbolicity.records
+        data['eigen_paths'] = workspace.eigen_paths.records
+
+    path = checkpoint_path(controller.outdir,comm)
+    temp_path = path + '.tmp.npz'
+    np.savez(temp_path,**data)
+    os.rename(temp_path,path)
+
+
+def read_checkpoint(outdir,comm=None):
+    r"""Read the checkpoint of this process in outdir, None if there is none"""
+    path = checkpoint_path(outdir,comm)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return dict((name,data[name]) for name in data.files)
+
+
+def restore_checkpoint(controller,data):
+    r"""Restore the state, solver and workspace of controller from data
+
+    Returns the frame the checkpoint was taken at.
+    """
+    solver = controller.solver
+    state = controller.solution.state
+    comm = parallel.communicator(state)
+    num_processes = 1 if comm is None else comm.size
+    if int(data['num_processes']) != num_processes:
+        raise ValueError("Checkpoint was written by %s processes, restarting"
+                         " with %s." % (data['num_processes'],num_processes))
+    if data['q'].shape != state.q.shape or data['aux'].shape != state.aux.shape:
+        raise ValueError("Checkpoint arrays have shape %s and %s, expected %s"
+                         " and %s." % (data['q'].shape,data['aux'].shape,
+                                       state.q.shape,state.aux.shape))
+
+    state.q = np.array(data['q'])
+    state.aux = np.array(data['aux'])
+    controller.solution.t = float(data['t'])
+    solver.dt = float(data['dt'])
+    if 'num_steps' in data:
+        workspace = step.get_workspace(solver,state)
+        workspace.num_steps = int(data['num_steps'])
+        for record in data['hyperbolicity']:
+            workspace.hyperbolicity.record(*record.item())
+        for record in data['eigen_paths']:
+            workspace.eigen_paths.record(*record.item())
+    return int(data['frame'])
+
+
+def run(controller,restart=False,checkpoint_interval=10,output_store=False,
+               scheduler=None,gauges=None):
+    r"""Run controller writing a checkpoint every *checkpoint_interval* frames
+
+    Output styles 1 and 2 are run as a sequence of output style 2 runs over
+    the output times of the full run, output style 3 as runs of fewer
+    output frames.  The controller's output parameters are restored
+    afterwards.
+
+    :Input:
+     - *controller* (:class:pyclaw.controller.Controller) - Controller set up
+       as for *controller.run()*.
+     - *restart* (bool) - Continue from the checkpoint in *controller.outdir*
+       if there is one.
+     - *checkpoint_interval* (int) - Number of output frames between
+       checkpoints, None only writes a checkpoint at the end of the run.
+     - *output_store* (bool) - Write the frames to a store in
+       *controller.outdir* instead of the controller's output format.  Only
+       available for serial runs.
+     - *scheduler* (:class:`multilayer.schedule.OutputScheduler`) - Write
+       the frames chosen by scheduler to a store in *controller.outdir*
+       instead of the controller's frames.  Only available for serial runs.
+     - *gauges* (:class:`multilayer.gauges.GaugeRecorder`) - Record the
+       gauges of the run in *controller.outdir*.
+
+    :Output:
+     - (dict) - Status returned by the last *controller.run()*.
+    """
+    solution = controller.solution
+    if controller.output_style == 1:
+        times = np.linspace(solution.t,controller.tfinal,
+                            controller.num_output_times + 1)
+    elif controller.output_style == 2:
+        times = np.asarray(controller.out_times,dtype=float)
+    elif controller.output_style == 3:
+        times = None
+    else:
+        raise NotImplementedError("Output style %s can not be checkpointed."
+                                                    % controller.output_style)
+    if times is None:
+        num_frames = controller.num_output_times
+    else:
+        num_frames = times.shape[0] - 1
+
+    start_frame = controller.start_frame
+    data = None
+    if restart:
+        data = read_checkpoint(controller.outdir,
+                               parallel.communicator(solution.state))
+        if data is None:
+            print "No checkpoint found in %s, starting from frame %s." % (
+                                                controller.outdir,start_frame)
+        else:
+            start_frame = restore_checkpoint(controller,data)
+            print "Restarting from frame %s at t = %s." % (start_frame,
+                                                           solution.t)
+    if checkpoint_interval is None:
+        checkpoint_interval = max(num_frames,1)
+
+    saved = dict((name,getattr(controller,name)) for name in
+                    ['output_style','out_times','num_output_times','tfinal',
+                     'start_frame','output_format','keep_copy'])
+    writer = None
+    recorders = [recorder for recorder in (scheduler,gauges)
+                                                if recorder is not None]
+    if (output_store or scheduler is not None) and \
+                        parallel.communicator(solution.state) is not None:
+        raise NotImplementedError("Stores can only be written by serial runs.")
+    if output_store and scheduler is not None:
+        raise ValueError("Only one of output_store and scheduler can be used.")
+    if output_store:
+        store_path = os.path.join(controller.outdir,store.store_name)
+        if data is not None and store.is_store(store_path):
+            writer = store.RunWriter.append(store_path,start_frame)
+        else:
+            writer = store.open_writer(store_path,solution)
+        # The frames are taken from the copies kept by the controller
+        controller.output_format = None
+        controller.keep_copy = True
+    before_step = controller.solver.before_step
+    for recorder in recorders:
+        recorder.open(controller.outdir,solution,
+                      restart_time=None if data is None else solution.t)
+        recorder.attach(controller.solver)
+    if scheduler is not None:
+        controller.output_format = None
+
+    status = None
+    try:
+        for first in xrange(start_frame,num_frames,checkpoint_interval):
+            last = min(first + checkpoint_interval,num_frames)
+            controller.start_frame = first
+            if times is None:
+                controller.num_output_times = last - first
+            else:
+                controller.output_style = 2
+                controller.out_times = times[first:last + 1]
+                controller.tfinal = times[last]
+
+            num_kept = len(controller.frames)
+            status = controller.run()
+            if writer is not None:
+                for (n,frame) in enumerate(controller.frames[num_kept:]):
+                    writer.write(first + n,frame.t,frame.state.q,
+                                 frame.state.aux)
+                writer.flush()
+            for recorder in recorders:
+                recorder.flush()
+            # Every run starts by writing out its first frame again
+            if not saved['keep_copy']:
+                del controller.frames[num_kept:]
+            elif first > start_frame:
+                del controller.frames[num_kept]
+
+            write_checkpoint(controller,last)
+        for recorder in recorders:
+            recorder.finish(solution.state)
+    finally:
+        for (name,value) in saved.iteritems():
+            setattr(controller,name,value)
+        controller.solver.before_step = before_step
+    return status
+
+
+def run_driver(controller,kargs,scheduler=None,default_gauges=None,
+                                profile=None):
+    r"""Run the controller of a driver as asked for by its keyword arguments
+
+    Runs :func:`run` with the *restart*, *checkpoint_interval* and
+    *output_store* arguments in *kargs* and records the gauges at
+    *kargs['gauges']*, *default_gauges* if not given, every
+    *kargs['gauge_interval']* steps.  With *kargs['profile']* the solver and
+    its callbacks are timed.  A run stopped by a
+    :class:`multilayer.step.RichardsonExceededError` is reported and ends
+    there.  Afterwards the steps where hyperbolicity may have failed and
+    where the hybrid eigen method was expensive and the timings are written
+    to *controller.outdir*.
+
+    :Input:
+     - *controller* (:class:pyclaw.controller.Controller) - Controller of
+       the driver set up as for *controller.run()*.
+     - *kargs* (dict) - Keyword arguments of the driver.
+     - *scheduler* (:class:`multilayer.schedule.OutputScheduler`) - Passed
+       on to :func:`run`.
+     - *default_gauges* (list) - Gauge locations if *kargs* has none, None
+       records no gauges.
+     - *profile* (:class:`multilayer.timing.CallbackProfile`) - Profile the
+       solver is timed in, e.g. one that further functions of the driver
+       were wrapped with.  By default a new one.
+
+    :Output:
+     - (dict) - Status returned by :func:`run`, None if it was stopped.
+    """
+    solver = controller.solver
+    state = controller.solution.state
+    if kargs.get('profile',False):
+        profile = timing.instrument(solver,profile)
+    status = None
+    try:
+        status = run(controller,restart=kargs.get('restart',False),
+                     checkpoint_interval=kargs.get('checkpoint_interval',10),
+                     output_store=kargs.get('output_store',False),
+                     scheduler=scheduler,
+                     gauges=gauges.recorder(kargs.get('gauges',default_gauges),
+                                            kargs.get('gauge_interval',1)))
+    except step.RichardsonExceededError as e:
+        print e
+
+    step.get_workspace(solver,state).write_logs(controller.outdir)
+    if kargs.get('profile',False):
+        profile.write(controller.outdir,parallel.communicator(state))
+    return status
@@ -0,0 +1,319 @@
+# encoding: utf-8
+
+r"""Cached field extraction and error evaluation for convergence studies
+
+A convergence study compares the solutions of several eigen methods at a
+sequence of resolutions against a fine base solution.  Each study used to
+parse the same output frames many times over, here the fields needed from a
+frame are extracted once and stored in an npz sidecar file in the output
+directory, written once for all of the frames extracted in a batch.  Entries
+are keyed on a hash of the names, sizes and modification times of the frame
+files, or of the chunks holding the frame if the run was written to a
+:mod:`multilayer.store`, and the extraction parameters so a rerun
+invalidates them automatically without the files being read.
+
+The errors of all of the runs are then evaluated in one pass against the
+base solution interpolated once per resolution and kept as a tensor
+
+    error[norm,field,method,resolution]
+
+from which the tables, plots and order fits are made.
+
+:Available Routines:
+    - :func:`extract_fields` - Fields of a frame without touching its arrays
+    - :class:`FieldCache` - Per output directory cache of extracted fields
+    - :class:`ConvergenceStudy` - Error tensor of a set of runs
+    - :func:`convergence_order` - Least squares order fit of an error tensor
+"""
+
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+
+from frames import read_frame
+from layers import get_layout
+import store
+
+# Fields compared in a study and the norms the errors are taken in
+fields = ['h_top','h_bottom','u_top','u_bottom']
+norms = ['L1','L2','Linf']
+
+def extract_fields(q,aux,x,rho,dry_tolerance):
+    r"""Compute the depths, surfaces and velocities of each layer
+
+    Surfaces of dry bottom layers are set to the bathymetry and velocities of
+    dry layers to zero.  New arrays are returned for all of the fields, in
+    particular the bathymetry is copied so that neither *q* nor *aux* are
+    modified.
+
+    :Output:
+     - (dict) - Arrays *x*, *b*, *h*, *eta* and *u*, the last three of shape
+       (num_layers,mx) ordered from the top layer down.
+    """
+    layout = get_layout(len(rho))
+    b = np.array(layout.bathy(aux),dtype=float)
+    h = layout.depth(q) / layout.density_column(rho)
+    wet = h > dry_tolerance
+
+    eta = layout.surfaces(q,b,rho)
+    eta[-1,...] = np.where(wet[-1,...],eta[-1,...],b)
+    for layer in xrange(layout.num_layers - 2,-1,-1):
+        eta[layer,...] = h[layer,...] + eta[layer + 1,...]
+
+    u = np.zeros(h.shape)
+    np.divide(layout.momentum(q),layout.depth(q),out=u,where=wet)
+
+    return {'x':np.array(x,dtype=float),'b':b,'h':h,'eta':eta,'u':u}
+
+
+class FieldCache(object):
+    r"""Fields extracted from the frames of one output directory
+
+    Extracted frames are added to *path/cache_name* by :meth:`save`.  A
+    stored frame is only used if the key of the frame files and of *rho* and
+    *dry_tolerance* it was stored with matches, otherwise the frame is read
+    and extracted again.
+
+    :Input:
+     - *path* (path) - Output directory.
+     - *rho* (list) - Densities of the layers.
+     - *dry_tolerance* (float) - Depth below which a layer is dry.
+     - *file_format* (string) - Format of the output, default is 'ascii'.
+     - *file_prefix* (string) - Prefix of the output files, default 'fort'.
+     - *cache_name* (string) - Name of the sidecar file.
+    """
+
+    field_names = ['x','b','h','eta','u']
+
+    def __init__(self,path,rho,dry_tolerance,file_format='ascii',
+                      file_prefix='fort',cache_name='extracted_fields.npz'):
+        self.path = path
+        self.rho = list(rho)
+        self.dry_tolerance = dry_tolerance
+        self.file_format = file_format
+        self.file_prefix = file_prefix
+        self.cache_path = os.path.join(path,cache_name)
+        self.num_reads = 0
+        self._stored = None
+        self._modified = False
+        self._frames = {}
+
+    def _store_files(self,store_path,frame,digest):
+        r"""Add the store's entry of frame to digest, return its chunk files
+
+        The grid and chunking of the store and the position and time of
+        frame are hashed rather than all of store.json, which changes
+        whenever a frame is added.
+        """
+        with open(os.path.join(store_path,store.meta_name),'r') as meta_file:
+            meta = json.load(meta_file)
+        if frame not in meta['frames']:
+            raise IOError("Frame %s not found in %s." % (frame,store_path))
+        position = meta['frames'].index(frame)
+        entry = dict((name,value) for (name,value) in meta.iteritems()
+                                            if name not in ('frames','t'))
+        entry['position'] = position
+        entry['t'] = meta['t'][position]
+        digest.update(json.dumps(entry,sort_keys=True).encode('utf-8'))
+
+        time_chunk = position // meta['frames_per_chunk']
+        files = []
+        for field in ('q','aux'):
+            files.extend(sorted(glob.glob(os.path.join(store_path,
+                                    "%s_%04d_*.npz" % (field,time_chunk)))))
+        static_path = os.path.join(store_path,'static.npz')
+        if os.path.exists(static_path):
+            files.append(static_path)
+        return files
+
+    def frame_key(self,frame):
+        r"""Hash of the files of frame and of the extraction parameters
+
+        The name, size and modification time of each file are hashed, not
+        its contents.  If the output directory has a store (see
+        :func:`multilayer.store.find_store`) the frame is read from it and
+        the chunks holding the frame are hashed instead of the text files.
+        """
+        digest = hashlib.sha1()
+        digest.update(repr((self.rho,self.dry_tolerance)).encode('utf-8'))
+        store_path = store.find_store(self.path,self.file_prefix)
+        if store_path is not None:
+            files = self._store_files(store_path,frame,digest)
+        else:
+            files = sorted(glob.glob(os.path.join(self.path,
+                                    "%s.*%04d" % (self.file_prefix,frame))))
+            if len(files) == 0:
+                raise IOError("Frame %s not found in %s." % (frame,self.path))
+        for file_path in files:
+            info = os.stat(file_path)
+            digest.update(repr((os.path.basename(file_path),info.st_size,
+                                info.st_mtime)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load(self):
+        r"""Read the entries stored in the sidecar file"""
+        if self._stored is None:
+            self._stored = {}
+            if os.path.exists(self.cache_path):
+                with np.load(self.cache_path) as data:
+                    self._stored = dict((name,data[name])
+                                                    for name in data.files)
+        return self._stored
+
+    def save(self):
+        r"""Write the sidecar file if frames were added since the last save"""
+        if not self._modified:
+            return
+        temp_path = self.cache_path + '.tmp.npz'
+        np.savez(temp_path,**self._stored)
+        os.rename(temp_path,self.cache_path)
+        self._modified = False
+
+    def get(self,frame):
+        r"""Return the fields of frame as given by :func:`extract_fields`
+
+        Newly extracted frames are kept in memory until :meth:`save`.
+        """
+        if frame in self._frames:
+            return self._frames[frame]
+
+        stored = self._load()
+        prefix = "frame%s_" % frame
+        key = self.frame_key(frame)
+        if str(stored.get(prefix + 'key')) == key:
+            entry = dict((name,stored[prefix + name])
+                                            for name in self.field_names)
+        else:
+            self.num_reads += 1
+            solution = read_frame(frame,self.path,read_aux=True,
+                                  file_format=self.file_format,
+                                  file_prefix=self.file_prefix)
+            entry = extract_fields(solution.state.q,solution.state.aux,
+                                   solution.state.grid.dimensions[0].centers,
+                                   self.rho,self.dry_tolerance)
+            stored[prefix + 'key'] = np.array(key)
+            for name in self.field_names:
+                stored[prefix + name] = entry[name]
+            self._modified = True
+
+        self._frames[frame] = entry
+        return entry
+
+
+def convergence_order(resolutions,error):
+    r"""Fit error ~ C N^(-order) along the last axis of error
+
+    All of the fits are done in one least squares solve, entries with a zero
+    error give an order of nan.
+    """
+    error = np.asarray(error,dtype=float)
+    log_n = np.log(np.asarray(resolutions,dtype=float))
+    with np.errstate(divide='ignore'):
+        log_error = np.log(error.reshape((-1,error.shape[-1])))
+    A = np.vstack((log_n,np.ones(log_n.shape))).T
+    finite = np.all(np.isfinite(log_error),axis=1)
+    order = np.empty(log_error.shape[0])
+    order.fill(np.nan)
+    if np.any(finite):
+        coefficients = np.linalg.lstsq(A,log_error[finite].T,rcond=None)[0]
+        order[finite] = -coefficients[0]
+    return order.reshape(error.shape[:-1])
+
+
+class ConvergenceStudy(object):
+    r"""Errors of a set of runs of one test against its base solution
+
+    The runs of *method* at *resolution* are expected in
+    *path/run_name % (method,resolution)*.
+
+    :Input:
+     - *path* (path) - Directory containing the runs of the test.
+     - *frame* (int) - Frame compared.
+     - *rho* (list) - Densities of the layers.
+     - *dry_tolerance* (float) - Depth below which a layer is dry.
+     - *base_method* (int) - Eigen method of the base solution.
+     - *base_resolution* (int) - Resolution of the base solution.
+     - *run_name* (string) - Output directory name of a run.
+    """
+
+    def __init__(self,path,frame,rho=[0.95,1.0],dry_tolerance=1e-3,
+                      base_method=4,base_resolution=5000,
+                      run_name='ml_e%s_n%s_output'):
+        self.path = path
+        self.frame = frame
+        self.rho = rho
+        self.dry_tolerance = dry_tolerance
+        self.base_method = base_method
+        self.base_resolution = base_resolution
+        self.run_name = run_name
+        self._caches = {}
+        self._errors = {}
+
+    def cache(self,method,resolution):
+        r"""Return the :class:`FieldCache` of a run"""
+        if (method,resolution) not in self._caches:
+            path = os.path.join(self.path,self.run_name % (method,resolution))
+            self._caches[method,resolution] = FieldCache(path,self.rho,
+                                                         self.dry_tolerance)
+        return self._caches[method,resolution]
+
+    def fields(self,method,resolution,frame=None):
+        r"""Return the extracted fields of a run at frame"""
+        if frame is None:
+            frame = self.frame
+        return self.cache(method,resolution).get(frame)
+
+    def save(self):
+        r"""Write the sidecar files of all of the runs read"""
+        for cache in self._caches.itervalues():
+            cache.save()
+
+    def base(self,frame=None):
+        r"""Return the extracted fields of the base solution at frame"""
+        return self.fields(self.base_method,self.base_resolution,frame)
+
+    @staticmethod
+    def _stack(entry):
+        r"""Stack the compared fields of an entry as rows"""
+        return np.vstack((entry['h'],entry['u']))
+
+    def errors(self,eigen_methods,resolutions):
+        r"""Return the error tensor error[norm,field,method,resolution]
+
+        The base solution is interpolated once per resolution and all of the
+        methods at that resolution are differenced against it together.
+        Errors are grid norms, i.e. the L1 and L2 norms are scaled by the
+        cell width.  The fields extracted are saved afterwards.
+        """
+        key = (tuple(eigen_methods),tuple(resolutions))
+        if key in self._errors:
+            return self._errors[key]
+
+        base = self.base()
+        base_values = self._stack(base)
+        error = np.empty((len(norms),len(fields),len(eigen_methods),
+                          len(resolutions)))
+        for (n,resolution) in enumerate(resolutions):
+            entries = [self.fields(method,resolution)
+                                                for method in eigen_methods]
+            x = entries[0]['x']
+            interpolated = np.array([np.interp(x,base['x'],row)
+                                                    for row in base_values])
+            values = np.array([self._stack(entry) for entry in entries])
+            difference = np.abs(values - interpolated[np.newaxis,...])
+            dx = (x[-1] - x[0]) / (x.shape[0] - 1)
+            error[0,:,:,n] = dx * np.sum(difference,axis=-1).T
+            error[1,:,:,n] = np.sqrt(dx * np.sum(difference**2,axis=-1)).T
+            error[2,:,:,n] = np.max(difference,axis=-1).T
+
+        self.save()
+        self._errors[key] = error
+        return error
+
+    def orders(self,eigen_methods,resolutions):
+        r"""Return the convergence orders order[norm,field,method]"""
+        return convergence_order(resolutions,
+                                 self.errors(eigen_methods,resolutions))
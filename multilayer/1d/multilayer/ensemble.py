@@ -0,0 +1,306 @@
+# encoding: utf-8
+
+r"""Batched solution of an ensemble of one dimensional multilayer problems
+
+An ensemble is a set of *num_members* problems on the same grid and with the
+same physical parameters that differ only in their initial conditions, e.g.
+the amplitude *epsilon* of :func:`multilayer.qinit.set_acta_numerica_init_condition`.
+The members are stored along an extra axis following the equation axis
+
+    q[num_eqn,num_members,num_cells],  aux[num_aux,num_members,num_cells]
+
+so that the layer views of :mod:`multilayer.layers` select the same rows as
+for a single state.  :func:`multilayer.step.before_step`, the friction
+source, the wind providers, the boundary conditions in :mod:`multilayer.bc`
+and the initial conditions all work on these arrays directly.  Parameters of
+the initial conditions given as a column of one value per member (see
+:func:`member_values`) give each member its own perturbation.
+
+:class:`EnsembleSolver` advances all members at once with the classic wave
+propagation method and the Python Riemann solver called once per step on
+the interfaces of all members.  The members share the time step, which is
+chosen from the largest wave speed over all of them.
+
+:Available Routines:
+    - :class:`EnsembleState` - Batched q and aux arrays on a grid
+    - :class:`EnsembleSolver` - Classic wave propagation on an ensemble
+    - :func:`member_values` - Per member parameters for the initial conditions
+    - :func:`open_member_writers` - Stores for the output of each member
+"""
+
+import os
+import copy
+
+import numpy as np
+
+import bc
+import riemann
+import store
+
+def member_values(values):
+    r"""Return values as a column broadcasting against the (member,x) views"""
+    return np.asarray(values,dtype=float).reshape((-1,1))
+
+
+class EnsembleState(object):
+    r"""q and aux of *num_members* members on a one dimensional grid
+
+    :Input:
+     - *grid* (:class:pyclaw.geometry.Grid) - Grid shared by the members.
+     - *num_eqn*, *num_aux* (int) - Number of rows of q and aux.
+     - *num_members* (int) - Number of members.
+     - *problem_data* (dict) - Parameters shared by the members.
+    """
+
+    def __init__(self,grid,num_eqn,num_aux,num_members,problem_data=None):
+        num_cells = grid.dimensions[0].num_cells
+        self.grid = grid
+        self.num_eqn = num_eqn
+        self.num_aux = num_aux
+        self.num_members = num_members
+        self.q = np.zeros((num_eqn,num_members,num_cells))
+        self.aux = np.zeros((num_aux,num_members,num_cells))
+        self.problem_data = {} if problem_data is None \
+                               else copy.deepcopy(problem_data)
+        self.t = 0.0
+
+    @classmethod
+    def from_state(cls,state,num_members):
+        r"""Create an ensemble with every member a copy of state"""
+        ensemble = cls(state.grid,state.q.shape[0],state.aux.shape[0],
+                       num_members,state.problem_data)
+        ensemble.q[...] = state.q[:,np.newaxis,:]
+        ensemble.aux[...] = state.aux[:,np.newaxis,:]
+        ensemble.t = state.t
+        return ensemble
+
+    def member(self,k):
+        r"""Return (views of) q and aux of member k"""
+        return self.q[:,k,:],self.aux[:,k,:]
+
+
+# Limiters of the wave propagation method, numbered as in PyClaw
+def _minmod(theta):
+    return np.maximum(0.0,np.minimum(1.0,theta))
+
+def _superbee(theta):
+    return np.maximum(0.0,np.maximum(np.minimum(1.0,2.0 * theta),
+                                     np.minimum(2.0,theta)))
+
+def _mc(theta):
+    return np.maximum(0.0,np.minimum(np.minimum(0.5 * (1.0 + theta),2.0),
+                                     2.0 * theta))
+
+def _van_leer(theta):
+    return (theta + np.abs(theta)) / (1.0 + np.abs(theta))
+
+limiter_functions = {1:_minmod,2:_superbee,3:_mc,4:_van_leer}
+
+
+class EnsembleSolver(object):
+    r"""Classic f-wave propagation on the members of an :class:`EnsembleState`
+
+    The interface mirrors the parts of the PyClaw classic solver used by the
+    drivers: *before_step(solver,state)*, *step_source(solver,state,dt)*
+    (Godunov split), *bc_lower*/*bc_upper* with 0 for *user_bc_lower* and
+    *user_bc_upper*, 1 for extrapolation, 2 for periodic and 3 for a solid
+    wall, *aux_bc_lower*/*aux_bc_upper* (1 or 2), *limiters*, *cfl_desired*,
+    *cfl_max*, *dt_initial*, *dt_max* and *max_steps*.
+
+    :Input:
+     - *rp* (func) - Python Riemann solver, default the layered f-wave
+       solver of :mod:`multilayer.riemann`.
+     - *num_waves* (int) - Number of waves of rp.
+    """
+
+    # Source terms update q in place as for the classic solvers
+    ensemble = True
+    num_ghost = 2
+
+    def __init__(self,rp=riemann.layered_shallow_water_1D,num_waves=4):
+        self.rp = rp
+        self.num_waves = num_waves
+        self.limiters = 3
+        self.order = 2
+        self.cfl_desired = 0.9
+        self.cfl_max = 1.0
+        self.dt_initial = 0.1
+        self.dt_max = 1e99
+        self.dt = None
+        self.max_steps = 5000
+        self.bc_lower = [1]
+        self.bc_upper = [1]
+        self.aux_bc_lower = [1]
+        self.aux_bc_upper = [1]
+        self.user_bc_lower = None
+        self.user_bc_upper = None
+        self.before_step = None
+        self.step_source = None
+        self.num_steps = 0
+        self.num_rejected = 0
+
+    def _with_ghost_cells(self,array,lower,upper,t,state,user=True):
+        r"""Copy array into a new array with ghost cells filled"""
+        g = self.num_ghost
+        shape = array.shape[:-1] + (array.shape[-1] + 2 * g,)
+        abc = np.empty(shape)
+        abc[...,g:-g] = array
+        dimension = state.grid.dimensions[0]
+        for (bc_type,is_lower) in ((lower,True),(upper,False)):
+            ghost = slice(0,g) if is_lower else slice(-g,None)
+            if bc_type == 1:
+                abc[...,ghost] = abc[...,g:g + 1] if is_lower \
+                                                  else abc[...,-g - 1:-g]
+            elif bc_type == 2:
+                abc[...,ghost] = abc[...,-2 * g:-g] if is_lower \
+                                                    else abc[...,g:2 * g]
+            elif bc_type == 3 and user:
+                bc._wall_qbc(state,dimension,abc,g,lower=is_lower,mirror=True)
+            elif bc_type == 0 and user:
+                func = self.user_bc_lower if is_lower else self.user_bc_upper
+                func(state,dimension,t,abc,g)
+            else:
+                raise ValueError("Boundary condition %s is not supported."
+                                                                    % bc_type)
+        return abc
+
+    def _limit(self,wave,s):
+        r"""Limit the waves at each interface by the upwind waves"""
+        if self.limiters == 0:
+            return wave
+        limiter = limiter_functions[self.limiters]
+        norm2 = np.einsum('i...,i...->...',wave,wave)
+        dot_left = np.einsum('i...,i...->...',wave[...,1:-1],wave[...,:-2])
+        dot_right = np.einsum('i...,i...->...',wave[...,1:-1],wave[...,2:])
+        upwind = np.where(s[...,1:-1] > 0.0,dot_left,dot_right)
+        theta = np.zeros(upwind.shape)
+        np.divide(upwind,norm2[...,1:-1],out=theta,
+                  where=norm2[...,1:-1] > 0.0)
+        limited = wave.copy()
+        limited[...,1:-1] *= limiter(theta)[np.newaxis,...]
+        return limited
+
+    def step(self,state,dt):
+        r"""Take a step of size dt, returns the CFL number
+
+        If the CFL number exceeds *cfl_max* q is left untouched.
+        """
+        g = self.num_ghost
+        num_cells = state.q.shape[-1]
+        dx = state.grid.dimensions[0].delta
+        qbc = self._with_ghost_cells(state.q,self.bc_lower[0],
+                                     self.bc_upper[0],state.t,state)
+        auxbc = self._with_ghost_cells(state.aux,self.aux_bc_lower[0],
+                                       self.aux_bc_upper[0],state.t,state,
+                                       user=False)
+
+        # Riemann problems at the interfaces of all members at once
+        num_eqn = qbc.shape[0]
+        interior_shape = qbc.shape[1:-1] + (qbc.shape[-1] - 1,)
+        flat = lambda a: a.reshape((a.shape[0],-1))
+        wave,s,amdq,apdq = self.rp(flat(qbc[...,:-1]),flat(qbc[...,1:]),
+                                   flat(auxbc[...,:-1]),flat(auxbc[...,1:]),
+                                   state.problem_data)
+        wave = wave.reshape((num_eqn,self.num_waves) + interior_shape)
+        s = s.reshape((self.num_waves,) + interior_shape)
+        amdq = amdq.reshape((num_eqn,) + interior_shape)
+        apdq = apdq.reshape((num_eqn,) + interior_shape)
+
+        # Interfaces g - 1 to g + num_cells bound the interior cells
+        cfl = dt / dx * np.max(np.abs(s[...,g - 1:g + num_cells]))
+        if cfl > self.cfl_max:
+            return cfl
+
+        dtdx = dt / dx
+        left = slice(g - 1,g + num_cells - 1)
+        right = slice(g,g + num_cells)
+        dq = -dtdx * (apdq[...,left] + amdq[...,right])
+
+        if self.order == 2:
+            wave = self._limit(wave,s)
+            factor = 0.5 * np.sign(s) * (1.0 - dtdx * np.abs(s))
+            f = np.einsum('j...,ij...->i...',factor,wave)
+            dq -= dtdx * (f[...,right] - f[...,left])
+
+        state.q += dq
+        return cfl
+
+    def evolve_to_time(self,state,tend):
+        r"""Advance all members of state to time tend"""
+        if self.dt is None:
+            self.dt = self.dt_initial
+        num_steps = 0
+        while state.t < tend and not np.isclose(state.t,tend,rtol=1e-14,
+                                                     atol=0.0):
+            if num_steps >= self.max_steps:
+                raise Exception("Maximum number of time steps (%s) reached."
+                                                            % self.max_steps)
+            if self.before_step is not None:
+                self.before_step(self,state)
+
+            # Retake the step with a smaller dt until the CFL condition holds,
+            # rejected steps leave q untouched
+            while True:
+                dt = min(self.dt,tend - state.t)
+                cfl = self.step(state,dt)
+                if cfl <= self.cfl_max:
+                    break
+                self.num_rejected += 1
+                self.dt = min(self.dt_max,self.dt * self.cfl_desired / cfl)
+
+            if self.step_source is not None:
+                self.step_source(self,state,dt)
+            state.t += dt
+            num_steps += 1
+            self.num_steps += 1
+            if cfl > 0.0:
+                self.dt = min(self.dt_max,dt * self.cfl_desired / cfl)
+
+    def run(self,state,out_times,writers=None):
+        r"""Evolve state through out_times, returning q at each of them
+
+        If *writers* are given, see :func:`open_member_writers`, the frames
+        of each member are written to its store instead of being returned.
+
+        :Output:
+         - (ndarray(len(out_times),num_eqn,num_members,num_cells)) - None if
+           *writers* are given.
+        """
+        frames = None
+        if writers is None:
+            frames = np.empty((len(out_times),) + state.q.shape)
+        for (n,t) in enumerate(out_times):
+            self.evolve_to_time(state,t)
+            if writers is None:
+                frames[n,...] = state.q
+                continue
+            for (k,writer) in enumerate(writers):
+                q,aux = state.member(k)
+                writer.write(n,state.t,q,aux)
+        if writers is not None:
+            for writer in writers:
+                writer.close()
+        return frames
+
+
+def member_path(outdir,k):
+    r"""Path of the store of member k of an ensemble run in outdir"""
+    return os.path.join(outdir,'member_%s' % k,store.store_name)
+
+
+def open_member_writers(outdir,state,**kargs):
+    r"""Create a :class:`multilayer.store.RunWriter` for each member
+
+    The store of member k is written to *outdir/member_k/store* so each
+    member can be read as an output directory of its own by
+    :mod:`multilayer.frames`.
+    """
+    dimension = state.grid.dimensions[0]
+    problem_data = dict((key,value) for (key,value)
+                            in state.problem_data.iteritems()
+                            if isinstance(value,(int,float,bool,str,list)))
+    return [store.RunWriter(member_path(outdir,k),dimension.lower,
+                            dimension.upper,dimension.num_cells,
+                            state.q.shape[0],state.aux.shape[0],
+                            problem_data=problem_data,**kargs)
+                                        for k in xrange(state.num_members)]
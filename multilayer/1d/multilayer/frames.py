@@ -0,0 +1,144 @@
+# encoding: utf-8
+
+r"""Routines for reading the output frames of a run
+
+Frames are discovered from the files in the output directory instead of
+reading until a frame is missing, and fields derived from each frame can be
+streamed into a preallocated or memory mapped array so that only a few
+frames are held in memory at any time.  If the output directory contains an
+up to date store (see :mod:`multilayer.store`) frames are read from it
+instead of the per frame files.
+
+:Available Routines:
+    - :func:`find_frames` - List the frames present in an output directory
+    - :func:`read_frame` - Read a single frame
+    - :func:`build_hovmoller` - Accumulate a field over all frames (x-t)
+"""
+
+import os
+import re
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from clawpack.pyclaw.solution import Solution
+
+import store
+
+_readers = {}
+
+def _store_reader(path,file_prefix):
+    r"""Return the (cached) reader of the store of path, None if there is none"""
+    store_path = store.find_store(path,file_prefix)
+    if store_path is None:
+        return None
+    mtime = os.path.getmtime(os.path.join(store_path,store.meta_name))
+    reader = _readers.get(store_path)
+    if reader is None or reader.mtime != mtime:
+        reader = store.RunReader(store_path)
+        reader.mtime = mtime
+        _readers[store_path] = reader
+    return reader
+
+
+def find_frames(path,file_prefix='fort',use_store=True):
+    r"""Return the sorted frame numbers found in the output directory path
+
+    Frames are found from the time files *file_prefix.tNNNN* written for
+    every frame in all of the output formats, or from the store of path if
+    *use_store* is set and it has one.
+    """
+    if use_store:
+        reader = _store_reader(path,file_prefix)
+        if reader is not None:
+            return sorted(reader.frames)
+    pattern = re.compile(r"^%s\.t(\d+)$" % re.escape(file_prefix))
+    frames = []
+    for file_name in os.listdir(path):
+        match = pattern.match(file_name)
+        if match is not None:
+            frames.append(int(match.group(1)))
+    return sorted(frames)
+
+
+def read_frame(frame,path,read_aux=False,file_format='ascii',
+                                         file_prefix='fort',use_store=True):
+    r"""Read in frame from path, or from its store if *use_store* is set"""
+    if use_store:
+        reader = _store_reader(path,file_prefix)
+        if reader is not None:
+            return reader.solution(frame,read_aux=read_aux)
+    return Solution(frame,path=path,read_aux=read_aux,file_format=file_format,
+                    file_prefix=file_prefix)
+
+
+def build_hovmoller(path,field_func,frames=None,x_stride=1,t_stride=1,
+                    out_path=None,num_threads=1,file_format='ascii',
+                    file_prefix='fort'):
+    r"""Accumulate a field of each frame into an x-t array
+
+    Each frame is read once and *field_func(solution)* is evaluated on it,
+    the result decimated to every *x_stride* cell is then written into its
+    row of the output array and the frame discarded.
+
+    :Input:
+     - *path* (path) - Output directory.
+     - *field_func* (func) - Function of a solution returning an array whose
+       last dimension is the grid, e.g. the layer surfaces (num_layers,mx).
+     - *frames* (list) - Frames to use, default is all frames found by
+       :func:`find_frames`.
+     - *x_stride* (int) - Keep every *x_stride* cell.
+     - *t_stride* (int) - Keep every *t_stride* frame.
+     - *out_path* (path) - If given the values are written to a memory mapped
+       .npy file at this path instead of being held in memory.
+     - *num_threads* (int) - Number of threads used to read frames.
+
+    :Output:
+     - (ndarray(num_frames)) - Time of each frame.
+     - (ndarray(mx / x_stride)) - Cell centers.
+     - (ndarray(num_frames,...,mx / x_stride)) - Field of each frame.
+    """
+    if frames is None:
+        frames = find_frames(path,file_prefix)
+    frames = list(frames)[::t_stride]
+    if len(frames) == 0:
+        raise IOError("No frames found in %s." % path)
+
+    # The first frame determines the shape of the output
+    solution = read_frame(frames[0],path,file_format=file_format,
+                          file_prefix=file_prefix)
+    x = solution.state.grid.dimensions[0].centers[::x_stride]
+    field = np.asarray(field_func(solution))[...,::x_stride]
+    shape = (len(frames),) + field.shape
+    if out_path is None:
+        values = np.empty(shape)
+    else:
+        values = np.lib.format.open_memmap(out_path,mode='w+',dtype=float,
+                                           shape=shape)
+    t = np.empty(len(frames))
+    values[0,...] = field
+    t[0] = solution.t
+
+    # Each frame writes its own row so frames can be read concurrently
+    def read_row(n):
+        solution = read_frame(frames[n],path,file_format=file_format,
+                              file_prefix=file_prefix)
+        values[n,...] = np.asarray(field_func(solution))[...,::x_stride]
+        t[n] = solution.t
+
+    rows = xrange(1,len(frames))
+    if num_threads > 1:
+        pool = ThreadPool(num_threads)
+        try:
+            chunksize = max(1,len(rows) // (4 * num_threads))
+            pool.map(read_row,rows,chunksize=chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for n in rows:
+            read_row(n)
+
+    if out_path is not None:
+        values.flush()
+    return t,x,values
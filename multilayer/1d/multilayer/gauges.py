@@ -0,0 +1,255 @@
+# encoding: utf-8
+
+r"""Virtual gauges recording time series at points of a one dimensional run
+
+A :class:`GaugeRecorder` samples the depth h, velocity u and surface eta of
+every layer and kappa of every interface at a set of locations every
+*interval* time steps.  The values at a gauge are linearly interpolated
+between the two cell centers around it with weights computed once when the
+recorder is opened.  Samples are collected in a fixed buffer of
+*buffer_size* records that is appended to *gauges.bin* in the output
+directory whenever it fills up and when the recorder is flushed.
+
+*gauges.bin* holds raw little endian doubles, one record per sample,
+described by *gauges.json*.  A record is
+
+    [t, h[num_layers,num_gauges], u[num_layers,num_gauges],
+        eta[num_layers,num_gauges], kappa[num_layers - 1,num_gauges]]
+
+in C order.  :func:`read_gauges` maps the file and returns the fields as
+arrays of shape (num_samples,...,num_gauges).
+
+:func:`multilayer.checkpoint.run` opens, attaches and flushes a recorder
+given to it and truncates the gauge file to the checkpoint's time on
+restart.  Under PetClaw each process interpolates the cells around the
+gauges that it owns, the sums over all processes give q and aux at the
+gauges and only the process of rank 0 writes the gauge files.
+
+:Available Routines:
+    - :class:`GaugeRecorder` - Record the gauges of a run
+    - :func:`recorder` - Recorder for the gauge options of the drivers
+    - :func:`read_gauges` - Read the gauges of an output directory
+"""
+
+import os
+import json
+
+import numpy as np
+
+from layers import get_layout,state_layout
+import parallel
+
+data_name = 'gauges.bin'
+header_name = 'gauges.json'
+fields = ['h','u','eta','kappa']
+
+def _field_shapes(num_layers,num_gauges):
+    r"""Shapes of the fields of a record, kappa is per interface"""
+    return [(num_layers,num_gauges),(num_layers,num_gauges),
+            (num_layers,num_gauges),(num_layers - 1,num_gauges)]
+
+
+class GaugeRecorder(object):
+    r"""Record h, u, eta and kappa at the locations *x*
+
+    :Input:
+     - *x* (list of float) - Gauge locations, each must lie within the grid.
+     - *interval* (int) - Number of time steps between samples.
+     - *buffer_size* (int) - Number of samples buffered between writes.
+    """
+
+    def __init__(self,x,interval=1,buffer_size=1024):
+        self.x = np.asarray(x,dtype=float)
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.path = None
+        self.comm = None
+        self._num_calls = 0
+        self._last_t = None
+
+    def open(self,outdir,solution,restart_time=None):
+        r"""Precompute the interpolation weights and open the gauge file
+
+        With *restart_time* the samples of an earlier run up to that time
+        are kept, otherwise the gauge file is started anew.  The count of
+        steps between samples starts again at the restart.
+        """
+        state = solution.state
+        layout = state_layout(state)
+        self.comm = parallel.communicator(state)
+        dimension = parallel.global_dimensions(state)[0]
+        centers = dimension.lower + (np.arange(dimension.num_cells) + 0.5) \
+                                                            * dimension.delta
+        if np.any(self.x < dimension.lower) or np.any(self.x > dimension.upper):
+            raise ValueError("Gauges %s are not all within [%s,%s]."
+                             % (self.x,dimension.lower,dimension.upper))
+
+        # Each gauge is interpolated between the global cells left and
+        # left + 1, gauges beyond the first or last center take the value of
+        # that cell
+        self._left = np.clip(np.searchsorted(centers,self.x) - 1,0,
+                             centers.shape[0] - 2)
+        weight = (self.x - centers[self._left]) / dimension.delta
+        self._weight = np.clip(weight,0.0,1.0)
+        self._offset = parallel.global_offset(state)[0]
+
+        num_gauges = self.x.shape[0]
+        self.num_layers = layout.num_layers
+        shapes = _field_shapes(self.num_layers,num_gauges)
+        self._sizes = [int(np.prod(shape)) for shape in shapes]
+        self.record_size = 1 + sum(self._sizes)
+        self._buffer = np.empty((self.buffer_size,self.record_size),dtype='<f8')
+        self._num_buffered = 0
+
+        self.path = outdir
+        self._last_t = None
+        self._num_calls = 0
+        if self._writes():
+            header = {'x':self.x.tolist(),'num_layers':self.num_layers,
+                      'interval':self.interval,'fields':fields,
+                      'shapes':[list(shape) for shape in shapes],
+                      'record_size':self.record_size,'dtype':'<f8'}
+            with open(os.path.join(outdir,header_name),'w') as header_file:
+                json.dump(header,header_file,indent=1)
+
+            data_path = os.path.join(outdir,data_name)
+            if restart_time is not None and os.path.exists(data_path):
+                t = np.fromfile(data_path,dtype='<f8')
+                num_records = t.shape[0] // self.record_size
+                t = t[:num_records * self.record_size:self.record_size]
+                num_kept = np.count_nonzero(t <= restart_time)
+                with open(data_path,'r+b') as data_file:
+                    data_file.truncate(num_kept * self.record_size * 8)
+                if num_kept > 0:
+                    self._last_t = t[num_kept - 1]
+            else:
+                open(data_path,'wb').close()
+        # Every process skips the same retaken steps
+        if self.comm is not None:
+            self._last_t = self.comm.bcast(self._last_t,root=0)
+
+    def _writes(self):
+        r"""Whether this process writes the gauge files"""
+        return self.comm is None or self.comm.rank == 0
+
+    def attach(self,solver):
+        r"""Sample the state after every call of *solver.before_step*"""
+        before_step = solver.before_step
+
+        def gauged_before_step(solver,state):
+            if before_step is not None:
+                before_step(solver,state)
+            self(state)
+
+        solver.before_step = gauged_before_step
+
+    def __call__(self,state):
+        r"""Record a sample every *interval* steps"""
+        # Retaken steps sample the same time again
+        if self._last_t is not None and state.t <= self._last_t:
+            return
+        self._num_calls += 1
+        if (self._num_calls - 1) % self.interval == 0:
+            self.sample(state)
+
+    def _interpolate(self,array):
+        r"""Interpolate the local cells of array to the gauges
+
+        Cells owned by other processes are left out, their part of the
+        interpolated values is added by the sum over all processes.
+        """
+        result = np.zeros(array.shape[:-1] + self.x.shape)
+        for (cells,weight) in ((self._left,1.0 - self._weight),
+                               (self._left + 1,self._weight)):
+            local = cells - self._offset
+            owned = (local >= 0) * (local < array.shape[-1])
+            result[...,owned] += array[...,local[owned]] * weight[owned]
+        return result
+
+    def values(self,q,aux,rho,dry_tolerance=1e-3):
+        r"""Interpolate q and aux to the gauges and compute the fields
+
+        Returns the flattened record without the time.
+        """
+        layout = get_layout(self.num_layers)
+        q_gauge = self._interpolate(q)
+        aux_gauge = self._interpolate(aux)
+        if self.comm is not None:
+            gauge = parallel.global_sum(self.comm,
+                                        np.concatenate((q_gauge,aux_gauge)))
+            q_gauge = gauge[:q.shape[0]]
+            aux_gauge = gauge[q.shape[0]:]
+
+        depth = layout.depth(q_gauge)
+        h = depth / layout.density_column(rho)
+        u = np.zeros(h.shape)
+        np.divide(layout.momentum(q_gauge),depth,out=u,
+                  where=h > dry_tolerance)
+        eta = layout.surfaces(q_gauge,layout.bathy(aux_gauge),rho)
+        kappa = layout.kappa(aux_gauge)
+        return np.concatenate((h.ravel(),u.ravel(),eta.ravel(),kappa.ravel()))
+
+    def sample(self,state):
+        r"""Add a sample of state to the buffer, writing it out when full"""
+        record = self._buffer[self._num_buffered]
+        record[0] = state.t
+        record[1:] = self.values(state.q,state.aux,state.problem_data['rho'],
+                                 state.problem_data.get('dry_tolerance',1e-3))
+        self._num_buffered += 1
+        self._last_t = state.t
+        if self._num_buffered == self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        r"""Append the buffered samples to the gauge file"""
+        if self._num_buffered > 0:
+            if self._writes():
+                with open(os.path.join(self.path,data_name),'ab') as data_file:
+                    self._buffer[:self._num_buffered].tofile(data_file)
+            self._num_buffered = 0
+
+    def finish(self,state):
+        r"""Record the final state and write out the buffer"""
+        if self._last_t is None or state.t > self._last_t:
+            self.sample(state)
+        self.flush()
+
+
+def recorder(x=None,interval=1,**kargs):
+    r"""Return a :class:`GaugeRecorder` for the locations x, None if not given
+
+    Used for the drivers by :func:`multilayer.checkpoint.run_driver`.
+    """
+    if x is None or len(x) == 0:
+        return None
+    return GaugeRecorder(x,interval=interval,**kargs)
+
+
+def read_gauges(path):
+    r"""Read the gauges recorded in the output directory path
+
+    :Output:
+     - (dict) - *t* (ndarray(num_samples)), *x* (ndarray(num_gauges)) and
+       each of *h*, *u*, *eta* (ndarray(num_samples,num_layers,num_gauges))
+       and *kappa* (ndarray(num_samples,num_layers - 1,num_gauges)), views
+       of a memory map of the gauge file.
+    """
+    with open(os.path.join(path,header_name),'r') as header_file:
+        header = json.load(header_file)
+    data_path = os.path.join(path,data_name)
+    record_size = header['record_size']
+    num_records = os.path.getsize(data_path) // (8 * record_size)
+    gauges = {'x':np.array(header['x'])}
+    if num_records == 0:
+        data = np.zeros((0,record_size))
+    else:
+        data = np.memmap(data_path,dtype=header['dtype'],mode='r',
+                         shape=(num_records,record_size))
+    gauges['t'] = data[:,0]
+    start = 1
+    for (name,shape) in zip(header['fields'],header['shapes']):
+        size = int(np.prod(shape))
+        gauges[name] = data[:,start:start + size].reshape(
+                                                (data.shape[0],) + tuple(shape))
+        start += size
+    return gauges
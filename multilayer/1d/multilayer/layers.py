@@ -0,0 +1,142 @@
+# encoding: utf-8
+
+r"""Layout of the q and aux arrays for an arbitrary number of layers
+
+For *num_layers* layers the arrays are ordered as
+
+    q   = [h_1 rho_1, h_1 u_1 rho_1, ..., h_N rho_N, h_N u_N rho_N]
+    aux = [b, wind, h_hat_1, ..., h_hat_N, kappa_1, ..., kappa_{N-1}]
+
+where kappa_k is the composite Froude number across the interface between
+layers k and k+1.  For two layers this reproduces the indices found in
+:mod:`multilayer.aux`.  In two dimensions each layer also carries the
+momentum h v rho following h u rho so that each layer has *num_dim + 1*
+entries in q.
+
+All of the accessors return views into the arrays passed in so they can be
+used to read and write whole groups of rows without copying.
+"""
+
+import numpy as np
+
+class LayerLayout(object):
+    r"""Index maps and views for the q and aux arrays of a layered state
+
+    :Input:
+     - *num_layers* (int) - Number of layers, must be at least 1.
+     - *num_dim* (int) - Number of spatial dimensions, default is 1.
+    """
+
+    bathy_index = 0
+    wind_index = 1
+
+    def __init__(self,num_layers,num_dim=1):
+        if num_layers < 1:
+            raise ValueError("Number of layers must be positive, got %s."
+                                                                % num_layers)
+        self.num_layers = num_layers
+        self.num_dim = num_dim
+        self.stride = num_dim + 1
+        self.num_eqn = self.stride * num_layers
+        self.num_aux = 2 * num_layers + 1
+
+        self.depth_index = range(0,self.num_eqn,self.stride)
+        self.momentum_index = range(1,self.num_eqn,self.stride)
+        self.h_hat_index = range(2,2 + num_layers)
+        self.kappa_index = range(2 + num_layers,self.num_aux)
+
+    def __repr__(self):
+        return "LayerLayout(%s,num_dim=%s)" % (self.num_layers,self.num_dim)
+
+    # q array views
+    def depth_rows(self):
+        r"""Return the slice selecting the depth rows of q"""
+        return slice(0,self.num_eqn,self.stride)
+
+    def momentum_rows(self,direction=0):
+        r"""Return the slice selecting the momentum rows in *direction*"""
+        return slice(1 + direction,self.num_eqn,self.stride)
+
+    def depth(self,q,layer=None):
+        r"""Return the rho weighted depths of all layers or just *layer*"""
+        if layer is None:
+            return q[self.depth_rows(),...]
+        return q[self.depth_index[layer],...]
+
+    def momentum(self,q,layer=None,direction=0):
+        r"""Return the rho weighted momenta of all layers or just *layer*
+
+        *direction* selects the x (0) or y (1) momentum.
+        """
+        if layer is None:
+            return q[self.momentum_rows(direction),...]
+        return q[self.depth_index[layer] + 1 + direction,...]
+
+    # aux array views
+    def bathy(self,aux):
+        r"""Return the bathymetry"""
+        return aux[self.bathy_index,...]
+
+    def wind(self,aux):
+        r"""Return the wind field"""
+        return aux[self.wind_index,...]
+
+    def h_hat(self,aux,layer=None):
+        r"""Return the linearized depths of all layers or just *layer*"""
+        if layer is None:
+            return aux[self.h_hat_index[0]:self.h_hat_index[-1] + 1,...]
+        return aux[self.h_hat_index[layer],...]
+
+    def kappa(self,aux,interface=None):
+        r"""Return kappa for all interfaces or just *interface*
+
+        Interface k lies between layers k and k+1.
+        """
+        if interface is None:
+            return aux[2 + self.num_layers:self.num_aux,...]
+        return aux[self.kappa_index[interface],...]
+
+    def surfaces(self,q,bathy,rho):
+        r"""Return the surfaces of all layers from the top down
+
+        The surface of each layer is its depth added to the surface of the
+        layer below it, the bottom layer sitting on *bathy*.
+        """
+        h = self.depth(q) / self.density_column(rho,q.ndim - 1)
+        eta = np.empty(h.shape)
+        eta[-1,...] = h[-1,...] + bathy
+        for layer in xrange(self.num_layers - 2,-1,-1):
+            eta[layer,...] = h[layer,...] + eta[layer + 1,...]
+        return eta
+
+    # Physical parameters
+    def density_column(self,rho,ndim=1):
+        r"""Return the densities as a column broadcastable against a view
+
+        *ndim* is the number of axes of the view following the layer axis,
+        e.g. 2 for the (member,x) views of an ensemble.
+        """
+        return np.asarray(rho,dtype=float).reshape((self.num_layers,)
+                                                   + (1,) * ndim)
+
+    def one_minus_r(self,rho):
+        r"""Return 1 - rho_k / rho_{k+1} for each interface as a column"""
+        rho = np.asarray(rho,dtype=float)
+        if rho.ndim < 2:
+            rho = self.density_column(rho)
+        return 1.0 - rho[:-1] / rho[1:]
+
+
+_layouts = {}
+
+def get_layout(num_layers,num_dim=1):
+    r"""Return the (cached) :class:`LayerLayout` for *num_layers*"""
+    if (num_layers,num_dim) not in _layouts:
+        _layouts[num_layers,num_dim] = LayerLayout(num_layers,num_dim)
+    return _layouts[num_layers,num_dim]
+
+
+def state_layout(state):
+    r"""Return the :class:`LayerLayout` matching *state*"""
+    return get_layout(state.problem_data['num_layers'],
+                      len(state.grid.dimensions))
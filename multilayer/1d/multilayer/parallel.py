@@ -0,0 +1,109 @@
+# encoding: utf-8
+
+r"""Helpers for running the multilayer callbacks under domain decomposition
+
+With PetClaw each process only holds the part of the grid it owns.  These
+routines find the position of the local grid in the global one, whether a
+process owns a physical boundary and perform the global reductions needed by
+:func:`multilayer.step.before_step`.  For serial PyClaw states there is no
+communicator and all of the routines reduce to their local versions, mpi4py
+is only imported when a PetClaw state is encountered.
+"""
+
+import numpy as np
+
+def communicator(state):
+    r"""Return the MPI communicator of a PetClaw state or None if serial"""
+    if not hasattr(state,'q_da'):
+        return None
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+    if comm.size == 1:
+        return None
+    return comm
+
+
+def on_boundary(state,axis,lower):
+    r"""Check whether the local grid of state touches a physical boundary
+
+    *axis* is the index of the dimension and *lower* selects the lower or
+    upper boundary.  Serial grids always own both boundaries.
+    """
+    name = 'on_lower_boundary' if lower else 'on_upper_boundary'
+    flag = getattr(state.grid.dimensions[axis],name,None)
+    if flag is None:
+        flag = getattr(state.grid,name,None)
+        if flag is not None and not np.isscalar(flag):
+            flag = flag[axis]
+    if flag is None:
+        return True
+    return bool(flag)
+
+
+def global_dimensions(state):
+    r"""Return the dimensions of the global grid"""
+    patch = getattr(state,'patch',None)
+    if patch is None:
+        return state.grid.dimensions
+    return patch.dimensions
+
+
+def global_shape(state):
+    r"""Return the number of cells in each dimension of the global grid"""
+    return tuple(dimension.num_cells for dimension in global_dimensions(state))
+
+
+def global_offset(state):
+    r"""Return the global index of the first local cell in each dimension"""
+    offset = []
+    for (local,dimension) in zip(state.grid.dimensions,
+                                 global_dimensions(state)):
+        start = getattr(local,'nstart',None)
+        if start is None:
+            start = int(round((local.lower - dimension.lower) / local.delta))
+        offset.append(start)
+    return tuple(offset)
+
+
+def global_cell_index(state,index):
+    r"""Convert flat local cell indices into flat global cell indices
+
+    Indices are flattened in C order over the local and global grids, in one
+    dimension this is just a shift by the offset of the local grid.  Axes of
+    q in front of the grid's, e.g. the members of an ensemble, are kept in
+    the flattened indices without a shift.
+    """
+    local_shape = tuple(dimension.num_cells
+                                for dimension in state.grid.dimensions)
+    extra_shape = state.q.shape[1:state.q.ndim - len(local_shape)]
+    local = np.unravel_index(index,extra_shape + local_shape)
+    offset = (0,) * len(extra_shape) + global_offset(state)
+    shifted = [local_index + start
+                    for (local_index,start) in zip(local,offset)]
+    return np.ravel_multi_index(shifted,extra_shape + global_shape(state))
+
+
+def global_sum(comm,values):
+    r"""Sum the array values over all processes"""
+    values = np.asarray(values)
+    if comm is None:
+        return values
+    from mpi4py import MPI
+    result = np.empty_like(values)
+    comm.Allreduce(values,result,op=MPI.SUM)
+    return result
+
+
+def global_max_location(comm,value,index):
+    r"""Return the global maximum of value and the index where it occurs"""
+    if comm is None:
+        return value,index
+    from mpi4py import MPI
+    return comm.allreduce((value,index),op=MPI.MAX)
+
+
+def global_concatenate(comm,values):
+    r"""Concatenate the arrays values of all processes in rank order"""
+    if comm is None:
+        return values
+    return np.concatenate(comm.allgather(values))
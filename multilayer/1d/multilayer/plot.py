@@ -1,9 +1,16 @@
 # encoding: utf-8
 
-r"""Plotting constants"""
+r"""Plotting constants and derived fields shared by the setplot modules"""
 
+import collections
+
+import numpy as np
 import matplotlib.pyplot as plt
 
+from clawpack.pyclaw.solution import Solution
+
+from layers import get_layout
+
 
 # Color and linestyles
 rgb_converter = lambda triple: [float(rgb) / 255.0 for rgb in triple]
@@ -27,3 +34,105 @@ def add_legend(axes,label,location=0,color='r',linestyle='-'):
     
     # Add legend to axes
     axes.legend(handles,labels,loc=location)
+
+
+class FrameFields(object):
+    r"""Per frame cache of the fields derived from q and aux for plotting
+
+    The depths, surfaces, velocities and momenta of every layer are computed
+    once per frame the first time any of them is requested and are then
+    shared by all of the plot items of that frame.  kappa and the wind need
+    the aux array which is taken from the current data if available and
+    otherwise read once per frame.  Frames are keyed on the output directory
+    and frame number and the *max_frames* most recently used are kept.
+
+    :Input:
+     - *plotdata* (ClawPlotData) - Plot data whose *outdir* is used.
+     - *rho* (list) - Densities of the layers.
+     - *dry_tolerance* (float) - Depth below which velocities are zero.
+     - *max_frames* (int) - Number of frames kept, default is 2.
+    """
+
+    def __init__(self,plotdata,rho,dry_tolerance,max_frames=2):
+        self.plotdata = plotdata
+        self.layout = get_layout(len(rho))
+        self.rho = self.layout.density_column(rho)
+        self.dry_tolerance = dry_tolerance
+        self.max_frames = max_frames
+        self.num_reads = 0
+        self._frames = collections.OrderedDict()
+        self._bathy = {}
+
+    def _entry(self,frameno):
+        r"""Return the cache entry of frameno, marking it most recently used"""
+        key = (self.plotdata.outdir,frameno)
+        entry = self._frames.pop(key,{})
+        self._frames[key] = entry
+        while len(self._frames) > self.max_frames:
+            self._frames.popitem(last=False)
+        return entry
+
+    def _read_aux(self,frameno):
+        self.num_reads += 1
+        return Solution(frameno,path=self.plotdata.outdir,
+                        read_aux=True).state.aux
+
+    def _fields(self,cd):
+        r"""Return the entry of the frame in cd with the q derived fields"""
+        entry = self._entry(cd.frameno)
+        if entry.get('q') is not cd.q:
+            # Keep an aux array that was read before q was seen
+            aux = entry.get('aux') if 'q' not in entry else None
+            entry.clear()
+            if aux is not None:
+                entry['aux'] = aux
+
+            layout = self.layout
+            h = layout.depth(cd.q) / self.rho
+            wet = h > self.dry_tolerance
+            u = np.zeros(h.shape)
+            np.divide(layout.momentum(cd.q),layout.depth(cd.q),out=u,
+                      where=wet)
+            hu = np.zeros(h.shape)
+            np.divide(layout.momentum(cd.q),self.rho,out=hu,where=wet)
+            eta = layout.surfaces(cd.q,self.bathy(cd),self.rho)
+
+            entry.update({'q':cd.q,'h':h,'u':u,'hu':hu,'eta':eta})
+        return entry
+
+    def _aux(self,cd):
+        entry = self._fields(cd)
+        if 'aux' not in entry:
+            aux = getattr(cd,'aux',None)
+            if aux is None:
+                aux = self._read_aux(cd.frameno)
+            entry['aux'] = aux
+        return entry['aux']
+
+    def bathy(self,cd=None):
+        r"""Bathymetry, read once from the first frame"""
+        outdir = self.plotdata.outdir
+        if outdir not in self._bathy:
+            entry = self._entry(0)
+            if 'aux' not in entry:
+                entry['aux'] = self._read_aux(0)
+            self._bathy[outdir] = self.layout.bathy(entry['aux'])
+        return self._bathy[outdir]
+
+    def h(self,cd,layer):
+        return self._fields(cd)['h'][layer]
+
+    def eta(self,cd,layer):
+        return self._fields(cd)['eta'][layer]
+
+    def u(self,cd,layer):
+        return self._fields(cd)['u'][layer]
+
+    def hu(self,cd,layer):
+        return self._fields(cd)['hu'][layer]
+
+    def kappa(self,cd,interface=0):
+        return self.layout.kappa(self._aux(cd),interface)
+
+    def wind(self,cd):
+        return self.layout.wind(self._aux(cd))
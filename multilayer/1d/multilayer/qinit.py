@@ -6,8 +6,7 @@ Functions for intializing q
 
 import numpy as np
 
-# Get locations in the aux array of pertinent quantities
-from aux import kappa_index,h_hat_index
+from layers import state_layout
 
 def set_riemann_init_condition(state,jump_location,q_left,q_right):
     r"""Set a Riemann type initial condition"""
@@ -25,10 +24,10 @@ def set_quiescent_init_condition(state):
     
     This assumes that you have already set the h hat values and the densities.
     """
-    state.q[0,:] = state.aux[h_hat_index[0],:] * state.problem_data['rho'][0]
-    state.q[1,:] = np.zeros((state.grid.dimensions[0].num_cells))
-    state.q[2,:] = state.aux[h_hat_index[1],:] * state.problem_data['rho'][1]
-    state.q[3,:] = np.zeros((state.grid.dimensions[0].num_cells))
+    layout = state_layout(state)
+    rho = layout.density_column(state.problem_data['rho'],state.q.ndim - 1)
+    layout.depth(state.q)[...] = layout.h_hat(state.aux) * rho
+    layout.momentum(state.q)[...] = 0.0
 
     
 
@@ -38,58 +37,62 @@ def set_wave_family_init_condition(state,wave_family,jump_location,epsilon):
     # Set stationary initial state, perturb off of that
     set_quiescent_init_condition(state)
     
+    if wave_family not in (1,2,3,4):
+        raise Exception("Unsupported wave family %s requested!" % wave_family)
+
+    layout = state_layout(state)
+    if layout.num_layers != 2:
+        raise ValueError("Wave family initial conditions require two layers.")
+
     r = state.problem_data['r']
     rho = state.problem_data['rho']
     g = state.problem_data['g']
+    x = state.grid.dimensions[0].centers
 
-    for (i,x) in enumerate(state.grid.dimensions[0].centers):
-        gamma = state.aux[h_hat_index[1],i] / state.aux[h_hat_index[0],i]
-        if wave_family == 1:
-            alpha = 0.5 * (gamma - 1.0 + np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma))
-            eig_value = -np.sqrt(g * state.aux[h_hat_index[0],i] * (1.0 + alpha))
-        elif wave_family == 2:
-            alpha = 0.5 * (gamma - 1.0 - np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma))
-            eig_value = -np.sqrt(g * state.aux[h_hat_index[0],i] * (1.0 + alpha))
-        elif wave_family == 3:
-            alpha = 0.5 * (gamma - 1.0 - np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma))
-            eig_value = np.sqrt(g * state.aux[h_hat_index[0],i] * (1.0 + alpha))
-        elif wave_family == 4:
-            alpha = 0.5 * (gamma - 1.0 + np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma))
-            eig_value = np.sqrt(g * state.aux[h_hat_index[0],i] * (1.0 + alpha))
-        else:
-            raise Exception("Unsupported wave family %s requested!" % wave_family)
-            
-        if x < jump_location and wave_family >= 3:
-            state.q[0,i] += rho[0] * epsilon
-            state.q[1,i] += rho[0] * epsilon * eig_value
-            state.q[2,i] += rho[1] * epsilon * alpha
-            state.q[3,i] += rho[1] * epsilon * eig_value * alpha
-        elif x >= jump_location and wave_family < 3:
-            state.q[0,i] += rho[0] * epsilon
-            state.q[1,i] += rho[0] * epsilon * eig_value
-            state.q[2,i] += rho[1] * epsilon * alpha
-            state.q[3,i] += rho[1] * epsilon * eig_value * alpha
+    # Only perturb on one side of the jump, families 3 and 4 are right going,
+    # the mask selects along the last axis so ensembles are perturbed too
+    if wave_family >= 3:
+        index = (Ellipsis,x < jump_location)
+    else:
+        index = (Ellipsis,x >= jump_location)
+
+    h_hat = [layout.h_hat(state.aux,0)[index],layout.h_hat(state.aux,1)[index]]
+    gamma = h_hat[1] / h_hat[0]
+    if wave_family == 1 or wave_family == 4:
+        alpha = 0.5 * (gamma - 1.0 + np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma))
+    else:
+        alpha = 0.5 * (gamma - 1.0 - np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma))
+    eig_value = np.sqrt(g * h_hat[0] * (1.0 + alpha))
+    if wave_family < 3:
+        eig_value = -eig_value
+
+    layout.depth(state.q,0)[index] += rho[0] * epsilon
+    layout.momentum(state.q,0)[index] += rho[0] * epsilon * eig_value
+    layout.depth(state.q,1)[index] += rho[1] * epsilon * alpha
+    layout.momentum(state.q,1)[index] += rho[1] * epsilon * eig_value * alpha
 
 
 def set_gaussian_init_condition(state,A,location,sigma,internal_layer=True):
     """Set initial condition to a gaussian hump of water
     
     Sets the condition for what should act like a shallow water wave.  If a
-    gaussian on only the interal layer is desired set internal_only = True
+    gaussian on only the interal layer is desired set internal_only = True,
+    in which case the interface between the top two layers is displaced.
     """
     
     # Set stationary initial state, perturb off of that
     set_quiescent_init_condition(state)
     
+    layout = state_layout(state)
     rho = state.problem_data['rho']
     x = state.grid.dimensions[0].centers
 
     d_eta = A * np.exp(-((x - location) / sigma)**2)
     if internal_layer:
-        state.q[0,:] -= rho[0] * d_eta
-        state.q[2,:] += rho[1] * d_eta
+        layout.depth(state.q,0)[...] -= rho[0] * d_eta
+        layout.depth(state.q,1)[...] += rho[1] * d_eta
     else:
-        state.q[0,:] += rho[0] * d_eta
+        layout.depth(state.q,0)[...] += rho[0] * d_eta
     
 
 def set_acta_numerica_init_condition(state,epsilon):
@@ -103,13 +106,14 @@ def set_acta_numerica_init_condition(state,epsilon):
     # Set stationary initial state, perturb off of that
     set_quiescent_init_condition(state)
 
+    layout = state_layout(state)
     rho = state.problem_data['rho']
     x = state.grid.dimensions[0].centers
     
-    gamma = state.aux[h_hat_index[1],:] / state.aux[h_hat_index[0],:]
+    gamma = layout.h_hat(state.aux,1) / layout.h_hat(state.aux,0)
     alpha = 0.0
     xmid = 0.5 * (-180e3 - 80e3)
     
     deta = epsilon * np.sin((x-xmid) * np.pi / (-80e3 - xmid))
-    state.q[2,:] += (x > -130e3) * (x < -80e3) * rho[1] * alpha * deta
-    state.q[0,:] += (x > -130e3) * (x < -80e3) * rho[0] * deta * (1.0 - alpha)
+    layout.depth(state.q,1)[...] += (x > -130e3) * (x < -80e3) * rho[1] * alpha * deta
+    layout.depth(state.q,0)[...] += (x > -130e3) * (x < -80e3) * rho[0] * deta * (1.0 - alpha)
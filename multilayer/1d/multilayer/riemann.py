@@ -0,0 +1,355 @@
+# encoding: utf-8
+
+r"""
+Pure NumPy f-wave Riemann solver for the two layer shallow water equations
+
+This is a Python kernel alternative to the Fortran *layered_shallow_water_1D*
+solver that works on all of the interfaces of a grid at once.  To use it set
+
+    solver.kernel_language = 'Python'
+    solver.rp = multilayer.riemann.layered_shallow_water_1D
+
+The solver uses the same *problem_data* entries as the Fortran solver:
+
+ - *eigen_method* - Eigenspace used to decompose the flux differences
+    1. Linearized eigenspace using the static depths stored in h_hat
+    2. Linearized eigenspace using the current depths and mean velocity
+    3. Velocity difference approximation of the eigenvalues
+    4. Full eigen decomposition via LAPACK (batched *numpy.linalg.eig*)
+    5. Hybrid, method 2 everywhere except at interfaces where kappa on
+       either side is above *hybrid_fraction* times *richardson_tolerance*
+       where method 4 is used (see :func:`expensive_interfaces`)
+ - *inundation_method* - Treatment of a layer that is dry on one side only
+    1. The eigenspace is computed from the wet side of the partially dry
+       layer
+    2. The eigenspace is computed from the average of both sides with the
+       dry depth taken as zero, any other value is treated the same way
+ - *dry_tolerance*, *g*, *rho* and *r*
+ - *richardson_tolerance* and *hybrid_fraction* (optional, default 0.95 and
+   0.25) - Threshold on kappa used by the hybrid method
+
+Interfaces where a layer is dry on both sides reduce to the single layer
+equations for the other layer.  Where the bottom layer is dry on one side and
+the bathymetry on that side is above the internal surface of the wet side the
+bottom layer sees a reflecting wall.  Where the eigen decomposition of methods 3
+and 4 loses hyperbolicity (complex eigenvalues) the eigenspace of method 2
+is used instead.  The entropy fix is not implemented for this solver, the
+drivers check their options with :func:`check_options` before a run.
+
+Method 1 does not account for the current flow speeds and is not suitable for
+problems with dry states, method 3 or 4 should be preferred there.
+"""
+
+import numpy as np
+
+from layers import get_layout
+
+num_eqn = 4
+num_waves = 4
+
+# Layout of q and aux of the two layers this solver handles
+layout = get_layout(2)
+
+# Eigen method only available in this solver
+HYBRID = 5
+
+# ==========================================================================
+#  Eigenspace computations, each returns the speeds s[num_rp,num_waves] and
+#  eigenvectors R[num_rp,num_eqn,num_waves] in the non-density weighted
+#  variables (h_1, h_1 u_1, h_2, h_2 u_2) ordered by increasing speed.
+# ==========================================================================
+def _eigenvectors(s,alpha):
+    r"""Build eigenvectors (1, s, alpha, alpha s) for each speed s"""
+    R = np.empty(s.shape[:1] + (num_eqn,num_waves))
+    R[:,0,:] = 1.0
+    R[:,1,:] = s
+    R[:,2,:] = alpha
+    R[:,3,:] = alpha * s
+    return R
+
+
+def linearized_eigen(h,r,g,u=None):
+    r"""Eigenspace linearized about a uniform flow with depths h[2,num_rp]
+
+    If velocities u[2,num_rp] are given the state is linearized about the
+    depth weighted mean velocity of the layers, otherwise about a state at
+    rest.
+    """
+    gamma = h[1] / h[0]
+    root = np.sqrt((gamma - 1.0)**2 + 4.0 * r * gamma)
+    alpha_external = 0.5 * (gamma - 1.0 + root)
+    alpha_internal = 0.5 * (gamma - 1.0 - root)
+    c_external = np.sqrt(g * h[0] * (1.0 + alpha_external))
+    c_internal = np.sqrt(np.maximum(g * h[0] * (1.0 + alpha_internal),0.0))
+
+    s = np.column_stack((-c_external,-c_internal,c_internal,c_external))
+    if u is not None:
+        s += ((h[0] * u[0] + h[1] * u[1]) / (h[0] + h[1]))[:,np.newaxis]
+    alpha = np.column_stack((alpha_external,alpha_internal,
+                             alpha_internal,alpha_external))
+    return s,_eigenvectors(s,alpha)
+
+
+def velocity_difference_eigen(h,u,r,g):
+    r"""Eigenspace based on the velocity difference approximation
+
+    Returns the eigenspace and a mask of the interfaces where the internal
+    eigenvalues are complex.
+    """
+    total_depth = h[0] + h[1]
+    one_minus_r = 1.0 - r
+    u_mean = (h[0] * u[0] + h[1] * u[1]) / total_depth
+    u_cross = (h[0] * u[1] + h[1] * u[0]) / total_depth
+    c_external = np.sqrt(g * total_depth)
+    internal = g * one_minus_r * h[0] * h[1] / total_depth \
+                * (1.0 - (u[0] - u[1])**2 / (g * one_minus_r * total_depth))
+    complex_mask = internal <= 0.0
+    c_internal = np.sqrt(np.maximum(internal,0.0))
+
+    s = np.column_stack((u_mean - c_external,u_cross - c_internal,
+                         u_cross + c_internal,u_mean + c_external))
+    alpha = ((s - u[0][:,np.newaxis])**2 - g * h[0][:,np.newaxis]) \
+                                            / (g * h[0][:,np.newaxis])
+    return s,_eigenvectors(s,alpha),complex_mask
+
+
+def lapack_eigen(h,u,r,g):
+    r"""Eigenspace from the eigen decomposition of the quasi-linear matrix
+
+    Returns the eigenspace and a mask of the interfaces where the
+    eigenvalues are complex.
+    """
+    A = np.zeros((h.shape[1],num_eqn,num_eqn))
+    A[:,0,1] = 1.0
+    A[:,1,0] = g * h[0] - u[0]**2
+    A[:,1,1] = 2.0 * u[0]
+    A[:,1,2] = g * h[0]
+    A[:,2,3] = 1.0
+    A[:,3,0] = r * g * h[1]
+    A[:,3,2] = g * h[1] - u[1]**2
+    A[:,3,3] = 2.0 * u[1]
+
+    s,R = np.linalg.eig(A)
+    complex_mask = np.any(np.abs(s.imag) > 0.0,axis=1)
+    s = s.real
+    R = R.real
+
+    # Sort by increasing speed
+    order = np.argsort(s,axis=1)
+    rows = np.arange(s.shape[0])[:,np.newaxis]
+    s = s[rows,order]
+    R = R[rows,:,order].transpose(0,2,1)
+    return s,R,complex_mask
+
+
+def expensive_interfaces(kappa_l,kappa_r,problem_data):
+    r"""Mask of the interfaces where the hybrid method uses LAPACK
+
+    An interface is considered at risk of losing hyperbolicity if kappa on
+    either side is above *hybrid_fraction* times *richardson_tolerance*.
+    """
+    threshold = problem_data.get('hybrid_fraction',0.25) \
+                    * problem_data.get('richardson_tolerance',0.95)
+    return np.maximum(kappa_l,kappa_r) > threshold
+
+
+def two_layer_interfaces(h_l,h_r,dry_tolerance):
+    r"""Mask of the interfaces treated with the two layer eigenspace
+
+    These are the interfaces where each layer is wet on at least one side.
+    """
+    return np.all(np.logical_or(h_l >= dry_tolerance,h_r >= dry_tolerance),
+                  axis=0)
+
+
+def _single_layer(s,R,index,layer,h,u,g):
+    r"""Set a single layer eigenspace for layer, holding the other fixed
+
+    The moving layer gets the shallow water speeds in waves 1 and 4 while
+    the other, dry, layer's mass and momentum are taken by stationary waves
+    2 and 3.
+    """
+    other = 1 - layer
+    c = np.sqrt(g * h)
+    s[index,0] = u - c
+    s[index,1] = 0.0
+    s[index,2] = 0.0
+    s[index,3] = u + c
+    R[index,...] = 0.0
+    R[index,2*layer,0] = 1.0
+    R[index,2*layer+1,0] = s[index,0]
+    R[index,2*layer,3] = 1.0
+    R[index,2*layer+1,3] = s[index,3]
+    R[index,2*other,1] = 1.0
+    R[index,2*other+1,2] = 1.0
+
+
+# ==========================================================================
+#  Riemann solver
+# ==========================================================================
+def check_options(kernel_language,eigen_method,entropy_fix=False):
+    r"""Raise a ValueError if the Riemann solver options can not be combined
+
+    Called by the drivers when setting up the solver so that a run does not
+    stop at its first step.  The hybrid eigen method is only available in
+    this solver which has no entropy fix.
+    """
+    if eigen_method == HYBRID:
+        if kernel_language != 'Python':
+            raise ValueError("The hybrid eigen method is only available in "
+                             "the Python Riemann solver, set kernel_language "
+                             "to 'Python'.")
+        if entropy_fix:
+            raise ValueError("The hybrid eigen method uses the Python Riemann "
+                             "solver which has no entropy fix, turn off "
+                             "entropy_fix or use another eigen method.")
+    if kernel_language == 'Python' and entropy_fix:
+        raise ValueError("The entropy fix is only available in the Fortran "
+                         "Riemann solver, set kernel_language to 'Fortran' "
+                         "or turn off entropy_fix.")
+
+
+def layered_shallow_water_1D(q_l,q_r,aux_l,aux_r,problem_data):
+    r"""Two layer shallow water f-wave Riemann solver
+
+    *q_l* and *q_r* are the states to the left and right of each interface
+    with shape (num_eqn,num_rp), *aux_l* and *aux_r* the corresponding aux
+    values.
+
+    :Output:
+     - *fwave* (ndarray(num_eqn,num_waves,num_rp)) - f-waves
+     - *s* (ndarray(num_waves,num_rp)) - Wave speeds
+     - *amdq* (ndarray(num_eqn,num_rp)) - Left going fluctuations
+     - *apdq* (ndarray(num_eqn,num_rp)) - Right going fluctuations
+    """
+
+    if problem_data.get('entropy_fix',False):
+        raise NotImplementedError("The entropy fix is not implemented in "
+                                  "the Python layered Riemann solver.")
+
+    g = problem_data['g']
+    r = problem_data['r']
+    rho = np.asarray(problem_data['rho'],dtype=float)[:,np.newaxis]
+    dry_tolerance = problem_data['dry_tolerance']
+    eigen_method = problem_data['eigen_method']
+    inundation_method = problem_data['inundation_method']
+    num_rp = q_l.shape[1]
+
+    # Primitive variables, velocities are zero in dry cells
+    h_l = q_l[0::2,:] / rho
+    h_r = q_r[0::2,:] / rho
+    dry_l = h_l < dry_tolerance
+    dry_r = h_r < dry_tolerance
+    u_l = np.zeros(h_l.shape)
+    u_r = np.zeros(h_r.shape)
+    np.divide(q_l[1::2,:],q_l[0::2,:],out=u_l,where=np.logical_not(dry_l))
+    np.divide(q_r[1::2,:],q_r[0::2,:],out=u_r,where=np.logical_not(dry_r))
+    b_l = layout.bathy(aux_l)
+    b_r = layout.bathy(aux_r)
+
+    # Flux differences and the non-conservative products
+    h_bar = 0.5 * (h_l + h_r)
+    delta = np.empty((num_eqn,num_rp))
+    delta[0::2,:] = q_r[1::2,:] - q_l[1::2,:]
+    delta[1::2,:] = q_r[1::2,:] * u_r + 0.5 * g * rho * h_r**2 \
+                  - q_l[1::2,:] * u_l - 0.5 * g * rho * h_l**2
+    delta[1,:] += g * rho[0] * h_bar[0] * (h_r[1] - h_l[1] + b_r - b_l)
+    delta[3,:] += g * rho[0] * h_bar[1] * (h_r[0] - h_l[0]) \
+                + g * rho[1] * h_bar[1] * (b_r - b_l)
+
+    # Bottom layer walls, where the bottom layer is dry on one side and the
+    # bathymetry there is above the internal surface on the wet side.  The
+    # bottom layer equations see a reflection of the wet side.
+    wall_l = dry_l[1] & np.logical_not(dry_r[1]) & (b_l > h_r[1] + b_r)
+    wall_r = dry_r[1] & np.logical_not(dry_l[1]) & (b_r > h_l[1] + b_l)
+    wall = wall_l | wall_r
+    delta[2,wall_l] = 2.0 * q_r[3,wall_l]
+    delta[2,wall_r] = -2.0 * q_l[3,wall_r]
+    delta[3,wall] = 0.0
+
+    # Classify interfaces by which layers are dry on which side
+    dry_both = np.logical_and(dry_l,dry_r)
+    all_dry = np.logical_and(dry_both[0],dry_both[1])
+    top_only = np.logical_and(dry_both[1],np.logical_not(dry_both[0]))
+    bottom_only = np.logical_and(dry_both[0],np.logical_not(dry_both[1]))
+    wet = two_layer_interfaces(h_l,h_r,dry_tolerance)
+
+    s = np.zeros((num_rp,num_waves))
+    R = np.zeros((num_rp,num_eqn,num_waves))
+    R[all_dry,...] = np.identity(num_eqn)
+
+    # Single layer interfaces, use Roe averages of the moving layer
+    for (layer,index) in ((0,top_only),(1,bottom_only)):
+        if np.any(index):
+            sqrt_h_l = np.sqrt(h_l[layer,index])
+            sqrt_h_r = np.sqrt(h_r[layer,index])
+            u_hat = (sqrt_h_l * u_l[layer,index] + sqrt_h_r * u_r[layer,index]) \
+                                                        / (sqrt_h_l + sqrt_h_r)
+            _single_layer(s,R,index,layer,h_bar[layer,index],u_hat,g)
+
+    # Two layer interfaces
+    if np.any(wet):
+        if inundation_method == 1:
+            h = np.where(dry_l,h_r,np.where(dry_r,h_l,h_bar))
+            u = np.where(dry_l,u_r,np.where(dry_r,u_l,0.5 * (u_l + u_r)))
+        else:
+            h = h_bar.copy()
+            u = 0.5 * (u_l + u_r)
+        h[1,wall_l] = h_r[1,wall_l]
+        h[1,wall_r] = h_l[1,wall_r]
+        u[1,wall] = 0.0
+        h = h[:,wet]
+        u = u[:,wet]
+
+        if eigen_method == 1:
+            h_hat = 0.5 * (layout.h_hat(aux_l)[:,wet]
+                           + layout.h_hat(aux_r)[:,wet])
+            fallback = np.any(h_hat < dry_tolerance,axis=0)
+            h_hat[:,fallback] = h[:,fallback]
+            s_wet,R_wet = linearized_eigen(h_hat,r,g)
+        elif eigen_method == 2:
+            fallback = None
+            s_wet,R_wet = linearized_eigen(h,r,g,u)
+        elif eigen_method == 3:
+            s_wet,R_wet,fallback = velocity_difference_eigen(h,u,r,g)
+        elif eigen_method == 4:
+            s_wet,R_wet,fallback = lapack_eigen(h,u,r,g)
+        elif eigen_method == HYBRID:
+            s_wet,R_wet = linearized_eigen(h,r,g,u)
+            expensive = expensive_interfaces(layout.kappa(aux_l,0)[wet],
+                                             layout.kappa(aux_r,0)[wet],
+                                             problem_data)
+            fallback = None
+            if np.any(expensive):
+                s_expensive,R_expensive,complex_mask = lapack_eigen(
+                                        h[:,expensive],u[:,expensive],r,g)
+                keep = np.logical_not(complex_mask)
+                index = np.nonzero(expensive)[0][keep]
+                s_wet[index] = s_expensive[keep]
+                R_wet[index] = R_expensive[keep]
+        else:
+            raise ValueError("Invalid eigen method %s requested." % eigen_method)
+
+        if eigen_method != 1 and fallback is not None and np.any(fallback):
+            s_wet[fallback],R_wet[fallback] = linearized_eigen(h[:,fallback],
+                                                         r,g,u[:,fallback])
+        s[wet] = s_wet
+        R[wet] = R_wet
+
+    # Decompose the flux differences in the density weighted variables
+    R[:,0:2,:] *= rho[0]
+    R[:,2:4,:] *= rho[1]
+    beta = np.linalg.solve(R,delta.T[...,np.newaxis])[...,0]
+    fwave = (R * beta[:,np.newaxis,:]).transpose(1,2,0)
+    s = s.T
+
+    # Drop the bottom layer part of waves moving into a bottom layer wall
+    fwave[2:4,:,wall_l] *= s[:,wall_l] > 0.0
+    fwave[2:4,:,wall_r] *= s[:,wall_r] < 0.0
+
+    # Fluctuations, stationary waves are split evenly
+    weight = (s < 0.0) + 0.5 * (s == 0.0)
+    amdq = np.sum(fwave * weight[np.newaxis,...],axis=1)
+    apdq = np.sum(fwave,axis=1) - amdq
+
+    return fwave,s,amdq,apdq
@@ -0,0 +1,368 @@
+# encoding: utf-8
+
+r"""Output frames written when the solution changes instead of at fixed times
+
+An :class:`OutputScheduler` is called after *before_step* at every time step
+and writes the current state as a frame to a :mod:`multilayer.store` when
+one of its monitors has changed by more than its threshold since the last
+frame written.  Frames are never written closer than *min_interval* apart
+and at least every *max_interval*.  The first and the final state are
+always written.  The monitors are scalars computed from the state, e.g.
+
+    - :class:`SurfaceChange` - max |eta_k - eta_k(t=0)| of a surface
+    - :class:`MaxKappa` - max kappa over all interfaces
+    - :class:`WindowMomentum` - max |momentum| in a window of x
+
+Every step the monitor values and the surfaces at the cells nearest to the
+*probes* locations are also recorded, so that time series at a few points
+need no frames at all.  As with :mod:`multilayer.gauges` the samples are
+collected in a fixed buffer that is appended to *probes.bin* next to the
+store when it fills up and when the scheduler is flushed.  *probes.bin*
+holds raw little endian doubles described by *probes.json*, one record
+
+    [t, monitors[num_monitors], eta[num_layers,num_probes]]
+
+per step, :func:`read_probes` maps it.  The frames written and the monitor
+that triggered each are listed in *output_schedule.txt*.
+
+:func:`multilayer.checkpoint.run` drives a scheduler in place of the
+controller's output, flushing it before each checkpoint and truncating its
+store and probes to the checkpoint's time on restart.  Only serial runs are
+supported.
+
+:Available Routines:
+    - :class:`OutputScheduler` - Write frames when monitors change
+    - :class:`Monitor` - Base class of the monitors
+    - :func:`read_probes` - Read the probes of an output directory
+"""
+
+import os
+import json
+
+import numpy as np
+
+from layers import state_layout
+import store
+
+probes_data_name = 'probes.bin'
+probes_header_name = 'probes.json'
+
+class Monitor(object):
+    r"""Scalar quantity of a state watched by an :class:`OutputScheduler`
+
+    Subclasses implement *value(state)*, *start(state)* is called with the
+    initial state before the first value is taken.
+
+    :Input:
+     - *threshold* (float) - Change since the last frame written that
+       triggers a new frame.
+    """
+
+    name = 'monitor'
+
+    def __init__(self,threshold):
+        self.threshold = threshold
+
+    def start(self,state):
+        pass
+
+    def value(self,state):
+        raise NotImplementedError("Monitors must define value.")
+
+
+class SurfaceChange(Monitor):
+    r"""Largest deviation of surface *layer* from the initial surface
+
+    Layer 0 is the top surface, layer 1 the interface below it and so on.
+    """
+
+    def __init__(self,layer,threshold):
+        super(SurfaceChange,self).__init__(threshold)
+        self.layer = layer
+        self.name = 'eta_%s' % (layer + 1)
+        self._initial = None
+
+    def _surface(self,state):
+        layout = state_layout(state)
+        eta = layout.surfaces(state.q,layout.bathy(state.aux),
+                              state.problem_data['rho'])
+        return eta[self.layer,...]
+
+    def start(self,state):
+        self._initial = self._surface(state).copy()
+
+    def value(self,state):
+        return np.max(np.abs(self._surface(state) - self._initial))
+
+
+class MaxKappa(Monitor):
+    r"""Largest kappa over all interfaces, as set by *before_step*"""
+
+    name = 'kappa'
+
+    def value(self,state):
+        return np.max(state_layout(state).kappa(state.aux))
+
+
+class WindowMomentum(Monitor):
+    r"""Largest absolute momentum of any layer in the window [x_lower,x_upper]
+
+    The momentum is density weighted as in q.
+    """
+
+    def __init__(self,x_lower,x_upper,threshold):
+        super(WindowMomentum,self).__init__(threshold)
+        self.x_lower = x_lower
+        self.x_upper = x_upper
+        self.name = 'hu[%g,%g]' % (x_lower,x_upper)
+        self._cells = None
+
+    def start(self,state):
+        x = state.grid.dimensions[0].centers
+        self._cells = slice(np.searchsorted(x,self.x_lower,side='left'),
+                            np.searchsorted(x,self.x_upper,side='right'))
+
+    def value(self,state):
+        momentum = state_layout(state).momentum(state.q)[...,self._cells]
+        if momentum.size == 0:
+            return 0.0
+        return np.max(np.abs(momentum))
+
+
+class OutputScheduler(object):
+    r"""Write frames of a run when its monitors change
+
+    :Input:
+     - *monitors* (list of :class:`Monitor`) - Quantities watched.
+     - *min_interval* (float) - Smallest time between two frames.
+     - *max_interval* (float) - Largest time between two frames.
+     - *probes* (list of float) - Locations where the surfaces are recorded
+       every step.
+     - *buffer_size* (int) - Number of probe samples buffered between writes.
+     - *kargs* - Passed on to :class:`multilayer.store.RunWriter`.
+    """
+
+    def __init__(self,monitors,min_interval=0.0,max_interval=np.inf,
+                      probes=(),buffer_size=1024,**kargs):
+        self.monitors = list(monitors)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.probes = np.asarray(probes,dtype=float)
+        self.buffer_size = buffer_size
+        self.store_kargs = kargs
+        self.path = None
+        self.writer = None
+        self._probe_cells = None
+        self._last_t = None
+        self._last_values = None
+        self._last_sample_t = None
+        self._schedule = []
+
+    # Output files
+    def open(self,outdir,solution,restart_time=None):
+        r"""Open the store in outdir for the run of solution
+
+        With *restart_time* the store and probes of an earlier run are kept
+        up to that time and the monitors are started from its first frame.
+        """
+        self.path = outdir
+        store_path = os.path.join(outdir,store.store_name)
+        state = solution.state
+        x = state.grid.dimensions[0].centers
+        self._probe_cells = np.clip(np.searchsorted(x,self.probes) - 1,0,
+                                    x.shape[0] - 1)
+        # Pick the nearer of the two cells around each probe
+        upper = np.minimum(self._probe_cells + 1,x.shape[0] - 1)
+        closer = np.abs(x[upper] - self.probes) \
+                    < np.abs(x[self._probe_cells] - self.probes)
+        self._probe_cells[closer] = upper[closer]
+
+        num_layers = state_layout(state).num_layers
+        self._eta_shape = (num_layers,self.probes.shape[0])
+        self.record_size = 1 + len(self.monitors) \
+                             + num_layers * self.probes.shape[0]
+        self._buffer = np.empty((self.buffer_size,self.record_size),
+                                dtype='<f8')
+        self._num_buffered = 0
+        self._last_sample_t = None
+        self._write_probes_header()
+
+        if restart_time is not None and store.is_store(store_path):
+            reader = store.RunReader(store_path)
+            kept = [frame for (frame,t) in zip(reader.frames,reader.t)
+                                                    if t <= restart_time]
+            initial = reader.solution(reader.frames[0],read_aux=True).state
+            for monitor in self.monitors:
+                monitor.start(initial)
+            self.writer = store.RunWriter.append(store_path,
+                                                 kept[-1] if kept else -1)
+            self._truncate_probes(restart_time)
+            self._schedule = [entry for entry in self._read_schedule()
+                                                if entry[1] <= restart_time]
+            self._last_t = None
+            if kept:
+                # The monitors at the last frame kept were sampled that step
+                self._last_t = reader.t[len(kept) - 1]
+                self._last_values = self._values(state)
+                probes = read_probes(self.path)
+                at_last = np.nonzero(probes['t'] == self._last_t)[0]
+                if at_last.shape[0] > 0:
+                    self._last_values = np.array(
+                                        probes['monitors'][at_last[-1]])
+        else:
+            for monitor in self.monitors:
+                monitor.start(state)
+            self.writer = store.open_writer(store_path,solution,
+                                            **self.store_kargs)
+            open(os.path.join(outdir,probes_data_name),'wb').close()
+            self._schedule = []
+            self._last_t = None
+
+    def attach(self,solver):
+        r"""Sample the state after every call of *solver.before_step*"""
+        before_step = solver.before_step
+
+        def scheduled_before_step(solver,state):
+            if before_step is not None:
+                before_step(solver,state)
+            self(state)
+
+        solver.before_step = scheduled_before_step
+
+    # Sampling
+    def _values(self,state):
+        return np.array([monitor.value(state) for monitor in self.monitors])
+
+    def __call__(self,state):
+        r"""Record the probes and write a frame if a monitor has changed"""
+        t = state.t
+        values = self._values(state)
+        layout = state_layout(state)
+        eta = layout.surfaces(state.q[...,self._probe_cells],
+                              layout.bathy(state.aux)[...,self._probe_cells],
+                              state.problem_data['rho'])
+        # Retaken steps sample the same state at the same time again
+        if self._last_sample_t is None or t > self._last_sample_t:
+            self._sample(t,values,eta)
+
+        if self._last_t is None:
+            self.write(state,values,'initial')
+            return
+        elapsed = t - self._last_t
+        if elapsed < self.min_interval or elapsed <= 0.0:
+            return
+        if elapsed >= self.max_interval:
+            self.write(state,values,'max_interval')
+            return
+        changed = np.abs(values - self._last_values) \
+                    > np.array([monitor.threshold for monitor in self.monitors])
+        if changed.any():
+            reason = ",".join(monitor.name for (monitor,flag)
+                                    in zip(self.monitors,changed) if flag)
+            self.write(state,values,reason)
+
+    def write(self,state,values=None,reason=''):
+        r"""Write state as the next frame"""
+        if values is None:
+            values = self._values(state)
+        frame = len(self.writer.frames)
+        self.writer.write(frame,state.t,state.q,state.aux)
+        self._schedule.append((frame,state.t,reason))
+        self._last_t = state.t
+        self._last_values = values
+
+    def finish(self,state):
+        r"""Write the final state if it is newer than the last frame"""
+        if self._last_t is None or state.t > self._last_t:
+            self.write(state,reason='final')
+        self.flush()
+
+    def flush(self):
+        r"""Write out the store, the buffered probes and the schedule"""
+        self.writer.flush()
+        self._flush_probes()
+        with open(os.path.join(self.path,'output_schedule.txt'),'w') as out:
+            out.write("%8s %16s  %s\n" % ('frame','t','trigger'))
+            for (frame,t,reason) in self._schedule:
+                out.write("%8d %16.8e  %s\n" % (frame,t,reason))
+
+    # Probe and schedule files
+    def _sample(self,t,values,eta):
+        r"""Add a probe sample to the buffer, writing it out when full"""
+        record = self._buffer[self._num_buffered]
+        record[0] = t
+        record[1:1 + values.shape[0]] = values
+        record[1 + values.shape[0]:] = eta.ravel()
+        self._num_buffered += 1
+        self._last_sample_t = t
+        if self._num_buffered == self.buffer_size:
+            self._flush_probes()
+
+    def _flush_probes(self):
+        r"""Append the buffered probe samples to the probe file"""
+        if self._num_buffered > 0:
+            with open(os.path.join(self.path,probes_data_name),'ab') \
+                                                                as data_file:
+                self._buffer[:self._num_buffered].tofile(data_file)
+            self._num_buffered = 0
+
+    def _write_probes_header(self):
+        header = {'x':self.probes.tolist(),
+                  'names':[monitor.name for monitor in self.monitors],
+                  'eta_shape':list(self._eta_shape),
+                  'record_size':self.record_size,'dtype':'<f8'}
+        with open(os.path.join(self.path,probes_header_name),'w') \
+                                                                as header_file:
+            json.dump(header,header_file,indent=1)
+
+    def _truncate_probes(self,restart_time):
+        r"""Keep the probe samples up to restart_time"""
+        data_path = os.path.join(self.path,probes_data_name)
+        if not os.path.exists(data_path):
+            open(data_path,'wb').close()
+            return
+        t = read_probes(self.path)['t']
+        num_kept = np.count_nonzero(t <= restart_time)
+        with open(data_path,'r+b') as data_file:
+            data_file.truncate(num_kept * self.record_size * 8)
+        if num_kept > 0:
+            self._last_sample_t = t[num_kept - 1]
+
+    def _read_schedule(self):
+        path = os.path.join(self.path,'output_schedule.txt')
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path,'r') as schedule_file:
+            schedule_file.readline()
+            for line in schedule_file:
+                fields = line.split()
+                entries.append((int(fields[0]),float(fields[1]),
+                                fields[2] if len(fields) > 2 else ''))
+        return entries
+
+
+def read_probes(path):
+    r"""Read the probes recorded by a scheduler in the output directory path
+
+    :Output:
+     - (dict) - *t* (ndarray(num_samples)), *monitors*
+       (ndarray(num_samples,num_monitors)) and *eta*
+       (ndarray(num_samples,num_layers,num_probes)), views of a memory map
+       of the probe file, and the probe locations *x* and monitor *names*.
+    """
+    with open(os.path.join(path,probes_header_name),'r') as header_file:
+        header = json.load(header_file)
+    data_path = os.path.join(path,probes_data_name)
+    record_size = header['record_size']
+    num_records = os.path.getsize(data_path) // (8 * record_size)
+    if num_records == 0:
+        data = np.zeros((0,record_size))
+    else:
+        data = np.memmap(data_path,dtype=header['dtype'],mode='r',
+                         shape=(num_records,record_size))
+    num_monitors = len(header['names'])
+    return {'x':np.array(header['x']),'names':header['names'],
+            't':data[:,0],'monitors':data[:,1:1 + num_monitors],
+            'eta':data[:,1 + num_monitors:].reshape(
+                            (data.shape[0],) + tuple(header['eta_shape']))}
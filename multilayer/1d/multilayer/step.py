@@ -4,14 +4,26 @@ Module contains routines implementing call back functions needed for a single
 time step.
 
 *before_step* - Checks for negative depths, sets the wind, and calculates kappa
-                and checks against the Richardson tolerance.
+                and checks against the Richardson tolerance.  Violations and
+                the use of the hybrid eigen method are recorded in the
+                solver's *Workspace*, reduced over all processes in
+                parallel runs.
                 
-*friction_source* - Implements Manning's-N type friction source term
+*friction_source* - Implements Manning's-N type friction source term, this
+                    only acts on local cells and needs no communication
 """
 
+import os
+
 import numpy as np
 
-from aux import set_no_wind,kappa_index
+from clawpack.pyclaw.classic.solver import ClawSolver
+from clawpack.pyclaw.sharpclaw.solver import SharpClawSolver
+
+from aux import set_no_wind
+from layers import state_layout
+import parallel
+import riemann
 
 class NegativeDepthError(Exception):
     r"""Error raised when depth becomes negative in a layer"""
@@ -32,6 +44,123 @@ class RichardsonExceededError(Exception):
 
 
 
+class StepLog(object):
+    r"""Base class for per step time series kept by the :class:`Workspace`
+    
+    Records are kept in a growable structured array of type *dtype* so that
+    recording an entry does not print or allocate per cell.  Subclasses
+    define *dtype*, the output format *fmt* and the *header*.
+    """
+    
+    dtype = None
+    fmt = None
+    header = ""
+    
+    def __init__(self,capacity=1024):
+        self._records = np.empty(capacity,dtype=self.dtype)
+        self.num_records = 0
+        
+    def __len__(self):
+        return self.num_records
+        
+    @property
+    def records(self):
+        r"""View of the recorded entries"""
+        return self._records[:self.num_records]
+        
+    def record(self,*values):
+        r"""Append an entry, doubling the storage if needed"""
+        if self.num_records == self._records.shape[0]:
+            self._records = np.resize(self._records,2 * self._records.shape[0])
+        self._records[self.num_records] = values
+        self.num_records += 1
+        
+    def write(self,path):
+        r"""Write out the recorded entries as a text table to path"""
+        np.savetxt(path,self.records,fmt=self.fmt,header=self.header)
+
+
+class HyperbolicityLog(StepLog):
+    r"""Time series of steps where the Richardson tolerance was exceeded
+    
+    Each record contains the step number, the time, the number of cells
+    exceeding the tolerance, the maximum value of kappa and the index where
+    the maximum occurred.
+    """
+    
+    dtype = np.dtype([('step',int),('t',float),('count',int),
+                      ('max_kappa',float),('worst_index',int)])
+    fmt = ['%8i','%22.16e','%8i','%22.16e','%8i']
+    header = "step t count max_kappa worst_index"
+
+
+class EigenPathLog(StepLog):
+    r"""Time series of the interfaces using the expensive eigen decomposition
+    
+    Each record contains the step number, the time, the number of interfaces
+    where the hybrid eigen method used the full eigen decomposition and the
+    total number of interfaces.  Only written when the hybrid method is used.
+    """
+    
+    dtype = np.dtype([('step',int),('t',float),('count',int),
+                      ('num_interfaces',int)])
+    fmt = ['%8i','%22.16e','%8i','%8i']
+    header = "step t count num_interfaces"
+
+
+class Workspace(object):
+    r"""Preallocated arrays used by *before_step*
+    
+    The workspace is attached to the solver as *solver.workspace* the first
+    time *before_step* is called and reused for every following step.  It
+    also carries the *hyperbolicity* log of Richardson tolerance violations
+    and the *eigen_paths* log of the hybrid eigen method.
+    Layer quantities have a leading dimension of *num_layers* and interface
+    quantities such as kappa one of *num_layers - 1*.
+    """
+    
+    def __init__(self,num_layers,shape):
+        layer_shape = (num_layers,) + tuple(shape)
+        interface_shape = (num_layers - 1,) + tuple(shape)
+        self.h = np.zeros(layer_shape)
+        self.u = np.zeros(layer_shape)
+        self.wet = np.zeros(layer_shape,dtype=bool)
+        self.kappa = np.zeros(interface_shape)
+        self.work = np.zeros(interface_shape)
+        self.mask = np.zeros(interface_shape,dtype=bool)
+        self.num_steps = 0
+        self.comm = None
+        self.hyperbolicity = HyperbolicityLog()
+        self.eigen_paths = EigenPathLog()
+        
+    def matches(self,num_layers,shape):
+        r"""Check whether the workspace fits the given layers and grid"""
+        return self.h.shape == (num_layers,) + tuple(shape)
+        
+    def write_logs(self,outdir):
+        r"""Write the hyperbolicity and, if used, eigen path logs to outdir
+
+        The logs hold global values so only the first process writes them.
+        """
+        if self.comm is not None and self.comm.rank != 0:
+            return
+        self.hyperbolicity.write(os.path.join(outdir,'hyperbolicity.txt'))
+        if len(self.eigen_paths) > 0:
+            self.eigen_paths.write(os.path.join(outdir,'eigen_paths.txt'))
+
+
+def get_workspace(solver,state):
+    r"""Return the workspace attached to solver, creating it if needed"""
+    num_layers = state.problem_data['num_layers']
+    workspace = getattr(solver,'workspace',None)
+    if workspace is None or not workspace.matches(num_layers,state.q.shape[1:]):
+        workspace = Workspace(num_layers,state.q.shape[1:])
+        workspace.comm = parallel.communicator(state)
+        # PyClaw solvers may refuse attributes they do not define
+        object.__setattr__(solver,'workspace',workspace)
+    return workspace
+
+
 def before_step(solver,state,wind_func=set_no_wind,dry_tolerance=1e-3,
                     richardson_tolerance=0.95,raise_on_negative=False,
                     raise_on_richardson=False):
@@ -39,6 +168,19 @@ def before_step(solver,state,wind_func=set_no_wind,dry_tolerance=1e-3,
     Sets data fields and performs calculations needed before a time
     step is taken.
     
+    Layer depths, velocities and kappa are computed in the preallocated
+    arrays of the solver's :class:`Workspace` for all layers at once.  Steps
+    where kappa exceeds *richardson_tolerance* at an interface with a wet
+    lower layer are recorded in *solver.workspace.hyperbolicity* instead of
+    being printed.  When the hybrid eigen method is used the number of
+    interfaces that will take the full eigen decomposition is recorded in
+    *solver.workspace.eigen_paths*.
+    
+    Under domain decomposition (PetClaw) the counts and the maximum of kappa
+    are reduced over all processes and cell indices are reported in the
+    global numbering, so the logs and raised errors are the same on every
+    process.
+    
     :Input:
      - *solver* (:class:pyclaw.solver.Solver)
      - *solution* (:class:pyclaw.solution.Solution)
@@ -56,80 +198,194 @@ def before_step(solver,state,wind_func=set_no_wind,dry_tolerance=1e-3,
     """
     
     # Extract relevant data
-    num_layers = state.problem_data['num_layers']
-    rho = state.problem_data['rho']
+    layout = state_layout(state)
+    rho = layout.density_column(state.problem_data['rho'],state.q.ndim - 1)
     g = state.problem_data['g']
-    one_minus_r = state.problem_data['one_minus_r']
-    x = state.grid.dimensions[0].centers
     
     # State arrays
     q = state.q
     aux = state.aux
+    depth = layout.depth(q)
+    momentum = layout.momentum(q)
+    workspace = get_workspace(solver,state)
+    workspace.num_steps += 1
     
     # Zero out negative values
-    for layer in xrange(num_layers):
-        m = num_layers * layer
-        negative_indices = (q[m,:] < 0.0).nonzero()[0]
-        q[m,negative_indices] = 0.0
-        q[m+1,negative_indices] = 0.0
-        
+    negative = workspace.wet
+    np.less(depth,0.0,out=negative)
+    num_negative = np.count_nonzero(negative,axis=tuple(range(1,q.ndim)))
+    negative_cells = None
+    if num_negative.any():
         if raise_on_negative:
-            if len(negative_indices) < 0:
-                locations = x[negative_indices]
-                raise NegativeDepthError(layer,locations)
-    
+            negative_cells = [np.nonzero(negative[layer].ravel())[0]
+                                    for layer in xrange(layout.num_layers)]
+        depth[negative] = 0.0
+        momentum[negative] = 0.0
     
     # Set wind field
     wind_func(state)
     
     # Calculate kappa
-    h = np.zeros((num_layers,q.shape[1]))
-    u = np.zeros(h.shape)
-    for layer in xrange(num_layers):
-        layer_index = 2*layer
-        h[layer,:] = state.q[layer_index,:] / rho[layer]
-        wet_index = h[layer,:] > dry_tolerance
-        u[layer,wet_index] = state.q[layer_index+1,wet_index] / state.q[layer_index,wet_index]
-    aux[kappa_index,:] = (u[0,:] - u[1,:])**2 / (g * one_minus_r * (h[0,:] + h[1,:]))
-    if np.any(aux[kappa_index,wet_index] > richardson_tolerance):
-        # Actually calculate where the indices failed
-        bad_indices = (aux[kappa_index,wet_index] > richardson_tolerance).nonzero()[0]
+    h = workspace.h
+    u = workspace.u
+    wet = workspace.wet
+    kappa = workspace.kappa
+    np.divide(depth,rho,out=h)
+    np.greater(h,dry_tolerance,out=wet)
+    u.fill(0.0)
+    np.divide(momentum,depth,out=u,where=wet)
+    np.subtract(u[:-1],u[1:],out=kappa)
+    np.square(kappa,out=kappa)
+    np.add(h[:-1],h[1:],out=workspace.work)
+    workspace.work *= g * layout.one_minus_r(rho)
+    # Velocities vanish where both layers are dry so kappa is left at zero
+    np.greater(workspace.work,0.0,out=workspace.mask)
+    np.divide(kappa,workspace.work,out=kappa,where=workspace.mask)
+    layout.kappa(aux)[...] = kappa
+    
+    # Check hyperbolicity where the lower layer of each interface is wet
+    np.greater(kappa,richardson_tolerance,out=workspace.mask)
+    workspace.mask &= wet[1:]
+    count = np.count_nonzero(workspace.mask)
+    
+    # Count the interfaces where the hybrid eigen method will use the full
+    # eigen decomposition
+    hybrid = state.problem_data.get('eigen_method') == riemann.HYBRID
+    if hybrid:
+        num_expensive,num_interfaces = _count_expensive_interfaces(state,h)
+    else:
+        num_expensive,num_interfaces = 0,0
+    
+    # Reduce the counts over all processes at once, only the rare cases
+    # below need further communication
+    counts = np.concatenate((num_negative,[count,num_expensive,num_interfaces]))
+    counts = parallel.global_sum(workspace.comm,counts)
+    num_negative = counts[:layout.num_layers]
+    count,num_expensive,num_interfaces = counts[layout.num_layers:]
+    
+    if raise_on_negative and num_negative.any():
+        layer = np.nonzero(num_negative)[0][0]
+        if negative_cells is None:
+            cells = np.zeros(0,dtype=int)
+        else:
+            cells = parallel.global_cell_index(state,negative_cells[layer])
+        cells = parallel.global_concatenate(workspace.comm,cells)
+        raise NegativeDepthError(layer,_cell_locations(state,cells))
+    
+    if count > 0:
+        np.multiply(kappa,wet[1:],out=workspace.work)
+        worst_index = np.argmax(workspace.work)
+        max_kappa = workspace.work.flat[worst_index]
+        worst_cell = parallel.global_cell_index(state,
+                                        worst_index % workspace.work[0].size)
+        max_kappa,worst_cell = parallel.global_max_location(workspace.comm,
+                                                        max_kappa,worst_cell)
+        workspace.hyperbolicity.record(workspace.num_steps,state.t,count,
+                                       max_kappa,worst_cell)
         if raise_on_richardson:
+            bad_cells = np.unique(np.nonzero(
+                          workspace.mask.reshape(layout.num_layers - 1,-1))[1])
+            bad_indices = np.unique(parallel.global_concatenate(workspace.comm,
+                                parallel.global_cell_index(state,bad_cells)))
             state.aux = aux
             raise RichardsonExceededError(bad_indices,state)
-        else:
-            print "Hyperbolicity may have failed at the following points:"
-            for i in bad_indices:
-                print "\tkappa(%s) = %s" % (i,aux[kappa_index,i])
+    
+    if hybrid:
+        workspace.eigen_paths.record(workspace.num_steps,state.t,
+                                     num_expensive,num_interfaces)
+
+
+def _count_expensive_interfaces(state,h):
+    r"""Count the local interfaces where the hybrid method uses LAPACK
+
+    Each process counts the interface to the left of each of its cells and,
+    if it owns the upper boundary, the boundary interface.  Boundary
+    interfaces see extrapolated values as do the interfaces between the
+    grids of two processes.
+    """
+    layout = state_layout(state)
+    # Only the last (x) axis is padded, leading axes are ensemble members
+    pad = lambda a,lower,upper: np.pad(a,[(0,0)] * (a.ndim - 1)
+                                         + [(lower,upper)],mode='edge')
+    kappa = pad(layout.kappa(state.aux,0),1,0)
+    h = pad(h,1,0)
+    if parallel.on_boundary(state,0,lower=False):
+        kappa = pad(kappa,0,1)
+        h = pad(h,0,1)
+    expensive = np.logical_and(
+            riemann.expensive_interfaces(kappa[...,:-1],kappa[...,1:],
+                                         state.problem_data),
+            riemann.two_layer_interfaces(h[...,:-1],h[...,1:],
+                                         state.problem_data['dry_tolerance']))
+    return np.count_nonzero(expensive),expensive.size
 
 
+def _cell_locations(state,cells):
+    r"""Return the cell centers of the global cell indices in one dimension,
+    otherwise the indices themselves"""
+    if len(state.grid.dimensions) > 1:
+        return cells
+    centers = parallel.global_dimensions(state)[0].centers
+    return centers[np.asarray(cells) % centers.shape[0]]
+
 
 def friction_source(solver,state,dt,TOLERANCE=1e-30):
-    r""""""
-
-    if state.problem_data['manning'] != 0.0:
-        if isinstance(solver, ClawSolver):
-            manning = state.problem_data['manning']
-            g = state.problem_data['g']
-            rho = state.problem_data['rho']
-            dry_tolerance = state.problem_data['dry_tolerance']
-            
-            if manning > TOLERANCE:
-                for i in xrange(state.q.shape[1]):
-                    h = state.q[2,i] / rho[1]
-                    if h < dry_tolerance:
-                        h = state.q[0,i] / rho[0]
-                        u = state.q[1,i] / rho[0]
-                        layer_index = 0
-                    else:
-                        u = state.q[2,i] / rho[1]
-                        layer_index = 1
-                
-                    gamma = u * g * manning**2 / h**(4/3)
-                    dgamma = 1.0 + dt * gamma
-                    hu_index = 2 * (layer_index) + 1
-                    state.q[hu_index,i] = state.q[hu_index,i] / dgamma * rho[layer_index]
-        elif isinstance(solver, SharpClawSolver):
-            pass
-        else:
-            raise ValueError("Solver type %s not supported." % type(solver))
+    r"""
+    Implicit Manning's-N friction source term
+    
+    Friction is applied to the bottom most wet layer in each cell, i.e. the
+    lowest layer whose depth is at least the dry tolerance.  Cells where all
+    layers are dry are left untouched.  The momentum in the active layer is
+    updated implicitly by
+    
+        hu = hu / (1 + dt * g * n^2 * |u| / h^(4/3))
+    
+    For classic solvers *state.q* is updated in place while for SharpClaw
+    solvers the increment to q is returned.
+    
+    :Input:
+     - *solver* (:class:pyclaw.solver.Solver)
+     - *state* (:class:pyclaw.state.State)
+     - *dt* (float)
+     - *TOLERANCE* (float) - Values of manning below this are taken to be
+       zero and no friction is applied.
+    """
+    
+    if isinstance(solver, ClawSolver) or getattr(solver, 'ensemble', False):
+        return_increment = False
+    elif isinstance(solver, SharpClawSolver):
+        return_increment = True
+    else:
+        raise ValueError("Solver type %s not supported." % type(solver))
+    
+    manning = state.problem_data['manning']
+    if manning <= TOLERANCE:
+        if return_increment:
+            return np.zeros(state.q.shape)
+        return
+    
+    layout = state_layout(state)
+    g = state.problem_data['g']
+    rho = layout.density_column(state.problem_data['rho'],state.q.ndim - 1)
+    dry_tolerance = state.problem_data['dry_tolerance']
+    depth = layout.depth(state.q)
+    momentum = layout.momentum(state.q)
+    
+    # Pick the active layer in each cell with at least one wet layer
+    wet = depth / rho >= dry_tolerance
+    cells = np.nonzero(wet.any(axis=0))
+    layers = layout.num_layers - 1 \
+                - np.argmax(wet[::-1][(slice(None),) + cells],axis=0)
+    index = (layers,) + cells
+    
+    # Friction coefficient for the active layers
+    h = depth[index] / rho.ravel()[layers]
+    u = momentum[index] / depth[index]
+    dgamma = 1.0 + dt * g * manning**2 * np.abs(u) / h**(4.0/3.0)
+    
+    if return_increment:
+        dq = np.zeros(state.q.shape)
+        layout.momentum(dq)[index] = momentum[index] * (1.0 / dgamma - 1.0)
+        return dq
+    
+    momentum[index] = momentum[index] / dgamma
@@ -0,0 +1,380 @@
+# encoding: utf-8
+
+r"""Single container for all of the output frames of a run
+
+A store is a directory holding every frame of a run as compressed chunks
+instead of one text file of q and one of aux per frame:
+
+    store.json          - grid, frame numbers and times and the chunking
+    static.npz          - x and the aux rows that do not change (b, h_hat)
+    q_TTTT_XXXX.npz     - q of a block of frames and cells
+    aux_TTTT_XXXX.npz   - changing aux rows (wind, kappa) of the same block
+
+Chunks hold *frames_per_chunk* frames of *cells_per_chunk* cells so that a
+single frame or a range of cells is read by decompressing only the chunks
+that overlap it.  Frames are written in increasing order, the last partial
+chunk is rewritten as frames are added.
+
+:func:`multilayer.frames.find_frames` and :func:`multilayer.frames.read_frame`
+use the store found in an output directory (see :func:`find_store`) so the
+analysis scripts read from it without changes.
+
+:Available Routines:
+    - :class:`RunWriter` - Write frames to a store
+    - :class:`RunReader` - Random access to the frames of a store
+    - :func:`find_store` - Find an up to date store of an output directory
+    - :func:`convert` - Convert an existing output directory to a store
+"""
+
+import os
+import json
+import threading
+import collections
+
+import numpy as np
+
+from layers import get_layout
+
+meta_name = 'store.json'
+store_name = 'store'
+
+def is_store(path):
+    r"""Check whether path is a store"""
+    return os.path.exists(os.path.join(path,meta_name))
+
+
+def find_store(path,file_prefix='fort'):
+    r"""Return the store of the output directory path or None
+
+    Either path itself or its *store* subdirectory may be a store.  A store
+    in the subdirectory is ignored if the text output next to it was written
+    after the store, e.g. by rerunning the case without the store.
+    """
+    if is_store(path):
+        return path
+    store_path = os.path.join(path,store_name)
+    if not is_store(store_path):
+        return None
+    store_time = os.path.getmtime(os.path.join(store_path,meta_name))
+    prefix = "%s.t" % file_prefix
+    for file_name in os.listdir(path):
+        if file_name.startswith(prefix):
+            if os.path.getmtime(os.path.join(path,file_name)) > store_time:
+                return None
+    return store_path
+
+
+def _chunk_path(path,field,time_chunk,cell_chunk):
+    return os.path.join(path,"%s_%04d_%04d.npz" % (field,time_chunk,cell_chunk))
+
+
+def _save(path,**arrays):
+    r"""Write arrays compressed to path through a temporary file"""
+    temp_path = path + '.tmp.npz'
+    np.savez_compressed(temp_path,**arrays)
+    os.rename(temp_path,path)
+
+
+class RunWriter(object):
+    r"""Write the frames of a run to a store
+
+    :Input:
+     - *path* (path) - Directory of the store, created if needed.
+     - *lower*, *upper* (float) - Extent of the grid.
+     - *num_cells* (int) - Number of cells.
+     - *num_eqn*, *num_aux* (int) - Number of rows of q and aux.
+     - *static_aux* (list) - Rows of aux stored once, default is the
+       bathymetry and h_hat rows of the two layer layout.
+     - *frames_per_chunk* (int) - Frames in a chunk, default 16.
+     - *cells_per_chunk* (int) - Cells in a chunk, default 4096.
+     - *problem_data* (dict) - Parameters stored with the run.
+    """
+
+    def __init__(self,path,lower,upper,num_cells,num_eqn,num_aux,
+                      static_aux=None,frames_per_chunk=16,cells_per_chunk=4096,
+                      problem_data=None):
+        if static_aux is None:
+            layout = get_layout(num_eqn // 2)
+            static_aux = [layout.bathy_index] + list(layout.h_hat_index)
+        static_aux = sorted(index for index in static_aux if index < num_aux)
+        self.path = path
+        self.meta = {'lower':lower,'upper':upper,'num_cells':num_cells,
+                     'num_eqn':num_eqn,'num_aux':num_aux,
+                     'static_aux':static_aux,
+                     'varying_aux':[index for index in xrange(num_aux)
+                                          if index not in static_aux],
+                     'frames_per_chunk':frames_per_chunk,
+                     'cells_per_chunk':cells_per_chunk,
+                     'frames':[],'t':[],'has_aux':False,
+                     'problem_data':problem_data or {}}
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._allocate()
+
+    @classmethod
+    def append(cls,path,last_frame=None):
+        r"""Open the store at path to add frames after *last_frame*
+
+        Frames after *last_frame*, default the last frame stored, are
+        dropped, e.g. when a run is restarted from an earlier checkpoint.
+        """
+        writer = cls.__new__(cls)
+        writer.path = path
+        with open(os.path.join(path,meta_name),'r') as meta_file:
+            writer.meta = json.load(meta_file)
+        writer._allocate()
+
+        frames = writer.meta['frames']
+        if last_frame is not None:
+            num_frames = len([frame for frame in frames if frame <= last_frame])
+            del writer.meta['frames'][num_frames:]
+            del writer.meta['t'][num_frames:]
+        # Reload the partial last chunk so that it can be completed
+        num_frames = len(writer.meta['frames'])
+        num_buffered = num_frames % writer.meta['frames_per_chunk']
+        if num_buffered > 0:
+            reader = RunReader(path)
+            for n in xrange(num_buffered):
+                frame = writer.meta['frames'][num_frames - num_buffered + n]
+                writer._q[n,...] = reader.read_q(frame)
+                if writer.meta['has_aux']:
+                    writer._aux[n,...] = reader._read('aux',frame)
+        writer._num_buffered = num_buffered
+        return writer
+
+    def _allocate(self):
+        meta = self.meta
+        self._q = np.empty((meta['frames_per_chunk'],meta['num_eqn'],
+                            meta['num_cells']))
+        self._aux = np.empty((meta['frames_per_chunk'],
+                              len(meta['varying_aux']),meta['num_cells']))
+        self._num_buffered = 0
+
+    @property
+    def frames(self):
+        return self.meta['frames']
+
+    def write(self,frame,t,q,aux=None):
+        r"""Add frame at time t, frames already stored are skipped"""
+        meta = self.meta
+        if len(meta['frames']) > 0 and frame <= meta['frames'][-1]:
+            return
+        if q.shape != (meta['num_eqn'],meta['num_cells']):
+            raise ValueError("q has shape %s, expected %s."
+                             % (q.shape,(meta['num_eqn'],meta['num_cells'])))
+        if aux is not None and len(meta['frames']) == 0:
+            meta['has_aux'] = True
+            _save(os.path.join(self.path,'static.npz'),
+                  aux=aux[meta['static_aux'],:],
+                  x=self.centers())
+
+        self._q[self._num_buffered,...] = q
+        if meta['has_aux']:
+            if aux is None:
+                raise ValueError("Frame %s has no aux array." % frame)
+            self._aux[self._num_buffered,...] = aux[meta['varying_aux'],:]
+        self._num_buffered += 1
+        meta['frames'].append(int(frame))
+        meta['t'].append(float(t))
+        if self._num_buffered == meta['frames_per_chunk']:
+            self._write_chunk()
+            self._num_buffered = 0
+            self._write_meta()
+
+    def centers(self):
+        meta = self.meta
+        delta = (meta['upper'] - meta['lower']) / float(meta['num_cells'])
+        return meta['lower'] + delta * (np.arange(meta['num_cells']) + 0.5)
+
+    def _write_chunk(self):
+        meta = self.meta
+        num_frames = len(meta['frames'])
+        time_chunk = (num_frames - 1) // meta['frames_per_chunk']
+        n = self._num_buffered
+        cells = meta['cells_per_chunk']
+        for (cell_chunk,start) in enumerate(xrange(0,meta['num_cells'],cells)):
+            _save(_chunk_path(self.path,'q',time_chunk,cell_chunk),
+                  values=self._q[:n,:,start:start + cells])
+            if meta['has_aux']:
+                _save(_chunk_path(self.path,'aux',time_chunk,cell_chunk),
+                      values=self._aux[:n,:,start:start + cells])
+
+    def _write_meta(self):
+        path = os.path.join(self.path,meta_name)
+        with open(path + '.tmp','w') as meta_file:
+            json.dump(self.meta,meta_file)
+        os.rename(path + '.tmp',path)
+
+    def flush(self):
+        r"""Write out the partial last chunk and the frame list"""
+        if self._num_buffered > 0:
+            self._write_chunk()
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+
+
+class RunReader(object):
+    r"""Random access to the frames of a store
+
+    Decompressed chunks are kept in a small cache shared by all threads so
+    that reading consecutive frames decompresses each chunk once.
+
+    :Input:
+     - *path* (path) - Directory of the store.
+     - *max_chunks* (int) - Number of decompressed chunks kept, default 8.
+    """
+
+    def __init__(self,path,max_chunks=8):
+        self.path = path
+        with open(os.path.join(path,meta_name),'r') as meta_file:
+            self.meta = json.load(meta_file)
+        self.frames = list(self.meta['frames'])
+        self.t = np.array(self.meta['t'])
+        self.num_cells = self.meta['num_cells']
+        self.max_chunks = max_chunks
+        self._positions = dict((frame,n) for (n,frame)
+                                                in enumerate(self.frames))
+        self._chunks = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._static = None
+
+    @property
+    def x(self):
+        r"""Cell centers"""
+        meta = self.meta
+        delta = (meta['upper'] - meta['lower']) / float(meta['num_cells'])
+        return meta['lower'] + delta * (np.arange(meta['num_cells']) + 0.5)
+
+    def cell_range(self,x_lower,x_upper):
+        r"""Return the slice of the cells with centers in [x_lower,x_upper]"""
+        x = self.x
+        return slice(np.searchsorted(x,x_lower,side='left'),
+                     np.searchsorted(x,x_upper,side='right'))
+
+    def _chunk(self,field,time_chunk,cell_chunk):
+        key = (field,time_chunk,cell_chunk)
+        with self._lock:
+            if key in self._chunks:
+                values = self._chunks.pop(key)
+                self._chunks[key] = values
+                return values
+        with np.load(_chunk_path(self.path,field,time_chunk,
+                                 cell_chunk)) as data:
+            values = data['values']
+        with self._lock:
+            self._chunks[key] = values
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return values
+
+    def _read(self,field,frame,cells=None):
+        r"""Read the rows of field in frame over the slice cells"""
+        if frame not in self._positions:
+            raise IOError("Frame %s is not in the store %s." % (frame,self.path))
+        start,stop,step = (cells or slice(None)).indices(self.num_cells)
+        position = self._positions[frame]
+        time_chunk,n = divmod(position,self.meta['frames_per_chunk'])
+        size = self.meta['cells_per_chunk']
+        pieces = []
+        for cell_chunk in xrange(start // size,(max(stop,start + 1) - 1) // size + 1):
+            values = self._chunk(field,time_chunk,cell_chunk)
+            offset = cell_chunk * size
+            lower = max(start,offset) - offset
+            upper = min(stop,offset + size) - offset
+            pieces.append(values[n,:,lower:upper])
+        values = np.concatenate(pieces,axis=-1)
+        if step != 1:
+            values = values[...,::step]
+        return values
+
+    def read_q(self,frame,cells=None):
+        r"""Return q of frame, optionally only over the slice cells"""
+        return self._read('q',frame,cells)
+
+    def read_aux(self,frame,cells=None):
+        r"""Return the full aux array of frame, None if no aux was stored"""
+        meta = self.meta
+        if not meta['has_aux']:
+            return None
+        if self._static is None:
+            with np.load(os.path.join(self.path,'static.npz')) as data:
+                self._static = data['aux']
+        varying = self._read('aux',frame,cells)
+        aux = np.empty((meta['num_aux'],varying.shape[-1]))
+        aux[meta['static_aux'],:] = self._static[:,cells or slice(None)]
+        aux[meta['varying_aux'],:] = varying
+        return aux
+
+    def frame_time(self,frame):
+        return self.t[self._positions[frame]]
+
+    def solution(self,frame,read_aux=False):
+        r"""Return frame as a pyclaw Solution"""
+        from clawpack.pyclaw import geometry
+        from clawpack.pyclaw.state import State
+        from clawpack.pyclaw.solution import Solution
+
+        meta = self.meta
+        dimension = geometry.Dimension('x',meta['lower'],meta['upper'],
+                                       meta['num_cells'])
+        domain = geometry.Domain([dimension])
+        num_aux = meta['num_aux'] if read_aux and meta['has_aux'] else 0
+        state = State(domain,meta['num_eqn'],num_aux)
+        state.q = self.read_q(frame)
+        if num_aux > 0:
+            state.aux = self.read_aux(frame)
+        state.problem_data.update(meta['problem_data'])
+        solution = Solution(state,domain)
+        solution.t = self.frame_time(frame)
+        return solution
+
+
+def open_writer(path,solution,**kargs):
+    r"""Create a :class:`RunWriter` for the grid and arrays of solution"""
+    state = solution.state
+    dimension = state.grid.dimensions[0]
+    num_aux = 0 if state.aux is None else state.aux.shape[0]
+    problem_data = dict((key,value) for (key,value)
+                            in state.problem_data.iteritems()
+                            if isinstance(value,(int,float,bool,str,list)))
+    return RunWriter(path,dimension.lower,dimension.upper,dimension.num_cells,
+                     state.q.shape[0],num_aux,problem_data=problem_data,
+                     **kargs)
+
+
+def convert(outdir,store_path=None,file_format='ascii',file_prefix='fort',
+                   **kargs):
+    r"""Convert the frames of the output directory outdir to a store
+
+    The store is written to *store_path*, default the *store* subdirectory
+    of outdir where it is found by :func:`find_store`.  Frames without
+    their own aux file use the last aux array read.  Returns the path of
+    the store.
+    """
+    # Imported here as frames uses this module to read stores
+    from frames import find_frames,read_frame
+
+    if store_path is None:
+        store_path = os.path.join(outdir,store_name)
+    frames = find_frames(outdir,file_prefix,use_store=False)
+    if len(frames) == 0:
+        raise IOError("No frames found in %s." % outdir)
+
+    writer = None
+    aux = None
+    for frame in frames:
+        aux_path = os.path.join(outdir,"%s.a%04d" % (file_prefix,frame))
+        read_aux = aux is None or file_format != 'ascii' \
+                                                or os.path.exists(aux_path)
+        solution = read_frame(frame,outdir,read_aux=read_aux,
+                              file_format=file_format,file_prefix=file_prefix,
+                              use_store=False)
+        if read_aux and solution.state.aux is not None:
+            aux = solution.state.aux
+        if writer is None:
+            writer = open_writer(store_path,solution,**kargs)
+        writer.write(frame,solution.t,solution.state.q,aux)
+    writer.close()
+    return store_path
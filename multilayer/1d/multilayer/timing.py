@@ -0,0 +1,122 @@
+# encoding: utf-8
+
+r"""Opt-in timing of the solver and its Python callbacks
+
+:func:`instrument` wraps the time stepping routines and callbacks of a
+solver so that the number of calls and the total and maximum time of each
+are accumulated in a :class:`CallbackProfile`.  Nested calls are accounted
+for so that the *self* time of a routine excludes the callbacks it calls,
+e.g. the self time of *step* is the time spent in the (Fortran) update and
+boundary handling outside of the Python Riemann solver, boundary conditions
+and source term.  Nothing is wrapped unless :func:`instrument` is called so
+runs that do not ask for a profile are unaffected.
+
+:Available Routines:
+    - :class:`CallbackProfile` - Accumulated timings of wrapped functions
+    - :func:`instrument` - Wrap the routines and callbacks of a solver
+"""
+
+import os
+import json
+import collections
+from timeit import default_timer
+
+# Solver attributes wrapped by instrument, in order of nesting
+solver_routines = ['evolve_to_time','step']
+solver_callbacks = ['before_step','step_source','user_bc_lower',
+                    'user_bc_upper','user_aux_bc_lower','user_aux_bc_upper']
+
+class CallbackProfile(object):
+    r"""Call counts and timings of wrapped functions
+
+    Each entry holds the number of calls, the total and maximum time of a
+    call and the self time, the total time less the time spent in other
+    wrapped functions called from it.
+    """
+
+    def __init__(self):
+        self.stats = collections.OrderedDict()
+        self._children = []
+
+    def wrap(self,name,func):
+        r"""Return func timed under *name*, None is passed through"""
+        if func is None:
+            return None
+        stats = self.stats.setdefault(name,{'calls':0,'total':0.0,
+                                            'self':0.0,'max':0.0})
+        children = self._children
+
+        def timed(*args,**kargs):
+            children.append(0.0)
+            start = default_timer()
+            try:
+                return func(*args,**kargs)
+            finally:
+                elapsed = default_timer() - start
+                nested = children.pop()
+                stats['calls'] += 1
+                stats['total'] += elapsed
+                stats['self'] += elapsed - nested
+                if elapsed > stats['max']:
+                    stats['max'] = elapsed
+                if children:
+                    children[-1] += elapsed
+
+        timed.__name__ = getattr(func,'__name__',name)
+        timed.__doc__ = getattr(func,'__doc__',None)
+        return timed
+
+    def total_time(self):
+        r"""Time spent in all wrapped functions, the sum of the self times"""
+        return sum(stats['self'] for stats in self.stats.itervalues())
+
+    def table(self):
+        r"""Return a text table of the timings"""
+        total = self.total_time()
+        header = "%-20s %10s %12s %12s %12s %12s %7s" % ('callback','calls',
+                            'total (s)','self (s)','mean (s)','max (s)','self %')
+        lines = [header,"-" * len(header)]
+        for (name,stats) in self.stats.iteritems():
+            if stats['calls'] == 0:
+                continue
+            lines.append("%-20s %10d %12.4e %12.4e %12.4e %12.4e %7.2f" % (
+                          name,stats['calls'],stats['total'],stats['self'],
+                          stats['total'] / stats['calls'],stats['max'],
+                          100.0 * stats['self'] / total if total > 0.0 else 0.0))
+        lines.append("-" * len(header))
+        lines.append("%-20s %10s %12s %12.4e" % ('total','','',total))
+        return "\n".join(lines) + "\n"
+
+    def write(self,outdir,comm=None):
+        r"""Write profile.json and profile.txt to outdir
+
+        Under PetClaw each process writes its own timings, suffixed with its
+        rank.
+        """
+        suffix = "" if comm is None else ".%s" % comm.rank
+        with open(os.path.join(outdir,'profile%s.json' % suffix),'w') as out:
+            json.dump(self.stats,out,indent=1)
+        with open(os.path.join(outdir,'profile%s.txt' % suffix),'w') as out:
+            out.write(self.table())
+
+
+def instrument(solver,profile=None):
+    r"""Wrap the time stepping routines and callbacks of solver
+
+    The routines *evolve_to_time* and *step*, the callbacks set on the
+    solver and, if the Python kernels are used, the Riemann solver are
+    replaced by timed versions.  Callbacks that are not set are left alone.
+    Further functions, e.g. a wind provider, can be timed with
+    *profile.wrap*.  Returns the :class:`CallbackProfile`.
+    """
+    if profile is None:
+        profile = CallbackProfile()
+    # PyClaw solvers may refuse attributes they do not define so only
+    # existing ones are replaced
+    for name in solver_routines + solver_callbacks:
+        func = getattr(solver,name,None)
+        if func is not None:
+            setattr(solver,name,profile.wrap(name,func))
+    if getattr(solver,'kernel_language','Fortran') == 'Python':
+        solver.rp = profile.wrap('rp',solver.rp)
+    return profile
@@ -0,0 +1,239 @@
+# encoding: utf-8
+
+r"""Time dependent wind fields for the multi-layer swe computations
+
+Wind providers are callables taking a state that fill the wind field of the
+aux array at *state.t* and so can be passed as the *wind_func* argument of
+:func:`multilayer.step.before_step`.  Each provider writes the wind as a sum
+of a few spatial profiles weighted by time dependent factors
+
+    wind(x,t) = sum_k c_k(t) P_k(x)
+
+The profiles P_k are evaluated once per grid and cached so that setting the
+wind every time step is a multiply-add over the grid instead of evaluating
+transcendental functions in every cell.
+
+:Available Providers:
+    - :class:`SeparableWind` - General low rank wind given functions of x and t
+    - :class:`OscillatoryWind` - Standing oscillatory wind
+    - :class:`TabulatedWind` - Wind interpolated from a (t,x) table
+    - :class:`TrackWind` - Wind of a storm moving along a track
+"""
+
+import numpy as np
+
+from layers import state_layout
+
+class WindProvider(object):
+    r"""Base class for wind providers
+
+    Subclasses implement *profiles(x,L)* returning the spatial profiles
+    P_k at the cell centers *x* of a grid of length *L* as an array of shape
+    (rank,len(x)) and *coefficients(t)* returning the factors c_k(t).
+    """
+
+    def __init__(self):
+        self._profiles = {}
+
+    def profiles(self,x,L):
+        raise NotImplementedError("Wind providers must define profiles.")
+
+    def coefficients(self,t):
+        raise NotImplementedError("Wind providers must define coefficients.")
+
+    def grid_profiles(self,state):
+        r"""Return the cached profiles for the grid of *state*"""
+        dimension = state.grid.dimensions[0]
+        key = (dimension.lower,dimension.upper,dimension.num_cells)
+        if key not in self._profiles:
+            x = dimension.centers
+            L = dimension.upper - dimension.lower
+            self._profiles[key] = np.atleast_2d(self.profiles(x,L))
+        return self._profiles[key]
+
+    def __call__(self,state):
+        r"""Set the wind field of *state* at time *state.t*"""
+        profiles = self.grid_profiles(state)
+        coefficients = np.atleast_1d(self.coefficients(state.t))
+        wind = state_layout(state).wind(state.aux)
+        np.multiply(profiles[0],coefficients[0],out=wind)
+        for k in xrange(1,profiles.shape[0]):
+            if coefficients[k] != 0.0:
+                wind += coefficients[k] * profiles[k]
+
+
+class SeparableWind(WindProvider):
+    r"""Wind given as a sum of products of functions of x and of t
+
+    :Input:
+     - *profile_funcs* (list of func) - Functions of (x,L) giving P_k.
+     - *time_funcs* (list of func) - Functions of t giving c_k.
+    """
+
+    def __init__(self,profile_funcs,time_funcs):
+        super(SeparableWind,self).__init__()
+        if len(profile_funcs) != len(time_funcs):
+            raise ValueError("Number of profiles and time factors differ.")
+        self.profile_funcs = profile_funcs
+        self.time_funcs = time_funcs
+
+    def profiles(self,x,L):
+        return np.array([func(x,L) for func in self.profile_funcs])
+
+    def coefficients(self,t):
+        return np.array([func(t) for func in self.time_funcs])
+
+
+class OscillatoryWind(WindProvider):
+    r"""Oscillatory wind field
+
+        wind = A sin(pi N x / L) sin(2 pi omega t / t_length)
+
+    The same field as :func:`multilayer.aux.set_oscillatory_wind`.
+
+    :Input:
+     - *A* (float)
+     - *N* (float)
+     - *omega* (float)
+     - *t_length* (float)
+    """
+
+    def __init__(self,A=5.0,N=2.0,omega=2.0,t_length=10.0):
+        super(OscillatoryWind,self).__init__()
+        self.A = A
+        self.N = N
+        self.omega = omega
+        self.t_length = t_length
+
+    def profiles(self,x,L):
+        return self.A * np.sin(np.pi * self.N * x / L)
+
+    def coefficients(self,t):
+        return np.sin(2.0 * np.pi * self.omega / self.t_length * t)
+
+
+class TabulatedWind(WindProvider):
+    r"""Wind interpolated linearly in time and space from a table
+
+    The table is interpolated onto each grid once, each time step then only
+    blends the two rows bracketing t.  Outside of the table times the first
+    or last row is used, outside of *x* the wind is *fill_value*.
+
+    :Input:
+     - *t* (ndarray(num_times)) - Increasing table times.
+     - *x* (ndarray(num_points)) - Increasing table locations.
+     - *wind* (ndarray(num_times,num_points)) - Wind at each time and place.
+     - *fill_value* (float) - Wind outside of *x*, default is 0.
+    """
+
+    def __init__(self,t,x,wind,fill_value=0.0):
+        super(TabulatedWind,self).__init__()
+        self.t = np.asarray(t,dtype=float)
+        self.x = np.asarray(x,dtype=float)
+        self.wind = np.asarray(wind,dtype=float)
+        self.fill_value = fill_value
+        if self.wind.shape != (self.t.shape[0],self.x.shape[0]):
+            raise ValueError("Wind table has shape %s, expected %s."
+                    % (self.wind.shape,(self.t.shape[0],self.x.shape[0])))
+
+    def profiles(self,x,L):
+        return np.array([np.interp(x,self.x,row,left=self.fill_value,
+                                                 right=self.fill_value)
+                                                     for row in self.wind])
+
+    def coefficients(self,t):
+        coefficients = np.zeros(self.t.shape[0])
+        if t <= self.t[0]:
+            coefficients[0] = 1.0
+        elif t >= self.t[-1]:
+            coefficients[-1] = 1.0
+        else:
+            i = np.searchsorted(self.t,t) - 1
+            theta = (t - self.t[i]) / (self.t[i+1] - self.t[i])
+            coefficients[i] = 1.0 - theta
+            coefficients[i+1] = theta
+        return coefficients
+
+    def __call__(self,state):
+        r"""Set the wind field of *state* by blending two table rows"""
+        profiles = self.grid_profiles(state)
+        coefficients = self.coefficients(state.t)
+        rows = np.nonzero(coefficients)[0]
+        wind = state_layout(state).wind(state.aux)
+        np.multiply(profiles[rows[0]],coefficients[rows[0]],out=wind)
+        if rows.shape[0] > 1:
+            wind += coefficients[rows[1]] * profiles[rows[1]]
+
+
+class TrackWind(TabulatedWind):
+    r"""Wind of a storm moving along a track
+
+    The storm is given by track records of time, the location of its center
+    along the grid, its maximum wind speed and its radius of maximum wind as
+    in an ATCF best track.  The wind at a distance d from the center is a
+    Rankine vortex
+
+        wind = max_wind * d / radius            for |d| <= radius
+        wind = max_wind * sign(d) (radius / |d|)^decay   otherwise
+
+    which is positive to the right of the center.  The track is resampled at
+    *num_times* times and tabulated at the locations *x* so that each step
+    only blends two profiles as in :class:`TabulatedWind`.
+
+    :Input:
+     - *t*, *x_center*, *max_wind*, *radius* (ndarray) - Track records.
+     - *x* (ndarray) - Locations to tabulate the wind at, usually covering
+       the domain at a resolution finer than the storm radius.
+     - *num_times* (int) - Number of resampled track times, default is to
+       use the track records.
+     - *decay* (float) - Decay exponent outside of the radius, default 0.5.
+    """
+
+    def __init__(self,t,x_center,max_wind,radius,x,num_times=None,decay=0.5):
+        t = np.asarray(t,dtype=float)
+        if num_times is not None:
+            times = np.linspace(t[0],t[-1],num_times)
+        else:
+            times = t
+        self.track = {'t':times,
+                      'x_center':np.interp(times,t,x_center),
+                      'max_wind':np.interp(times,t,max_wind),
+                      'radius':np.interp(times,t,radius)}
+        self.decay = decay
+
+        x = np.asarray(x,dtype=float)
+        d = x[np.newaxis,:] - self.track['x_center'][:,np.newaxis]
+        radius = self.track['radius'][:,np.newaxis] * np.ones(x.shape)
+        inner = np.abs(d) <= radius
+        outer = np.logical_not(inner)
+        wind = np.empty(d.shape)
+        wind[inner] = d[inner] / radius[inner]
+        wind[outer] = np.sign(d[outer]) \
+                            * (radius[outer] / np.abs(d[outer]))**decay
+        wind *= self.track['max_wind'][:,np.newaxis]
+
+        super(TrackWind,self).__init__(times,x,wind)
+
+    @classmethod
+    def from_file(cls,path,x,**kargs):
+        r"""Read a track from a comma separated file
+
+        Each line contains the time, center location, maximum wind speed and
+        radius of maximum wind of a track record, ATCF best track records
+        reduced to a one dimensional transect.  Lines starting with # are
+        ignored.
+        """
+        t,x_center,max_wind,radius = np.loadtxt(path,delimiter=',',
+                                                usecols=(0,1,2,3),unpack=True,
+                                                ndmin=2)
+        return cls(t,x_center,max_wind,radius,x,**kargs)
+
+
+_oscillatory_winds = {}
+
+def get_oscillatory_wind(A=5.0,N=2.0,omega=2.0,t_length=10.0):
+    r"""Return the (cached) :class:`OscillatoryWind` with the given parameters"""
+    key = (A,N,omega,t_length)
+    if key not in _oscillatory_winds:
+        _oscillatory_winds[key] = OscillatoryWind(A,N,omega,t_length)
+    return _oscillatory_winds[key]
@@ -39,9 +39,14 @@ def oscillatory_wind(num_cells,eigen_method,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -57,11 +62,21 @@ def oscillatory_wind(num_cells,eigen_method,**kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
-    # Set the before step functioning including the wind forcing
-    wind_func = lambda state:ml.aux.set_oscillatory_wind(state,
-                                        A=5.0,N=2.0,omega=2.0,t_length=10.0)
+    # Set the before step functioning including the wind forcing, any wind
+    # provider from multilayer.wind such as a TrackWind can be passed in
+    wind_func = kargs.get('wind_func',
+                          ml.wind.OscillatoryWind(A=5.0,N=2.0,omega=2.0,
+                                                  t_length=10.0))
+    # Time the wind along with the solver and its callbacks if asked to
+    profile = None
+    if kargs.get('profile',False):
+        profile = ml.timing.CallbackProfile()
+        wind_func = profile.wrap('wind_func',wind_func)
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,solution,
                                             wind_func=wind_func,raise_on_richardson=True)
                                             
@@ -75,8 +90,9 @@ def oscillatory_wind(num_cells,eigen_method,**kargs):
     
     x = pyclaw.Dimension('x',0.0,1.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -123,12 +139,7 @@ def oscillatory_wind(num_cells,eigen_method,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    try:
-        state = controller.run()
-    except ml.step.RichardsonExceededError as e:
-        print e
-        # print "Writing out last solution available to frame %s." % str(len(controller.frames))
-        # e.solution.write(len(controller.frames),path=controller.outdir,write_aux=True)
+    state = ml.checkpoint.run_driver(controller,kargs,profile=profile)
     
     # ============
     # = Plotting =
@@ -141,6 +152,8 @@ def oscillatory_wind(num_cells,eigen_method,**kargs):
          plotdir=plotdir,htmlplot=kargs.get('htmlplot',False),
          iplot=kargs.get('iplot',False),file_format=controller.output_format,
          **plot_kargs)
+
+    return controller
          
          
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+r"""Plot the surfaces and velocities recorded by the gauges of a run
+
+Reads gauges.bin of an output directory, see multilayer/gauges.py, so that
+no frames are needed.
+"""
+
+import sys
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+
+import multilayer as ml
+
+eta_init = [0.0,-300.0]
+
+def plot_gauges(data_dir="./_output",out_dir='./'):
+    """Plot the surface deviations and velocities of each layer at each gauge"""
+
+    gauges = ml.gauges.read_gauges(data_dir)
+    t = gauges['t'] / 3600.0
+    num_layers = gauges['eta'].shape[1]
+    print "Read %s samples of %s gauges." % (t.shape[0],gauges['x'].shape[0])
+
+    title = ['top','internal']
+    fig = plt.figure(figsize=[10,8])
+    for layer in xrange(num_layers):
+        eta_axes = fig.add_subplot(2,num_layers,layer + 1)
+        u_axes = fig.add_subplot(2,num_layers,num_layers + layer + 1)
+        for (n,x) in enumerate(gauges['x']):
+            label = "%g km" % (x / 1e3)
+            eta_axes.plot(t,gauges['eta'][:,layer,n] - eta_init[layer],
+                          label=label)
+            u_axes.plot(t,gauges['u'][:,layer,n],label=label)
+
+        eta_axes.set_title("Deviation of %s surface" % title[layer])
+        eta_axes.set_ylabel("Meters")
+        u_axes.set_title("Velocity of %s layer" % title[layer])
+        u_axes.set_ylabel("m/s")
+        u_axes.set_xlabel("Hours")
+        eta_axes.legend(loc=1,fontsize=10)
+
+    file_name = os.path.join(out_dir,"gauges.png")
+    print "Writing out to %s" % file_name
+    plt.savefig(file_name)
+
+if __name__=="__main__":
+    if len(sys.argv) > 1:
+        plot_gauges(sys.argv[1])
+    else:
+        for shelf_type in ['jump_shelf','sloped_shelf']:
+            path = os.path.join(os.environ['DATA_PATH'],shelf_type,'ml_e2_n2000_output')
+            out_path = os.path.join(os.environ['DATA_PATH'],shelf_type,'ml_e2_n2000_plots')
+            plot_gauges(path,out_dir=out_path)
@@ -5,58 +5,40 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 
-from clawpack.pyclaw.solution import Solution
-import clawpack.visclaw.data as data
+import multilayer as ml
 
 rho = [1025.0,1045.0]
 eta_init = [0.0,-300.0]
 
-def plot_contour(data_dir="./_output",out_dir='./',num_layers=2,num_frames=1000,ref_lines=[-130e3,-30e3],color=True):
+def plot_contour(data_dir="./_output",out_dir='./',num_layers=2,num_frames=1000,
+                 ref_lines=[-130e3,-30e3],color=True,x_stride=1,t_stride=1,
+                 num_threads=4,memmap_path=None):
     """Plot a contour plot of a shelf based simluation
 
     Note that to get a nice contour you may have to change the number of output
     times a solution is written out in `shelf.py`
+
+    The surfaces are streamed frame by frame into an x-t array, optionally
+    decimated by *x_stride* and *t_stride* and memory mapped to
+    *memmap_path*, so that only a few frames are in memory at once.
     """
     
-    # Create plot data
-    plot_data = data.ClawPlotData()
-    plot_data.outdir = data_dir
-    
     # Read in bathymetry
-    sol = [Solution(0,path=data_dir,read_aux=True)]
-    b = sol[0].state.aux[0,:]
+    b = ml.frames.read_frame(0,data_dir,read_aux=True).state.aux[0,:]
     
-    # Extract x coordinates, this assumes that these do not change through the
-    # simluation (they should not)
-    x = sol[0].state.grid.dimensions[0].centers
+    # Find the frames to plot
+    frames = ml.frames.find_frames(data_dir)[:num_frames]
+    print "Found %s frames to plot." % len(frames)
     
-    # Read in all solutions
+    # Read in the surfaces of each frame
     print "Reading in solutions..."
-    for frame in xrange(1,num_frames):
-        try:
-            sol.append(Solution(frame,path=data_dir))
-        except IOError:
-            # We have reached the last frame before given num_frames reached
-            num_frames = frame - 1
-            break
-    print "Found %s frames to plot." % num_frames
-    
-    # Create plotting arrays
-    print "Constructing plotting variables..."
-    eta = np.ndarray((num_frames,num_layers,len(x)))
-    t = np.ndarray((num_frames))
-    for frame in xrange(num_frames):
-        # Append data to eta and t lists
-        t[frame] = sol[frame].t / 3600.0
-        
-        # Calculate from the bottom up
-        layer_index = 2 * (num_layers-1)
-        eta[frame,num_layers - 1,:] = sol[frame].q[layer_index,:] / rho[-1] + b
-        
-        # Calculate the rest of the layers
-        for layer in xrange(num_layers-2,-1,-1):
-            layer_index = 2 * layer
-            eta[frame,layer,:] = sol[frame].q[layer_index,:] / rho[layer] + eta[frame,layer+1,:]
+    layout = ml.layers.get_layout(num_layers)
+    surfaces = lambda sol:layout.surfaces(sol.q,b,rho[:num_layers])
+    t,x,eta = ml.frames.build_hovmoller(data_dir,surfaces,frames=frames,
+                                        x_stride=x_stride,t_stride=t_stride,
+                                        out_path=memmap_path,
+                                        num_threads=num_threads)
+    t /= 3600.0
     
     # Create mesh grid for plot
     X,T = np.meshgrid(x,t)
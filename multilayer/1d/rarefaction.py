@@ -3,6 +3,7 @@
 
 r""" Run the suite of tests for the 1d two-layer equations"""
 
+
 from clawpack.riemann import layered_shallow_water_1D
 import clawpack.clawutil.runclaw as runclaw
 from clawpack.pyclaw.plot import plot
@@ -44,9 +45,14 @@ def rarefaction(num_cells,eigen_method,entropy_fix,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method,entropy_fix)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -58,7 +64,10 @@ def rarefaction(num_cells,eigen_method,entropy_fix,**kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step function
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,solution)
@@ -74,8 +83,9 @@ def rarefaction(num_cells,eigen_method,entropy_fix,**kargs):
     
     x = pyclaw.Dimension('x',0.0,1.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -136,7 +146,7 @@ def rarefaction(num_cells,eigen_method,entropy_fix,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    state = ml.checkpoint.run_driver(controller,kargs)
     
     
     # ============
@@ -148,5 +158,7 @@ def rarefaction(num_cells,eigen_method,entropy_fix,**kargs):
          htmlplot=kargs.get('htmlplot',False),iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
 if __name__ == "__main__":
     rarefaction(100,2,False,iplot=False,htmlplot=True)
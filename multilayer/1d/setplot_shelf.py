@@ -30,9 +30,6 @@ matplotlib.rcParams['savefig.dpi'] = 300
 # Need to do this after the above
 import matplotlib.pyplot as mpl
 
-from clawpack.pyclaw.solution import Solution
-
-from multilayer.aux import bathy_index,kappa_index,wind_index
 import multilayer.plot as plot
 
 # matplotlib.rcParams['figure.figsize'] = [6.0,10.0]
@@ -45,55 +42,43 @@ def setplot(plotdata,eta=[0.0,-300.0],rho=[1025.0,1045.0],g=9.81,dry_tolerance=1
     
     """
     
-    # Fetch bathymetry once
-    b = Solution(0,path=plotdata.outdir,read_aux=True).state.aux[bathy_index,:]
+    # Derived fields are computed once per frame and shared by all plots
+    fields = plot.FrameFields(plotdata,rho,dry_tolerance)
     
     # ========================================================================
     #  Plot variable functions
     def bathy(cd):
-        return b
+        return fields.bathy(cd)
 
     def kappa(cd):
-        return Solution(cd.frameno,path=plotdata.outdir,read_aux=True).state.aux[kappa_index,:]
+        return fields.kappa(cd)
 
     def wind(cd):
-        return Solution(cd.frameno,path=plotdata.outdir,read_aux=True).state.aux[wind_index,:]
+        return fields.wind(cd)
     
     def h_1(cd):
-        return cd.q[0,:] / rho[0]
+        return fields.h(cd,0)
     
     def h_2(cd):
-        return cd.q[2,:] / rho[1]
+        return fields.h(cd,1)
         
     def eta_2(cd):
-        return h_2(cd) + bathy(cd)
+        return fields.eta(cd,1)
         
     def eta_1(cd):
-        return h_1(cd) + eta_2(cd)
+        return fields.eta(cd,0)
         
     def u_1(cd):
-        index = np.nonzero(h_1(cd) > dry_tolerance)
-        u_1 = np.zeros(h_1(cd).shape)
-        u_1[index] = cd.q[1,index] / cd.q[0,index]
-        return u_1
+        return fields.u(cd,0)
         
     def u_2(cd):
-        index = np.nonzero(h_2(cd) > dry_tolerance)
-        u_2 = np.zeros(h_2(cd).shape)
-        u_2[index] = cd.q[3,index] / cd.q[2,index]
-        return u_2
+        return fields.u(cd,1)
         
     def hu_1(cd):
-        index = np.nonzero(h_1(cd) > dry_tolerance)
-        hu_1 = np.zeros(h_1(cd).shape)
-        hu_1[index] = cd.q[1,index] / rho[0]
-        return hu_1
+        return fields.hu(cd,0)
         
     def hu_2(cd):
-        index = np.nonzero(h_2(cd) > dry_tolerance)
-        hu_2 = np.zeros(h_2(cd).shape)
-        hu_2[index] = cd.q[3,index] / rho[1]
-        return hu_2
+        return fields.hu(cd,1)
             
     # ========================================================================
     #  Labels    
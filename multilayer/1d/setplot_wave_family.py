@@ -31,9 +31,6 @@ matplotlib.rcParams['savefig.dpi'] = 100
 # Need to do this after the above
 import matplotlib.pyplot as mpl
 
-from clawpack.pyclaw.solution import Solution
-
-from multilayer.aux import bathy_index,kappa_index,wind_index
 import multilayer.plot as plot
 
 # matplotlib.rcParams['figure.figsize'] = [6.0,10.0]
@@ -51,41 +48,35 @@ def setplot(plotdata,wave_family,rho,dry_tolerance):
     
     """
     
-    # Load bathymetry
-    b = Solution(0,path=plotdata.outdir,read_aux=True).state.aux[bathy_index,:]
+    # Derived fields are computed once per frame and shared by all plots
+    fields = plot.FrameFields(plotdata,rho,dry_tolerance)
 
     def bathy(cd):
-        return b
+        return fields.bathy(cd)
     
     def kappa(cd):
-        return Solution(cd.frameno,path=plotdata.outdir,read_aux=True).state.aux[kappa_index,:]
+        return fields.kappa(cd)
 
     def wind(cd):
-        return Solution(cd.frameno,path=plotdata.outdir,read_aux=True).state.aux[wind_index,:]
+        return fields.wind(cd)
     
     def h_1(cd):
-        return cd.q[0,:] / rho[0]
+        return fields.h(cd,0)
     
     def h_2(cd):
-        return cd.q[2,:] / rho[1]
+        return fields.h(cd,1)
         
     def eta_2(cd):
-        return h_2(cd) + bathy(cd)
+        return fields.eta(cd,1)
         
     def eta_1(cd):
-        return h_1(cd) + eta_2(cd)
+        return fields.eta(cd,0)
         
     def u_1(cd):
-        index = np.nonzero(h_1(cd) > dry_tolerance)
-        u_1 = np.zeros(h_1(cd).shape)
-        u_1[index] = cd.q[1,index] / cd.q[0,index]
-        return u_1
+        return fields.u(cd,0)
         
     def u_2(cd):
-        index = np.nonzero(h_2(cd) > dry_tolerance)
-        u_2 = np.zeros(h_2(cd).shape)
-        u_2[index] = cd.q[3,index] / cd.q[2,index]
-        return u_2
+        return fields.u(cd,1)
     
     
     def jump_afteraxes(current_data):
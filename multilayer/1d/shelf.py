@@ -5,12 +5,31 @@ r"""Runs idealized jump and sloped 1d shelf tests"""
 
 import sys
 
+import numpy
+
 from clawpack.riemann import layered_shallow_water_1D
 import clawpack.clawutil.runclaw as runclaw
 from clawpack.pyclaw.plot import plot
 
 import multilayer as ml
         
+def output_scheduler(controller,probes,**kargs):
+    r"""Scheduler writing the frames of the shelf tests when they change
+
+    The surfaces, kappa and the momentum on the shelf are monitored, frames
+    are written at most as often as the controller's output times and at
+    least every tenth of the run.  The surfaces are probed at *probes*.
+    """
+    monitors = [ml.schedule.SurfaceChange(0,kargs.get('eta_threshold',0.05)),
+                ml.schedule.SurfaceChange(1,kargs.get('interface_threshold',0.25)),
+                ml.schedule.MaxKappa(kargs.get('kappa_threshold',2e-4)),
+                ml.schedule.WindowMomentum(max(probes),0.0,
+                                    kargs.get('momentum_threshold',4e3))]
+    return ml.schedule.OutputScheduler(monitors,
+                    min_interval=controller.tfinal / controller.num_output_times,
+                    max_interval=controller.tfinal / 10.0,probes=probes)
+
+
 def jump_shelf(num_cells,eigen_method,**kargs):
     r"""Shelf test"""
 
@@ -41,9 +60,14 @@ def jump_shelf(num_cells,eigen_method,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -57,7 +81,10 @@ def jump_shelf(num_cells,eigen_method,**kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step function
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,
@@ -74,8 +101,9 @@ def jump_shelf(num_cells,eigen_method,**kargs):
     
     x = pyclaw.Dimension('x',-400e3,0.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -124,7 +152,12 @@ def jump_shelf(num_cells,eigen_method,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    # Write frames when the solution changes instead of every output time
+    scheduler = None
+    if kargs.get('adaptive_output',False):
+        scheduler = output_scheduler(controller,[-130e3,-30e3],**kargs)
+    state = ml.checkpoint.run_driver(controller,kargs,scheduler=scheduler,
+                                     default_gauges=[-130e3,-30e3])
     
     # ============
     # = Plotting =
@@ -138,6 +171,100 @@ def jump_shelf(num_cells,eigen_method,**kargs):
          htmlplot=kargs.get('htmlplot',False),iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
+
+def jump_shelf_ensemble(num_cells,epsilons,**kargs):
+    r"""Jump shelf test for a number of perturbation amplitudes at once
+
+    Runs :func:`jump_shelf` with the Python Riemann solver for every
+    amplitude in *epsilons* as one :class:`multilayer.ensemble.EnsembleState`
+    sharing the time step.  The frames of member k are written to the store
+    in *member_k/store* of the output directory.  Returns the solver.
+    """
+
+    eigen_method = kargs.get('eigen_method',2)
+
+    # Construct output and plot directory paths
+    prefix = 'ml_e%s_n%s_m%s' % (eigen_method,num_cells,len(epsilons))
+    name = 'multilayer/jump_shelf_ensemble'
+    outdir,plotdir,log_path = runclaw.create_output_paths(name,prefix,**kargs)
+
+    import clawpack.pyclaw as pyclaw
+
+    # =================
+    # = Create Solver =
+    # =================
+    solver = ml.ensemble.EnsembleSolver(ml.riemann.layered_shallow_water_1D,
+                                        num_waves=4)
+    solver.cfl_desired = 0.9
+    solver.cfl_max = 1.0
+    solver.max_steps = kargs.get('max_steps',5000)
+    solver.limiters = 3
+
+    # Use wall boundary condition at beach
+    solver.bc_lower[0] = 1
+    solver.bc_upper[0] = 0
+    solver.user_bc_upper = ml.bc.wall_qbc_upper
+    solver.aux_bc_lower[0] = 1
+    solver.aux_bc_upper[0] = 1
+
+    solver.before_step = lambda solver,solution:ml.step.before_step(solver,
+                                                                    solution)
+    solver.step_source = ml.step.friction_source
+
+    # ============================
+    # = Create Initial Condition =
+    # ============================
+    num_layers = 2
+
+    x = pyclaw.Dimension('x',-400e3,0.0,num_cells)
+    domain = pyclaw.Domain([x])
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
+
+    # Set physics data
+    state.problem_data['g'] = 9.8
+    state.problem_data['manning'] = 0.0
+    state.problem_data['rho_air'] = 1.15
+    state.problem_data['rho'] = [1025.0,1045.0]
+    state.problem_data['r'] = state.problem_data['rho'][0] / state.problem_data['rho'][1]
+    state.problem_data['one_minus_r'] = 1.0 - state.problem_data['r']
+    state.problem_data['num_layers'] = num_layers
+
+    # Set method parameters
+    state.problem_data['eigen_method'] = eigen_method
+    state.problem_data['dry_tolerance'] = 1e-3
+    state.problem_data['inundation_method'] = 2
+    state.problem_data['entropy_fix'] = False
+
+    # The aux arrays are shared by the members and set on a single state
+    ml.aux.set_jump_bathymetry(state,-30e3,[-4000.0,-100.0])
+    ml.aux.set_no_wind(state)
+    ml.aux.set_h_hat(state,0.5,[0.0,-300.0],[0.0,-300.0])
+
+    # Perturb each member with its own amplitude
+    ensemble = ml.ensemble.EnsembleState.from_state(state,len(epsilons))
+    ml.qinit.set_acta_numerica_init_condition(ensemble,
+                                    ml.ensemble.member_values(epsilons))
+
+    # ==================
+    # = Run Simulation =
+    # ==================
+    if kargs.get('profile',False):
+        profile = ml.timing.instrument(solver)
+    out_times = numpy.linspace(0.0,kargs.get('tfinal',7200.0),
+                               kargs.get('num_output_times',300) + 1)
+    solver.run(ensemble,out_times,
+               writers=ml.ensemble.open_member_writers(outdir,ensemble))
+
+    ml.step.get_workspace(solver,ensemble).write_logs(outdir)
+    if kargs.get('profile',False):
+        profile.write(outdir)
+
+    return solver
+
          
 def sloped_shelf(num_cells,eigen_method,**kargs):
     r"""Shelf test"""
@@ -170,9 +297,14 @@ def sloped_shelf(num_cells,eigen_method,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -186,7 +318,10 @@ def sloped_shelf(num_cells,eigen_method,**kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step function
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,solution)
@@ -202,8 +337,9 @@ def sloped_shelf(num_cells,eigen_method,**kargs):
     
     x = pyclaw.Dimension('x',-400e3,0.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -253,7 +389,12 @@ def sloped_shelf(num_cells,eigen_method,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    # Write frames when the solution changes instead of every output time
+    scheduler = None
+    if kargs.get('adaptive_output',False):
+        scheduler = output_scheduler(controller,[x0,x1],**kargs)
+    state = ml.checkpoint.run_driver(controller,kargs,scheduler=scheduler,
+                                     default_gauges=[x0,x1])
     
     
     # ============
@@ -268,6 +409,8 @@ def sloped_shelf(num_cells,eigen_method,**kargs):
          htmlplot=kargs.get('htmlplot',False),iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
 
 if __name__ == "__main__":
     # Run the test for the requested eigen methods for the jump and slope bathys
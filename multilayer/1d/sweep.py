@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+r"""Run a parameter sweep of the multilayer experiments in parallel
+
+A sweep is a list of cases, each a driver such as *wave_family* and the
+arguments it is called with.  The cases are run in a process pool and a
+record of each finished case is kept in *sweep_dir* under a hash of the
+driver name and its parameters.  Each case writes to its own output
+directory, *sweep_dir/<hash>* unless an *outdir* is one of its parameters,
+and its record keeps the size and hash of every file written there.  Cases
+whose record exists, matches the parameters and whose output files are
+unchanged are skipped so that an interrupted or extended sweep only runs
+what is missing.  A summary table
+of the wall time and number of steps of every case is written to
+*sweep_dir/summary.txt*.
+
+Run as a script this regenerates the runs needed by method_comparison.py,
+optionally with the number of worker processes as the first argument.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import itertools
+import traceback
+import multiprocessing
+
+# Drivers available to the sweep, name: (module, function)
+drivers = {'jump_shelf':('shelf','jump_shelf'),
+           'sloped_shelf':('shelf','sloped_shelf'),
+           'wave_family':('wave_family','wave_family'),
+           'dry_state':('dry_state','dry_state'),
+           'rarefaction':('rarefaction','rarefaction'),
+           'smooth_test':('well_balanced','smooth_test'),
+           'jump_test':('well_balanced','jump_test'),
+           'internal_lapping':('internal_lapping','internal_lapping'),
+           'oscillatory_wind':('oscillatory','oscillatory_wind')}
+
+def expand_grid(driver,**parameters):
+    r"""Expand lists of parameter values into a list of cases
+
+    Every keyword argument given as a list or tuple is swept over, all other
+    values are passed on unchanged, e.g.
+
+        expand_grid('wave_family',num_cells=[64,128],eigen_method=[1,2],
+                    wave_family=3,dry_state=False)
+
+    gives four cases.
+    """
+    if driver not in drivers:
+        raise ValueError("Unknown driver %s, available drivers are %s."
+                                                % (driver,drivers.keys()))
+    names = sorted(parameters.keys())
+    values = [parameters[name] if isinstance(parameters[name],(list,tuple))
+                               else [parameters[name]] for name in names]
+    return [(driver,dict(zip(names,combination)))
+                                for combination in itertools.product(*values)]
+
+
+def case_hash(driver,parameters):
+    r"""Hash identifying a case by its driver and parameters"""
+    content = json.dumps({'driver':driver,'parameters':parameters},
+                         sort_keys=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def case_paths(sweep_dir,driver,parameters):
+    r"""Return the output, plot and log paths of a case
+
+    The paths given in *parameters* as *outdir*, *plotdir* and *logdir* are
+    used, by default they are in *sweep_dir/<hash>*.
+    """
+    case_dir = os.path.join(sweep_dir,case_hash(driver,parameters))
+    return (os.path.abspath(parameters.get('outdir',
+                                    os.path.join(case_dir,'output'))),
+            os.path.abspath(parameters.get('plotdir',
+                                    os.path.join(case_dir,'plots'))),
+            os.path.abspath(parameters.get('logdir',
+                                    os.path.join(case_dir,'log.txt'))))
+
+
+def output_manifest(outdir):
+    r"""Return the size and sha1 hash of every file in outdir
+
+    :Output:
+     - (dict) - [size,hash] of each file by its path relative to outdir.
+    """
+    manifest = {}
+    for (dir_path,dir_names,file_names) in os.walk(outdir):
+        for file_name in file_names:
+            path = os.path.join(dir_path,file_name)
+            manifest[os.path.relpath(path,outdir)] = [os.path.getsize(path),
+                                                      _file_hash(path)]
+    return manifest
+
+
+def _file_hash(path,block_size=2**20):
+    digest = hashlib.sha1()
+    with open(path,'rb') as data_file:
+        for block in iter(lambda:data_file.read(block_size),b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_matches(outdir,manifest):
+    r"""Whether the files of manifest are in outdir and unchanged"""
+    paths = [os.path.join(outdir,name) for name in manifest]
+    if not all(os.path.isfile(path) for path in paths):
+        return False
+    # Compare the sizes before hashing any of the files
+    if any(os.path.getsize(path) != manifest[name][0]
+                for (path,name) in zip(paths,manifest)):
+        return False
+    return all(_file_hash(path) == manifest[name][1]
+                for (path,name) in zip(paths,manifest))
+
+
+def read_record(sweep_dir,driver,parameters):
+    r"""Return the record of a finished case or None if it needs to be run
+
+    A record is only returned if the output files it lists are unchanged.
+    """
+    path = os.path.join(sweep_dir,'%s.json' % case_hash(driver,parameters))
+    if not os.path.exists(path):
+        return None
+    with open(path,'r') as record_file:
+        record = json.load(record_file)
+    if record['driver'] != driver or record['parameters'] != parameters:
+        return None
+    if record.get('manifest') is None:
+        return None
+    if not _manifest_matches(record['outdir'],record['manifest']):
+        return None
+    return record
+
+
+def run_case(args):
+    r"""Run a single case, called in the worker processes
+
+    Returns the record of the case, failures are returned with status
+    *failed* and the traceback instead of being raised so that one case does
+    not bring down the sweep.
+    """
+    driver,parameters,sweep_dir = args
+    outdir,plotdir,log_path = case_paths(sweep_dir,driver,parameters)
+    record = {'driver':driver,'parameters':parameters,
+              'hash':case_hash(driver,parameters),'outdir':outdir,
+              'manifest':None,'steps':None,'wall_time':None,
+              'status':'failed'}
+
+    start = time.time()
+    try:
+        module_name,function_name = drivers[driver]
+        module = __import__(module_name)
+        kargs = dict(parameters)
+        kargs.setdefault('iplot',False)
+        kargs.setdefault('htmlplot',False)
+        kargs.update(outdir=outdir,plotdir=plotdir,logdir=log_path)
+        controller = getattr(module,function_name)(**kargs)
+    except Exception:
+        record['wall_time'] = time.time() - start
+        record['error'] = traceback.format_exc()
+        return record
+    record['wall_time'] = time.time() - start
+
+    record['status'] = 'done'
+    if controller is not None:
+        record['steps'] = _num_steps(controller)
+    record['manifest'] = output_manifest(outdir)
+    path = os.path.join(sweep_dir,'%s.json' % record['hash'])
+    with open(path,'w') as record_file:
+        json.dump(record,record_file,sort_keys=True,indent=1)
+    return record
+
+
+def _num_steps(controller):
+    r"""Number of time steps taken by the solver of controller"""
+    status = getattr(controller.solver,'status',None)
+    if status is not None and 'numsteps' in status:
+        return int(status['numsteps'])
+    workspace = getattr(controller.solver,'workspace',None)
+    if workspace is not None:
+        return workspace.num_steps
+    return None
+
+
+def run_sweep(cases,sweep_dir='./_sweep',num_workers=None,force=False):
+    r"""Run cases in a process pool, skipping those already done
+
+    :Input:
+     - *cases* (list) - Cases as returned by :func:`expand_grid`.
+     - *sweep_dir* (path) - Directory for the case records and summary.
+     - *num_workers* (int) - Number of processes, default is the number of
+       cores.
+     - *force* (bool) - Rerun cases even if a matching record exists.
+
+    :Output:
+     - (list) - Record of each case in the order of *cases*.
+    """
+    if not os.path.exists(sweep_dir):
+        os.makedirs(sweep_dir)
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+
+    # Cases running at the same time must not write to the same directory
+    outdirs = {}
+    for (driver,parameters) in cases:
+        outdir = case_paths(sweep_dir,driver,parameters)[0]
+        if outdir in outdirs and outdirs[outdir] != (driver,parameters):
+            raise ValueError("Cases %s and %s both write to %s." % (
+                                outdirs[outdir],(driver,parameters),outdir))
+        outdirs[outdir] = (driver,parameters)
+
+    records = [None] * len(cases)
+    pending = []
+    for (n,(driver,parameters)) in enumerate(cases):
+        record = None if force else read_record(sweep_dir,driver,parameters)
+        if record is None:
+            pending.append(n)
+        else:
+            record['status'] = 'skipped'
+            records[n] = record
+
+    # Start the largest cases first so the workers stay busy at the end
+    pending.sort(key=lambda n:-cases[n][1].get('num_cells',0))
+
+    print "Running %s of %s cases with %s workers" % (len(pending),len(cases),
+                                                      num_workers)
+    jobs = [(cases[n][0],cases[n][1],sweep_dir) for n in pending]
+    if num_workers > 1 and len(jobs) > 1:
+        # Each worker only runs one case so that the loggers and Fortran
+        # state set up by a driver do not leak into the next case
+        pool = multiprocessing.Pool(num_workers,maxtasksperchild=1)
+        try:
+            results = pool.map(run_case,jobs,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [run_case(job) for job in jobs]
+    for (n,record) in zip(pending,results):
+        records[n] = record
+        if record['status'] == 'failed':
+            print "Case %s %s failed:" % (record['driver'],record['parameters'])
+            print record['error']
+
+    summary = make_summary(records)
+    with open(os.path.join(sweep_dir,'summary.txt'),'w') as summary_file:
+        summary_file.write(summary)
+    print summary
+    return records
+
+
+def make_summary(records):
+    r"""Create a text table of the wall time and steps of each case"""
+    names = sorted(set(itertools.chain(*[record['parameters'].keys()
+                                                    for record in records])))
+    header = ['driver'] + names + ['status','steps','wall_time']
+    rows = []
+    for record in records:
+        row = [record['driver']]
+        row += [str(record['parameters'].get(name,'')) for name in names]
+        row.append(record['status'])
+        row.append('' if record['steps'] is None else str(record['steps']))
+        row.append('' if record['wall_time'] is None
+                      else "%.2f" % record['wall_time'])
+        rows.append(row)
+
+    widths = [max([len(header[i])] + [len(row[i]) for row in rows])
+                                                for i in xrange(len(header))]
+    lines = [" ".join(entry.rjust(widths[i]) for (i,entry) in enumerate(row))
+                                                    for row in [header] + rows]
+    total = sum(record['wall_time'] for record in records
+                    if record['status'] != 'skipped'
+                       and record['wall_time'] is not None)
+    lines.append("Total wall time of cases run: %.2f s" % total)
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        num_workers = int(sys.argv[1])
+    else:
+        num_workers = None
+
+    # Convergence runs used by method_comparison.py
+    resolutions = [64,128,256,512,1024]
+    eigen_methods = [1,2,3,4]
+    cases = []
+    for family in [3,4]:
+        for dry_state in [False,True]:
+            cases += expand_grid('wave_family',num_cells=resolutions,
+                                 eigen_method=eigen_methods,wave_family=family,
+                                 dry_state=dry_state)
+            cases += expand_grid('wave_family',num_cells=5000,eigen_method=4,
+                                 wave_family=family,dry_state=dry_state)
+
+    # Write the runs where the drivers would so method_comparison.py finds them
+    data_path = os.environ.get('DATA_PATH',os.getcwd())
+    for (driver,parameters) in cases:
+        test_path = os.path.join(data_path,'multilayer','%s_wave_%s' % (
+                                    'dry' if parameters['dry_state'] else 'wet',
+                                    parameters['wave_family']))
+        prefix = 'ml_e%s_n%s' % (parameters['eigen_method'],
+                                 parameters['num_cells'])
+        parameters['outdir'] = os.path.join(test_path,'%s_output' % prefix)
+        parameters['plotdir'] = os.path.join(test_path,'%s_plots' % prefix)
+        parameters['logdir'] = os.path.join(test_path,'%s_log.txt' % prefix)
+
+    run_sweep(cases,num_workers=num_workers)
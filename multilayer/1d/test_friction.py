@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+r"""Regression tests of the friction source term against a per cell loop
+
+Run with py.test from this directory.
+"""
+
+import numpy as np
+
+import clawpack.pyclaw as pyclaw
+
+import multilayer as ml
+
+dt = 0.01
+manning = 0.025
+dry_tolerance = 1e-3
+
+
+def friction_reference(q,rho,g,manning,dt,dry_tolerance):
+    r"""Friction applied one cell at a time to the bottom most wet layer"""
+    q = q.copy()
+    num_layers = len(rho)
+    for i in xrange(q.shape[1]):
+        for layer in xrange(num_layers - 1,-1,-1):
+            h = q[2 * layer,i] / rho[layer]
+            if h >= dry_tolerance:
+                u = q[2 * layer + 1,i] / q[2 * layer,i]
+                dgamma = 1.0 + dt * g * manning**2 * abs(u) / h**(4.0/3.0)
+                q[2 * layer + 1,i] = q[2 * layer + 1,i] / dgamma
+                break
+    return q
+
+
+def make_state(num_layers,num_cells=300,seed=0):
+    r"""State with wet, dry and partially dry cells
+
+    The cells cycle through all layers wet, only the bottom layer wet, only
+    the top layers wet, every layer dry and layers just around the dry
+    tolerance.
+    """
+    rho = list(np.linspace(0.9,1.0,num_layers))
+    x = pyclaw.Dimension('x',0.0,1.0,num_cells)
+    domain = pyclaw.Domain([x])
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    state.problem_data['g'] = 9.8
+    state.problem_data['manning'] = manning
+    state.problem_data['rho'] = rho
+    state.problem_data['dry_tolerance'] = dry_tolerance
+    state.problem_data['num_layers'] = num_layers
+
+    random = np.random.RandomState(seed)
+    h = random.uniform(0.1,2.0,(num_layers,num_cells))
+    h[:,1::5] = 0.0
+    h[:-1,2::5] = 0.0
+    h[-1,3::5] = 0.0
+    h[:,4::5] = dry_tolerance * random.choice([0.5,1.0,2.0],
+                                             (num_layers,h[:,4::5].shape[1]))
+    u = random.normal(0.0,1.0,(num_layers,num_cells))
+    for layer in xrange(num_layers):
+        state.q[2 * layer,:] = rho[layer] * h[layer,:]
+        state.q[2 * layer + 1,:] = rho[layer] * h[layer,:] * u[layer,:]
+    return state
+
+
+def test_classic():
+    for num_layers in (1,2,3):
+        state = make_state(num_layers)
+        q = state.q.copy()
+        expected = friction_reference(q,state.problem_data['rho'],
+                                      state.problem_data['g'],manning,dt,
+                                      dry_tolerance)
+        ml.step.friction_source(pyclaw.ClawSolver1D(),state,dt)
+        np.testing.assert_allclose(state.q,expected,rtol=1e-14,atol=0.0)
+
+
+def test_sharpclaw():
+    for num_layers in (1,2,3):
+        state = make_state(num_layers)
+        q = state.q.copy()
+        expected = friction_reference(q,state.problem_data['rho'],
+                                      state.problem_data['g'],manning,dt,
+                                      dry_tolerance)
+        dq = ml.step.friction_source(pyclaw.SharpClawSolver1D(),state,dt)
+        np.testing.assert_array_equal(state.q,q)
+        np.testing.assert_allclose(q + dq,expected,rtol=1e-14,atol=0.0)
+
+
+def test_no_friction():
+    state = make_state(2)
+    state.problem_data['manning'] = 0.0
+    q = state.q.copy()
+    ml.step.friction_source(pyclaw.ClawSolver1D(),state,dt)
+    np.testing.assert_array_equal(state.q,q)
+    dq = ml.step.friction_source(pyclaw.SharpClawSolver1D(),state,dt)
+    np.testing.assert_array_equal(dq,np.zeros(q.shape))
@@ -44,9 +44,14 @@ def wave_family(num_cells,eigen_method,wave_family,dry_state=True,**kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -58,7 +63,10 @@ def wave_family(num_cells,eigen_method,wave_family,dry_state=True,**kargs):
     solver.aux_bc_upper[0] = 1
 
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step functioning including the wind forcing
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,solution)
@@ -74,8 +82,9 @@ def wave_family(num_cells,eigen_method,wave_family,dry_state=True,**kargs):
     
     x = pyclaw.Dimension('x',0.0,1.0,num_cells)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -130,7 +139,7 @@ def wave_family(num_cells,eigen_method,wave_family,dry_state=True,**kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    state = ml.checkpoint.run_driver(controller,kargs)
     
     # ============
     # = Plotting =
@@ -142,6 +151,8 @@ def wave_family(num_cells,eigen_method,wave_family,dry_state=True,**kargs):
          htmlplot=kargs.get('htmlplot',False),iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
 
 if __name__ == "__main__":
     # Run the test for the 3rd and 4th wave families for each eigen method
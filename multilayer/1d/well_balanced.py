@@ -42,9 +42,14 @@ def smooth_test(eigen_method, dry=False, **kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -57,7 +62,10 @@ def smooth_test(eigen_method, dry=False, **kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step function
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,
@@ -74,8 +82,9 @@ def smooth_test(eigen_method, dry=False, **kargs):
     
     x = pyclaw.Dimension('x',0.0,10.0,200)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -117,7 +126,7 @@ def smooth_test(eigen_method, dry=False, **kargs):
     # Output parameters
     controller.output_style = 1
     controller.tfinal = 10.0
-    controller.num_output_times = 1
+    controller.num_output_times = kargs.get('num_output_times',1)
     controller.write_aux_init = True
     controller.outdir = outdir
     controller.write_aux = True
@@ -125,7 +134,7 @@ def smooth_test(eigen_method, dry=False, **kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    state = ml.checkpoint.run_driver(controller,kargs)
     
     # ============
     # = Plotting =
@@ -137,6 +146,8 @@ def smooth_test(eigen_method, dry=False, **kargs):
          iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
 
 def jump_test(eigen_method, dry=False, **kargs):
     r"""Bathymetry with jump discontinuity"""
@@ -168,9 +179,14 @@ def jump_test(eigen_method, dry=False, **kargs):
     # Solver method parameters
     solver.cfl_desired = 0.9
     solver.cfl_max = 1.0
-    solver.max_steps = 5000
+    solver.max_steps = kargs.get('max_steps',5000)
     solver.fwave = True
-    solver.kernel_language = 'Fortran'
+    # The hybrid eigen method is only available in the Python Riemann solver
+    if eigen_method == ml.riemann.HYBRID:
+        solver.kernel_language = kargs.get('kernel_language','Python')
+    else:
+        solver.kernel_language = kargs.get('kernel_language','Fortran')
+    ml.riemann.check_options(solver.kernel_language,eigen_method)
     solver.num_waves = 4
     solver.limiters = 3
     solver.source_split = 1
@@ -183,7 +199,10 @@ def jump_test(eigen_method, dry=False, **kargs):
     solver.aux_bc_upper[0] = 1
     
     # Set the Riemann solver
-    solver.rp = riemann.layered_shallow_water_1D
+    if solver.kernel_language == 'Fortran':
+        solver.rp = layered_shallow_water_1D
+    else:
+        solver.rp = ml.riemann.layered_shallow_water_1D
 
     # Set the before step function
     solver.before_step = lambda solver,solution:ml.step.before_step(solver,
@@ -200,8 +219,9 @@ def jump_test(eigen_method, dry=False, **kargs):
     
     x = pyclaw.Dimension('x',0.0,10.0,200)
     domain = pyclaw.Domain([x])
-    state = pyclaw.State(domain,2*num_layers,3+num_layers)
-    state.aux[ml.aux.kappa_index,:] = 0.0
+    layout = ml.layers.get_layout(num_layers)
+    state = pyclaw.State(domain,layout.num_eqn,layout.num_aux)
+    layout.kappa(state.aux)[...] = 0.0
 
     # Set physics data
     state.problem_data['g'] = 9.8
@@ -243,7 +263,7 @@ def jump_test(eigen_method, dry=False, **kargs):
     # Output parameters
     controller.output_style = 1
     controller.tfinal = 10.0
-    controller.num_output_times = 1
+    controller.num_output_times = kargs.get('num_output_times',1)
     controller.write_aux_init = True
     controller.outdir = outdir
     controller.write_aux = True
@@ -251,7 +271,7 @@ def jump_test(eigen_method, dry=False, **kargs):
     # ==================
     # = Run Simulation =
     # ==================
-    state = controller.run()
+    state = ml.checkpoint.run_driver(controller,kargs)
     
     # ============
     # = Plotting =
@@ -263,6 +283,8 @@ def jump_test(eigen_method, dry=False, **kargs):
          iplot=kargs.get('iplot',False),
          file_format=controller.output_format,**plot_kargs)
 
+    return controller
+
 
 if __name__ == "__main__":
     # Run the test for the requested eigen methods for the jump and slope bathys
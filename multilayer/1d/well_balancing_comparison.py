@@ -1,61 +1,107 @@
 #!/usr/bin/env python
 
-r"""Script for computing the error due to a non-well-balanced method"""
+r"""Script for computing the error due to a non-well-balanced method
+
+The error against the steady state is computed for every output frame of a
+run so that the growth of spurious oscillations can be followed in time.
+The steady state only depends on the bathymetry and is computed once per
+bathymetry, the frames are then read in parallel and reduced to their errors
+in all of the norms.  Each run gets a table of the errors of every frame
+written to *well_balancing_errors.txt* in its output directory.
+"""
 
 import os
+import hashlib
 
 import numpy
 
-import clawpack.pyclaw.solution as solution
+import multilayer as ml
 
 # Parameters
 sea_level = 0.0
+norms = [1,2,numpy.inf]
+norm_labels = {1:'L1',2:'L2',numpy.inf:'Linf'}
+error_labels = ['h_1','hu_1','eta_1','h_2','hu_2','eta_2']
+
+# Steady states of each bathymetry, see true_state
+_true_states = {}
+
+def true_state(bathy, eta, rho):
+    r"""Return the (cached) steady state q and surfaces over bathy
+
+    Assumes the top layer is not dry, the bottom layer is dry wherever the
+    bathymetry is above its surface eta[1].
+    """
+    key = (hashlib.sha1(numpy.ascontiguousarray(bathy)).hexdigest(),
+           tuple(eta),tuple(rho))
+    if key not in _true_states:
+        h_bottom = numpy.maximum(eta[1] - bathy, 0.0)
+        q = numpy.zeros((4,bathy.shape[0]))
+        q[0,:] = (eta[0] - (h_bottom + bathy)) * rho[0]
+        q[2,:] = h_bottom * rho[1]
+        eta_true = numpy.empty((2,bathy.shape[0]))
+        eta_true[0,:] = eta[0]
+        eta_true[1,:] = h_bottom + bathy
+        _true_states[key] = (numpy.array(bathy),q,eta_true)
+    return _true_states[key]
+
+
+def steady_state_errors(q, truth, rho, norms=norms):
+    r"""Compute the errors of q against the steady state truth
+
+    Returns an array of shape (len(norms),6) with the errors of the depth,
+    momentum and surface of each layer in each norm.
+    """
+    bathy,q_true,eta_true = truth
+    eta_comp = ml.layers.get_layout(2).surfaces(q, bathy, rho)
+    difference = numpy.empty((6,q.shape[1]))
+    difference[0::3,:] = q[0::2,:] - q_true[0::2,:]
+    difference[1::3,:] = q[1::2,:] - q_true[1::2,:]
+    difference[2::3,:] = eta_comp - eta_true
+    return numpy.array([numpy.linalg.norm(difference, ord=norm, axis=1)
+                                                        for norm in norms])
+
 
 def compute_error(q, aux, eta, rho, norm=1):
     r"""Compute the steady state error where eta are the surfaces"""
-
-    num_cells = q.shape[1]
-
-    # Create h from eta for true solution, assumes top layer is not dry
-    h_true = numpy.empty((2,num_cells))
-    hu_true = numpy.zeros((2,num_cells))
-    eta_true = numpy.zeros((2,num_cells))
-    h_compare = numpy.zeros((2,num_cells))
-    h_compare[0,:] = numpy.ones(num_cells) * eta[1] - aux[0,:]
-    h_true[1,:] = numpy.max(h_compare, axis=0)
-    eta_true[0,:] = numpy.zeros(num_cells)
-    eta_true[1,:] = h_true[1,:] + aux[0,:]
-    h_true[0,:] = (numpy.ones(num_cells) * eta[0] - (h_true[1,:] + aux[0,:])) * rho[0]
-    h_true[1,:] = h_true[1,:] * rho[1]
-
-    h = []
-    hu = []
-    eta_comp = []
-    h.append(q[0,...])
-    h.append(q[2,...])
-    hu.append(q[1,...])
-    hu.append(q[3,...])
-    eta_comp.append(h[0] / rho[0] + h[1] / rho[1] + aux[0,...])
-    eta_comp.append(h[1] / rho[1] + aux[0,...])
-
-    layers = 2
-    error = numpy.empty(3*layers)
-    for i in xrange(layers):
-        error[3*i] = numpy.linalg.norm(h[i] - h_true[i,:], ord=norm)
-        error[3*i+1] = numpy.linalg.norm(hu[i] - hu_true[i,:], ord=norm)
-        error[3*i+2] = numpy.linalg.norm(eta_comp[i] - eta_true[i,:], ord=norm)
-
-    return error
-
-
-def sig_fig_round(x, figs=1):
-    for (i,value) in enumerate(x):
-        if value != 0.0:
-            x[i] = numpy.round(value, -int(numpy.floor(numpy.log10(value))) + (figs - 1))
-    # Truncate digits
-    raw_string = r"%." + str(figs) + "g"
-    x = [float(raw_string % value) for value in x]
-    return x
+    return steady_state_errors(q, true_state(aux[0,:], eta, rho), rho,
+                               norms=[norm])[0]
+
+
+def error_history(path, eta, rho, norms=norms, num_threads=4):
+    r"""Compute the steady state errors of every frame in path
+
+    :Output:
+     - (ndarray(num_frames)) - Time of each frame.
+     - (ndarray(num_frames,len(norms),6)) - Errors of each frame as returned
+       by :func:`steady_state_errors`.
+    """
+    frames = ml.frames.find_frames(path)
+    if len(frames) == 0:
+        raise IOError("No frames found in %s." % path)
+    aux = ml.frames.read_frame(frames[0], path, read_aux=True).state.aux
+    truth = true_state(aux[0,:], eta, rho)
+    error_func = lambda sol: steady_state_errors(sol.state.q, truth, rho,
+                                                 norms=norms)
+    t,x,errors = ml.frames.build_hovmoller(path, error_func, frames=frames,
+                                           num_threads=num_threads)
+    return t,errors
+
+
+def error_table(t, errors, norms=norms, figs=3):
+    r"""Create a text table of the errors of each frame in each norm"""
+    lines = []
+    for (k,norm) in enumerate(norms):
+        lines.append("%s errors" % norm_labels[norm])
+        lines.append("%12s" % "t" + "".join(["%11s" % label
+                                                for label in error_labels]))
+        for (n,time) in enumerate(t):
+            lines.append("%12.4g" % time + "".join(["%11.*e" % (figs - 1,value)
+                                                for value in errors[n,k,:]]))
+        lines.append("%12s" % "max" + "".join(["%11.*e" % (figs - 1,value)
+                                        for value in errors[:,k,:].max(axis=0)]))
+        lines.append("")
+    return "\n".join(lines)
 
 
 if __name__ == '__main__':
@@ -68,12 +114,15 @@ if __name__ == '__main__':
             sol_path = os.path.join(data_path,"well_balancing_%s" % test,
                                                 "ml_e%s_d%s_output" % (eigen_method, dry))
 
-            sol = solution.Solution(1, path=sol_path, read_aux=True)
             if dry:
-                eta = [0.0, -6.0]
+                eta = [sea_level, -6.0]
             else:
-                eta = [0.0, -4.0] 
+                eta = [sea_level, -4.0]
+
+            t,errors = error_history(sol_path, eta, rho)
+            table = error_table(t, errors)
+            with open(os.path.join(sol_path,'well_balancing_errors.txt'),'w') as table_file:
+                table_file.write(table)
 
             print "%s, %s =" % (test, dry)
-            print "       ",sig_fig_round(compute_error(sol.q, sol.aux, eta, rho, norm=1),figs=3)
-            print "       ",sig_fig_round(compute_error(sol.q, sol.aux, eta, rho, norm=numpy.inf),figs=3)
\ No newline at end of file
+            print table
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import json
 
 import numpy as np
 
@@ -9,6 +11,34 @@ import matplotlib.colors as colors
 
 import clawpack.visclaw.colormaps as colormaps
 
+# Extensions of the binary and NetCDF topography files, others are ascii
+format_extensions = {'.bin':'binary','.nc':'netcdf'}
+
+def topo_format(path,file_format=None):
+    r"""Return the format of the topography file at path
+
+    Unless given by *file_format* the format is `binary` for a .bin file,
+    `netcdf` for a .nc file and `ascii` otherwise.
+    """
+
+    if file_format is not None:
+        if file_format not in ('ascii','binary','netcdf'):
+            raise ValueError("Unknown topography file format %s." % file_format)
+        return file_format
+    return format_extensions.get(os.path.splitext(path)[1].lower(),'ascii')
+
+
+def topo_header(num_cells,lower,delta,no_data_value):
+    r"""Return the 6 line header of a topotype 2 or 3 file"""
+
+    return ''.join(['%s ncols\n' % num_cells[0],
+                    '%s nrows\n' % num_cells[1],
+                    '%s xll\n' % lower[0],
+                    '%s yll\n' % lower[1],
+                    '%s cellsize\n' % delta,
+                    '%s nodata_value\n' % no_data_value])
+
+
 def read_topo_header(path,topo_type=3):
     r"""Read in header of topography file at path.
 
@@ -21,9 +51,10 @@ def read_topo_header(path,topo_type=3):
     delta = np.nan
     no_data_value = np.nan
 
-    bathy_file = open(path,'r')
+    # Binary mode as the header of a binary file is followed by raw data
+    bathy_file = open(path,'rb')
 
-    if topo_type == 3:
+    if topo_type in (2,3):
         num_cells[0] = int(bathy_file.readline().split()[0])
         num_cells[1] = int(bathy_file.readline().split()[0])
         extent[0] = float(bathy_file.readline().split()[0])
@@ -34,33 +65,227 @@ def read_topo_header(path,topo_type=3):
         extent[1] = extent[0] + num_cells[0] * delta
         extent[3] = extent[2] + num_cells[1] * delta
     else:
-        raise NotImplemented("Topo type header reading not implemented.")
+        raise NotImplementedError("Topo type header reading not implemented.")
 
     bathy_file.close()
 
     return num_cells,extent,delta,no_data_value
 
 
-def read_topo(path,topo_type=3):
+def topo_cache_paths(path):
+    r"""Return the paths of the data and header of the binary cache of path"""
+    return path + '.npy', path + '.json'
+
+
+def _source_stamp(path):
+    r"""Modification time and size identifying the contents of path"""
+    stat = os.stat(path)
+    return {'mtime':stat.st_mtime, 'size':stat.st_size}
+
+
+def _parse_topo_data(path, out, block_size=2**24):
+    r"""Parse the values of the topography file at path into out
+
+    The values following the 6 header lines are read in blocks of about
+    *block_size* bytes and converted without splitting them into lines, so
+    that rows wrapped over several lines are read as well.
+    """
+
+    flat = out.reshape(-1)
+    count = 0
+    remainder = ''
+    with open(path,'r') as topo_file:
+        for i in xrange(6):
+            topo_file.readline()
+        while True:
+            block = topo_file.read(block_size)
+            if len(block) == 0:
+                text = remainder
+            else:
+                # Hold back a value that may continue in the next block
+                split = max(block.rfind(char) for char in ' \t\r\n')
+                if split < 0:
+                    remainder += block
+                    continue
+                text = remainder + block[:split]
+                remainder = block[split:]
+            # fromstring does not return an empty array for blank text
+            if len(text) == 0 or text.isspace():
+                values = np.empty(0)
+            else:
+                values = np.fromstring(text, sep=' ')
+            if count + values.shape[0] > flat.shape[0]:
+                raise ValueError("Topography file %s has more values than its"
+                                 " header specifies." % path)
+            flat[count:count + values.shape[0]] = values
+            count += values.shape[0]
+            if len(block) == 0:
+                break
+    if count != flat.shape[0]:
+        raise ValueError("Topography file %s has %s values, expected %s."
+                                            % (path,count,flat.shape[0]))
+
+
+def build_topo_cache(path, dtype=np.float64):
+    r"""Parse the topotype 3 file at path into its binary cache
+
+    The data is written to a .npy file next to path and the header to a
+    .json file recording the size and modification time of path.  Both are
+    written to temporary files first so that a half written cache is never
+    used.  Returns the paths of the data and header.
+    """
+
+    N,extent,delta,no_data_value = read_topo_header(path)
+    data_path,header_path = topo_cache_paths(path)
+
+    temp_path = data_path + '.tmp.npy'
+    Z = np.lib.format.open_memmap(temp_path, mode='w+', dtype=dtype,
+                                  shape=(N[1],N[0]))
+    try:
+        _parse_topo_data(path, Z)
+        Z.flush()
+    except:
+        del Z
+        os.remove(temp_path)
+        raise
+    del Z
+    os.rename(temp_path, data_path)
+
+    header = {'num_cells':N, 'extent':extent, 'delta':delta,
+              'no_data_value':no_data_value, 'dtype':np.dtype(dtype).str,
+              'source':_source_stamp(path)}
+    with open(header_path + '.tmp','w') as header_file:
+        json.dump(header,header_file)
+    os.rename(header_path + '.tmp', header_path)
+
+    return data_path,header_path
+
+
+def read_topo_cache(path, dtype=np.float64):
+    r"""Return the header and memory mapped data of the binary cache of path
+
+    The cache is (re)built if it does not exist, was built with another
+    dtype or path has changed since, i.e. its size or modification time
+    differ from those recorded.
+    """
+
+    data_path,header_path = topo_cache_paths(path)
+    header = None
+    if os.path.exists(header_path) and os.path.exists(data_path):
+        with open(header_path,'r') as header_file:
+            header = json.load(header_file)
+        if header['source'] != _source_stamp(path) or \
+           header['dtype'] != np.dtype(dtype).str:
+            header = None
+
+    if header is None:
+        build_topo_cache(path, dtype=dtype)
+        with open(header_path,'r') as header_file:
+            header = json.load(header_file)
+
+    return header, np.load(data_path, mmap_mode='r')
+
+
+def _read_binary_topo(path):
+    r"""Return the header and memory mapped data of a binary topography file
+
+    A binary file has the 6 header lines of a topotype 3 file followed by the
+    rows of data, starting at the top, as little endian doubles.
+    """
+
+    with open(path,'rb') as topo_file:
+        for i in xrange(6):
+            topo_file.readline()
+        offset = topo_file.tell()
+    N,extent,delta,no_data_value = read_topo_header(path)
+    Z = np.memmap(path, dtype='<f8', mode='r', offset=offset,
+                  shape=(N[1],N[0]))
+    return N,extent,delta,Z
+
+
+def _read_netcdf_topo(path):
+    r"""Return the coordinates and data of a NetCDF topography file
+
+    Reads the variables lon, lat and z(lat,lon) as written by
+    :func:`extract_bathy.write_bathy` and flips the rows so that they start
+    at the top as for the other formats.
+    """
+
+    from scipy.io import netcdf_file
+
+    nc_file = netcdf_file(path, 'r', mmap=False)
+    try:
+        x = np.array(nc_file.variables['lon'][:])
+        y = np.array(nc_file.variables['lat'][::-1])
+        Z = np.array(nc_file.variables['z'][::-1,:])
+    finally:
+        nc_file.close()
+    return x,y,Z
+
+
+def topo_coordinates(num_cells,lower,delta):
+    r"""Return the coordinates x,y of the columns and rows of a grid
+
+    The values are at lower + delta * i, the rows start at the top so y is
+    decreasing.  All of the gridded formats are read with these coordinates.
+    """
+
+    x = lower[0] + delta * np.arange(num_cells[0])
+    y = lower[1] + delta * np.arange(num_cells[1])[::-1]
+    return x,y
+
+
+def read_topo(path,topo_type=3,cache=True,dtype=np.float64,file_format=None):
     r"""Read in topography data
 
     Depending on the topography type, returns:
      1) 1D arrays x,y,z
-     3) 2D arrays X,Y,Z
+     2,3) 1D arrays x,y of the coordinates of the columns and rows and the 2D
+        array Z, Z[i,j] being the value at (x[j],y[i]).  The rows start at
+        the top of the grid so y is decreasing, see :func:`topo_coordinates`.
+
+    With *cache* the data of a topotype 2 or 3 file is parsed only once into
+    a binary file next to it (see :func:`read_topo_cache`) and returned as a
+    read only memory map of that file, otherwise the text is parsed every
+    time.  *dtype* is the type the data is stored as.
+
+    Binary and NetCDF files (see :func:`topo_format`) are read as topotype 3,
+    the data of a binary file is memory mapped directly and that of a NetCDF
+    file is read into memory.
     """
 
-    if topo_type == 3:
-        N,extent,delta,no_data_value = read_topo_header(path)
-        x = np.linspace(extent[0],extent[1],N[0])
-        y = np.linspace(extent[3],extent[2],N[1])
-        X,Y = np.meshgrid(x,y)
-        # Data is read in starting at the top right corner
-        Z = np.loadtxt(path,skiprows=6)
+    file_format = topo_format(path,file_format)
+    if file_format == 'binary':
+        N,extent,delta,Z = _read_binary_topo(path)
+        x,y = topo_coordinates(N,(extent[0],extent[2]),delta)
+
+    elif file_format == 'netcdf':
+        x,y,Z = _read_netcdf_topo(path)
+
+    elif topo_type == 1:
+        data = np.loadtxt(path)
+        x,y,Z = data[:,0],data[:,1],data[:,2]
+
+    elif topo_type in (2,3):
+        if cache:
+            try:
+                header,Z = read_topo_cache(path, dtype=dtype)
+                N = header['num_cells']
+                extent = header['extent']
+                delta = header['delta']
+            except (IOError,OSError):
+                # The directory of path may not be writable
+                cache = False
+        if not cache:
+            N,extent,delta,no_data_value = read_topo_header(path)
+            Z = np.empty((N[1],N[0]), dtype=dtype)
+            _parse_topo_data(path, Z)
+        x,y = topo_coordinates(N,(extent[0],extent[2]),delta)
 
     else:
-        raise NotImplemented('Topo type reading not implemented.')
+        raise NotImplementedError('Topo type reading not implemented.')
 
-    return X,Y,Z
+    return x,y,Z
 
 def plot(path,coastlines=True,axes=None):
     r"""Plot the bathymetry file at path.
@@ -74,8 +299,8 @@ def plot(path,coastlines=True,axes=None):
         axes = fig.add_subplot(111)
 
     # Read in bathy
-    X,Y,Z = read_topo(path)
-    region_extent = (np.min(X),np.max(X),np.min(Y),np.max(Y))
+    x,y,Z = read_topo(path)
+    region_extent = (np.min(x),np.max(x),np.min(y),np.max(y))
     depth_extent = (np.min(Z),np.max(Z))
 
     # Create color map
@@ -90,11 +315,11 @@ def plot(path,coastlines=True,axes=None):
     plot = axes.imshow(Z,vmin=depth_extent[0], vmax=depth_extent[1],
                          extent=region_extent)#, cmap=cmap, norm=color_norm)
     levels = range(0,int(-np.min(Z)),500)
-    axes.contour(X,Y,-Z,levels=levels,colors='gray')
+    axes.contour(x,y,-Z,levels=levels,colors='gray')
 
     # Plot coastlines
     if coastlines:
-        axes.contour(X,Y,Z,levels=[0.0],colors='r')
+        axes.contour(x,y,Z,levels=[0.0],colors='r')
 
     axes.set_xlim(region_extent[0:2])
     axes.set_ylim(region_extent[2:])
@@ -7,23 +7,127 @@ r"""Functions for extracting and creating a structured grid of bathymetry
 
 import os
 import sys
+import itertools
+import multiprocessing
 
 import numpy as np
-from scipy.interpolate import griddata
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors 
 
 import clawpack.visclaw.colormaps as colormaps
 import bathy
+import gridding
 
 # Degree to meter conversion function
 R_earth = 6378.1 * 1000.0
 deg2meters = lambda theta,lat:R_earth * theta * np.pi / 180.0 * np.cos(lat * np.pi / 180.0)
 meters2deg = lambda d,lat:d / (R_earth * np.pi / 180.0 * np.cos(lat * np.pi / 180.0))
 
+def read_xyz(path, extent, chunk_size=2**20):
+    r"""Read the points of the x,y,z file at path inside extent
+
+    The file is read *chunk_size* lines at a time and each chunk is filtered
+    against extent at once, so only the points inside extent are kept in
+    memory.
+
+    :Input:
+     *path* (string) - Path to the x,y,z file, one whitespace separated point
+                       per line.
+     *extent* (tuple) - Rectangle (x lower,x upper,y lower, y upper) of the
+                        points returned, including its edges.
+     *chunk_size* (int) - Number of lines read at a time, default is `2**20`.
+
+    :Output:
+     *points* (ndarray(n,2)) - x,y coordinates of the points inside extent.
+     *values* (ndarray(n)) - z values of the points.
+    """
+
+    return read_xyz_regions(path, {'extent':extent}, chunk_size)['extent']
+
+
+def read_xyz_regions(path, regions, chunk_size=2**20):
+    r"""Read the points of the x,y,z file at path inside each of regions
+
+    Reads the file once as :func:`read_xyz` does, sorting the points of each
+    chunk into every region containing them at once.  Regions may overlap.
+
+    :Input:
+     *path* (string) - Path to the x,y,z file.
+     *regions* (dict) - Extent (x lower,x upper,y lower, y upper) of each
+                        region by name.
+     *chunk_size* (int) - Number of lines read at a time, default is `2**20`.
+
+    :Output:
+     (dict) - Arrays *points* and *values* as returned by :func:`read_xyz`
+              for each region by name.
+    """
+
+    names = list(regions.keys())
+    bounds = np.array([regions[name] for name in names],dtype=float)
+    union = (np.min(bounds[:,0]),np.max(bounds[:,1]),
+             np.min(bounds[:,2]),np.max(bounds[:,3]))
+
+    chunks = dict((name,[]) for name in names)
+    with open(path,'r') as xyz_file:
+        while True:
+            lines = list(itertools.islice(xyz_file,chunk_size))
+            if len(lines) == 0:
+                break
+            text = ''.join(lines)
+            if text.isspace():
+                continue
+            data = np.fromstring(text,sep=' ')
+            if data.shape[0] % 3 != 0:
+                raise ValueError("File %s does not have 3 values per point."
+                                                                        % path)
+            data = data.reshape((-1,3))
+            mask = (union[0] <= data[:,0]) * (data[:,0] <= union[1]) * \
+                   (union[2] <= data[:,1]) * (data[:,1] <= union[3])
+            if not np.any(mask):
+                continue
+            data = data[mask]
+
+            # Membership of each point in each region
+            x = data[:,0:1]
+            y = data[:,1:2]
+            inside = (bounds[:,0] <= x) * (x <= bounds[:,1]) * \
+                     (bounds[:,2] <= y) * (y <= bounds[:,3])
+            for (n,name) in enumerate(names):
+                if np.any(inside[:,n]):
+                    chunks[name].append(data[inside[:,n]])
+
+    extracted = {}
+    for name in names:
+        if len(chunks[name]) == 0:
+            extracted[name] = (np.empty((0,2)),np.empty(0))
+        else:
+            data = np.concatenate(chunks[name])
+            extracted[name] = (data[:,0:2],data[:,2])
+        del chunks[name]
+    return extracted
+
+
+def grid_spacing(points):
+    r"""Estimate the spacing dx,dy of the points
+
+    The spacing in each direction is the smallest difference between the
+    sorted unique coordinates, infinity if there is only one.
+    """
+
+    spacing = []
+    for coordinates in (points[:,0],points[:,1]):
+        unique = np.unique(coordinates)
+        if unique.shape[0] < 2:
+            spacing.append(np.infty)
+        else:
+            spacing.append(np.min(np.diff(unique)))
+    return spacing
+
+
 def extract(path, fill_path, extent, no_data_value=999999, plot_fill=False,
-            method='nearest', delta_limit=20.0, TOLERANCE=1e-3):
+            method='nearest', delta_limit=20.0, TOLERANCE=1e-3,
+            processes=None):
     r"""Extract sub-section of bathymetry from file at path
 
     Function to extract a sub-section given by extent of the bathymetry file at 
@@ -40,11 +144,11 @@ def extract(path, fill_path, extent, no_data_value=999999, plot_fill=False,
      *extent* (tuple) - A tuple defining the rectangle of the sub-section.  Must
                         be in the form (x lower,x upper,y lower, y upper).
      *no_data_value* (float) - Value to use if no data was found to fill in a 
-                               missing value, ignored if `method = 'nearest'`.
+                               missing value, only used if `method = 'linear'`.
                                Default is `999999`.
-     *method* (string) - Method for interpolation, valid methods are found in
-                         the scipy module scipy.interpolate.  Default is 
-                         `nearest`.
+     *method* (string) - Method for interpolation, valid methods are
+                         `nearest`, `linear` and `inverse_distance`, see
+                         :mod:`gridding`.  Default is `nearest`.
      *delta_limit* (float) - Limit of finest horizontal resolution, default is
                              20 meters.
      *tolerance* (float) -  Tolerance allowed for extent matching.  Since the 
@@ -52,6 +156,8 @@ def extract(path, fill_path, extent, no_data_value=999999, plot_fill=False,
                             match due to round off, this parameter is used to 
                             check if they are within acceptable tolerances.
                             Default is `1e-3`.
+     *processes* (int) - Number of processes interpolating the grid, default
+                         is the number of cores.
 
     :Output:
      *Z* (ndarray) - Interpolated 2D array of bathymetry depths starting in the
@@ -60,45 +166,56 @@ def extract(path, fill_path, extent, no_data_value=999999, plot_fill=False,
     """
 
     # Extract data
-    print "Loading data from file %s" % path
-    data = np.loadtxt(path)
-    points = []
-    values = []
-    dx = np.infty
-    dy = np.infty
-
-    print "Filtering data..."
-    for coordinate in data:
-        if extent[0] <= coordinate[0] <= extent[1]:
-            if extent[2] <= coordinate[1] <= extent[3]:
-                points.append(coordinate[0:2])
-                values.append(coordinate[2])
-
-                # Try to determine smallest dx and dy
-                if len(points) > 1:
-                    if np.abs(points[-1][0] - points[-2][0]) < dx:
-                        dx = np.abs(points[-1][0] - points[-2][0])
-                    if np.abs(points[-1][1] - points[-2][1]) < dy:
-                        dy = np.abs(points[-1][1] - points[-2][1])
-
-    if len(points) == 0:
-        raise Exception("No points were found inside requested extent.")
+    print "Loading and filtering data from file %s" % path
+    points,values = read_xyz(path,extent)
 
-    # Cast lists as ndarrays
-    points = np.array(points)
-    values = np.array(values)    
+    if points.shape[0] == 0:
+        raise Exception("No points were found inside requested extent.")
 
     # Create regularized grid
     print "Computing grid data"
+    x,y,delta = regular_grid(points,extent,delta_limit,TOLERANCE)
+
+    # Add fill data
+    print "Extracting fill data"
+    fill = bathy.read_topo(fill_path)
+    fill_points,Z_fill_extent = fill_data(fill,extent)
+    points = np.concatenate((points,fill_points))
+    values = np.concatenate((values,Z_fill_extent.ravel()))
+
+    if plot_fill:
+        fig = plt.figure(2)
+        axes = fig.add_subplot(111)
+        plot = axes.imshow(Z_fill_extent,vmin=np.min(fill[2]),
+                           vmax=np.max(fill[2]),extent=extent)
+        fig.colorbar(plot)
+        plt.show()
+
+    # Interpolate known points onto regularized grid
+    print "Interpolating onto grid..."
+    Z = gridding.grid_data(points,values,x,y,method=method,
+                           fill_value=no_data_value,processes=processes)
+
+    return Z,delta
+
+
+def regular_grid(points, extent, delta_limit=20.0, TOLERANCE=1e-3):
+    r"""Create the grid covering extent at the resolution of points
+
+    The spacing is the finer of that of points in x and y, but no finer than
+    *delta_limit* meters.  Returns the coordinates x and y of the grid and
+    the spacing used.
+    """
+
+    # Try to determine smallest dx and dy
+    dx,dy = grid_spacing(points)
+
     delta = max(min(dx,dy),meters2deg(delta_limit,29.5)) # Limit to size of delta
-    N = (np.ceil((extent[1] - extent[0]) / delta),
-         np.ceil((extent[3] - extent[2]) / delta))
+    N = (int(np.ceil((extent[1] - extent[0]) / delta)),
+         int(np.ceil((extent[3] - extent[2]) / delta)))
     print "  delta = %s, N = %s" % (delta,N)
-    if N[0] > 2000 or N[1] > 2000:
-        raise Exception("Calculated resolution too high!")
     x = np.linspace(extent[0],extent[1],N[0])
     y = np.linspace(extent[2],extent[3],N[1])
-    X,Y = np.meshgrid(x,y)
 
     # Check extents
     if abs(x[0]  - extent[0]) > TOLERANCE or \
@@ -108,10 +225,19 @@ def extract(path, fill_path, extent, no_data_value=999999, plot_fill=False,
 
        raise Exception("Calculated grid out of extent tolerance.")
 
-    # Add fill data
-    print "Extracting fill data"
-    X_fill,Y_fill,Z_fill = bathy.read_topo(fill_path)
-    fill_extent = (np.min(X_fill),np.max(X_fill),np.min(Y_fill),np.max(Y_fill))
+    return x,y,delta
+
+
+def fill_data(fill, extent):
+    r"""Return the points and values of the fill data inside extent
+
+    *fill* is the tuple x,y,Z returned by :func:`bathy.read_topo`, only the
+    rows and columns inside extent are read from it.  Returns the points as
+    an array (n,2) and the values as a 2D array of the rows and columns.
+    """
+
+    x_fill,y_fill,Z_fill = fill
+    fill_extent = (np.min(x_fill),np.max(x_fill),np.min(y_fill),np.max(y_fill))
     if fill_extent[0] > extent[0] or fill_extent[1] < extent[1] or \
        fill_extent[2] > extent[2] or fill_extent[3] < extent[3]:
 
@@ -119,66 +245,215 @@ def extract(path, fill_path, extent, no_data_value=999999, plot_fill=False,
        print " Requested Extent = %s" % str(extent)
        raise Exception("Fill bathymetry extent does not contain extent.")
 
-    extent_mask = extent[0] > X_fill
-    extent_mask = np.logical_or(extent_mask, extent[1] < X_fill)
-    extent_mask = np.logical_or(extent_mask, extent[2] > Y_fill)
-    extent_mask = np.logical_or(extent_mask, extent[3] < Y_fill)
+    columns = np.nonzero((extent[0] <= x_fill) * (x_fill <= extent[1]))[0]
+    rows = np.nonzero((extent[2] <= y_fill) * (y_fill <= extent[3]))[0]
+    X_fill,Y_fill = np.meshgrid(x_fill[columns],y_fill[rows])
+    Z_fill_extent = Z_fill[np.ix_(rows,columns)]
 
-    X_fill_mask = np.ma.masked_where(extent_mask,X_fill)
-    Y_fill_mask = np.ma.masked_where(extent_mask,Y_fill)
-    Z_fill_mask = np.ma.masked_where(extent_mask,Z_fill)
+    return np.column_stack((X_fill.ravel(),Y_fill.ravel())),Z_fill_extent
 
-    fill_points = np.column_stack((X_fill_mask.compressed(),
-                                   Y_fill_mask.compressed()))
-    points = np.concatenate((points,fill_points))
-    values = np.concatenate((values,Z_fill_mask.compressed()))
 
-    if plot_fill:
-        fig = plt.figure(2)
-        axes = fig.add_subplot(111)
-        plot = axes.imshow(Z_fill_mask,vmin=np.min(Z_fill),vmax=np.max(Z_fill),
-                           extent=extent)
-        fig.colorbar(plot)
-        plt.show()
+def _extract_region(job):
+    r"""Grid and write out a region of :func:`extract_regions`"""
 
-    # Interpolate known points onto regularized grid
-    print "Creating interpolating function..."
-    Z = griddata(points,values,(X,Y), method=method, fill_value=no_data_value)
+    name,extent,points,values,fill_points,fill_values,out_path,options = job
+    if points.shape[0] == 0:
+        raise Exception("No points were found inside region %s." % name)
 
-    return Z,delta
+    print "Computing grid data for %s" % name
+    x,y,delta = regular_grid(points,extent,options['delta_limit'],
+                             options['TOLERANCE'])
+    Z = gridding.grid_data(np.concatenate((points,fill_points)),
+                           np.concatenate((values,fill_values)),x,y,
+                           method=options['method'],
+                           fill_value=options['no_data_value'],
+                           processes=options['processes'])
+    write_bathy(out_path,Z,(extent[0],extent[2]),delta,
+                no_data_value=options['no_data_value'])
+    return name,out_path,delta
+
+
+def extract_regions(path, fill_path, regions, out_dir='./',
+                    no_data_value=999999, method='nearest', delta_limit=20.0,
+                    TOLERANCE=1e-3, processes=None):
+    r"""Extract and write out several regions of the bathymetry file at path
 
+    Does what :func:`extract` followed by :func:`write_bathy` does for each
+    of regions, but reads the files at path and fill_path only once.  The
+    regions are gridded in a pool of *processes* processes, each region in
+    one process.  With a single region its tiles are gridded in the pool
+    instead, see :mod:`gridding`.
 
-def write_bathy(path,Z,lower,delta,no_data_value=999999,topotype=3):
+    :Input:
+     *path* (string) - Path to the x,y,z bathymetry file.
+     *fill_path* (string) - Path to the topography type 3 fill file.
+     *regions* (dict) - Extent (x lower,x upper,y lower, y upper) of each
+                        region by name.
+     *out_dir* (string) - Directory the region *name* is written to as
+                          *name.tt3*, default is `./`.
+     *processes* (int) - Number of processes, default is the number of cores.
+
+    The remaining arguments are those of :func:`extract`.
+
+    :Output:
+     (dict) - Path written and resolution delta of each region by name.
+    """
+
+    print "Loading and filtering data from file %s" % path
+    data = read_xyz_regions(path,regions)
+
+    print "Extracting fill data"
+    fill = bathy.read_topo(fill_path)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    per_region = processes > 1 and len(regions) > 1
+    options = {'no_data_value':no_data_value,'method':method,
+               'delta_limit':delta_limit,'TOLERANCE':TOLERANCE,
+               'processes':1 if per_region else processes}
+    jobs = []
+    for (name,extent) in regions.iteritems():
+        points,values = data.pop(name)
+        fill_points,Z_fill_extent = fill_data(fill,extent)
+        jobs.append((name,extent,points,values,fill_points,
+                     Z_fill_extent.ravel(),
+                     os.path.join(out_dir,"%s.tt3" % name),options))
+
+    if per_region:
+        pool = multiprocessing.Pool(min(processes,len(jobs)))
+        try:
+            results = pool.map(_extract_region,jobs,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_extract_region(job) for job in jobs]
+
+    written = {}
+    for (name,out_path,delta) in results:
+        print "Wrote %s to %s, delta = %s" % (name,out_path,delta)
+        written[name] = (out_path,delta)
+    return written
+
+
+def _write_rows(out_file,rows,row_format,block_size=2**16):
+    r"""Write the rows of a 2D array to out_file formatted by row_format
+
+    Rows are formatted a block of about *block_size* values at a time.
+    """
+
+    block_rows = max(1,block_size // max(1,rows.shape[1]))
+    for start in xrange(0,rows.shape[0],block_rows):
+        block = rows[start:start + block_rows]
+        out_file.write((row_format * block.shape[0]) % tuple(block.ravel()))
+
+
+def write_bathy(path,Z,lower,delta,no_data_value=999999,topotype=3,
+                file_format=None,value_format='%.12g'):
     r"""Write out a topography file to path of type topotype
 
-    Writes out a bathymetry file of type 3 to path from data in Z.  The rest of
-    the arguments are used to write the header data.
+    Writes out a bathymetry file of type topotype to path from data in Z,
+    ordered from the lower left to the upper right corner.  The rest of the
+    arguments are used to write the header data.
+
+    :Input:
+     *topotype* (int) - Type 1 (x y z per line), 2 (header and one value per
+                        line) or 3 (header and one row per line) of an ascii
+                        file.  Default is `3`.
+     *file_format* (string) - `ascii`, `binary` or `netcdf`, by default
+                              chosen from the extension of path, see
+                              :func:`bathy.topo_format`.  Binary and NetCDF
+                              files are always gridded and can be read with
+                              :func:`bathy.read_topo`.
+     *value_format* (string) - Format of the values of an ascii file,
+                               default is `%.12g`.
     """
 
-    outfile = open(path,'w')
-
-    if topotype == 3:
-        # Write out header
-        outfile.write('%s ncols\n' % Z.shape[1])
-        outfile.write('%s nrows\n' % Z.shape[0])
-        outfile.write('%s xll\n' % lower[0])
-        outfile.write('%s yll\n' % lower[1])
-        outfile.write('%s cellsize\n' % delta)
-        outfile.write('%s nodata_value\n' % no_data_value)
-
-        # Write out bathy data
-        # We flip the output data here since we write from the upper left corner
-        # to lower right and the data is ordered from lower left to upper right
-        Z_flipped = np.flipud(Z)
-        for i in xrange(Z.shape[0]):
-            for j in xrange(Z.shape[1]):
-                outfile.write("%s   " % (Z_flipped[i,j]))
-            outfile.write("\n")
+    file_format = bathy.topo_format(path,file_format)
+    num_cells = (Z.shape[1],Z.shape[0])
+
+    # We flip the output data here since we write from the upper left corner
+    # to lower right and the data is ordered from lower left to upper right
+    Z_flipped = np.flipud(Z)
+
+    if file_format == 'netcdf':
+        write_netcdf(path,Z,lower,delta,no_data_value)
+
+    elif file_format == 'binary':
+        if topotype != 3:
+            raise ValueError("Binary files are written as topotype 3.")
+        with open(path,'wb') as outfile:
+            header = bathy.topo_header(num_cells,lower,delta,no_data_value)
+            outfile.write(header.encode('ascii'))
+            outfile.flush()
+            np.ascontiguousarray(Z_flipped,dtype='<f8').tofile(outfile)
+
+    elif topotype == 1:
+        x,y = bathy.topo_coordinates(num_cells,lower,delta)
+        row_format = ' '.join([value_format] * 3) + '\n'
+        with open(path,'w') as outfile:
+            # Write the points of a few rows of the grid at a time
+            block_rows = max(1,2**16 // num_cells[0])
+            for start in xrange(0,num_cells[1],block_rows):
+                block = Z_flipped[start:start + block_rows]
+                points = np.empty((block.size,3))
+                points[:,0] = np.tile(x,block.shape[0])
+                points[:,1] = np.repeat(y[start:start + block.shape[0]],
+                                        num_cells[0])
+                points[:,2] = block.ravel()
+                _write_rows(outfile,points,row_format)
+
+    elif topotype in (2,3):
+        with open(path,'w') as outfile:
+            outfile.write(bathy.topo_header(num_cells,lower,delta,
+                                            no_data_value))
+            if topotype == 2:
+                _write_rows(outfile,Z_flipped.reshape((-1,1)),
+                            value_format + '\n')
+            else:
+                _write_rows(outfile,Z_flipped,
+                            ' '.join([value_format] * num_cells[0]) + '\n')
 
     else:
-        raise NotImplemented("Output type %s not implemented." % topotype)
+        raise NotImplementedError("Output type %s not implemented." % topotype)
+
+
+def write_netcdf(path,Z,lower,delta,no_data_value=999999):
+    r"""Write out a CF convention NetCDF topography file to path
+
+    The data in Z, ordered from the lower left to the upper right corner, is
+    written as the variable z(lat,lon) with the coordinates of the grid in
+    the variables lon and lat.
+    """
+
+    from scipy.io import netcdf_file
+
+    nc_file = netcdf_file(path,'w')
+    try:
+        nc_file.Conventions = 'CF-1.6'
+        nc_file.title = 'Topography'
+        nc_file.createDimension('lat',Z.shape[0])
+        nc_file.createDimension('lon',Z.shape[1])
+
+        lon = nc_file.createVariable('lon','d',('lon',))
+        lon.standard_name = 'longitude'
+        lon.units = 'degrees_east'
+        lon[:] = lower[0] + delta * np.arange(Z.shape[1])
+
+        lat = nc_file.createVariable('lat','d',('lat',))
+        lat.standard_name = 'latitude'
+        lat.units = 'degrees_north'
+        lat[:] = lower[1] + delta * np.arange(Z.shape[0])
 
-    outfile.close()
+        z = nc_file.createVariable('z','d',('lat','lon'))
+        z.standard_name = 'height_above_mean_sea_level'
+        z.long_name = 'Topography'
+        z.units = 'meters'
+        z._FillValue = float(no_data_value)
+        z.missing_value = float(no_data_value)
+        z[:,:] = Z
+    finally:
+        nc_file.close()
 
 
 def plot_bathy(paths,region_path,patch_edges=True,patch_names=True,names=None,
@@ -196,8 +471,8 @@ def plot_bathy(paths,region_path,patch_edges=True,patch_names=True,names=None,
     patch_axes = [patch_fig.add_subplot(rows,columns,i) for i in xrange(len(paths))]
 
     # Read in region bathymetry
-    X,Y,Z = bathy.read_topo(region_path)
-    region_extent = (np.min(X),np.max(X),np.min(Y),np.max(Y))
+    x,y,Z = bathy.read_topo(region_path)
+    region_extent = (np.min(x),np.max(x),np.min(y),np.max(y))
     depth_extent = (np.min(Z),np.max(Z))
 
     # Create color map
@@ -214,13 +489,13 @@ def plot_bathy(paths,region_path,patch_edges=True,patch_names=True,names=None,
                                        # cmap=cmap,norm=color_norm)
     
     if plot_coastline:
-        region_axes.contour(X,Y,Z,levels=[0.0],colors='r')
+        region_axes.contour(x,y,Z,levels=[0.0],colors='r')
 
 
     # Read in and plot each patch
     for (i,patch_path) in enumerate(paths):
-        X,Y,Z = bathy.read_topo(patch_path)
-        extent = (np.min(X),np.max(X),np.min(Y),np.max(Y))
+        x,y,Z = bathy.read_topo(patch_path)
+        extent = (np.min(x),np.max(x),np.min(y),np.max(y))
 
         # Plot on region figure
         region_axes.imshow(Z,vmin=depth_extent[0],vmax=depth_extent[1],
@@ -243,13 +518,13 @@ def plot_bathy(paths,region_path,patch_edges=True,patch_names=True,names=None,
         else:
             file_name = names[i]
         if patch_names:
-            delta = X[0,0] - X[1,0]
+            delta = x[1] - x[0]
             region_axes.text(extent[0]+delta,extent[2]+delta,file_name,color='m')
 
         # Plot on local bathy
         patch_axes[i].imshow(Z,vmin=depth_extent[0],vmax=depth_extent[1],
                              extent=extent)#,cmap=cmap,norm=color_norm)
-        patch_axes[i].contour(X,Y,Z,levels=[0.0],colors='r')
+        patch_axes[i].contour(x,y,Z,levels=[0.0],colors='r')
         patch_axes[i].set_title(file_name)
         patch_axes[i].set_xlim(extent[0:2])
         patch_axes[i].set_ylim(extent[2:])
@@ -295,11 +570,11 @@ if __name__ == "__main__":
                'galveston':[-94.9226,-94.8258,29.352,29.3945],
                'lower_galveston_bay':[-94.9032,-94.7759,29.3832,29.5305],
                'upper_galveston_bay':[-94.9592,-94.8595,29.5177,29.6175]}
-    for (region_name,extent) in regions.iteritems():
-        out_path = "%s.tt3" % region_name
-        if not os.path.exists(out_path) or force:
-            Z,delta = extract(base_bathy_file,region_bathy,extent=extent)
-            write_bathy(out_path,Z,(extent[0],extent[2]),delta)
+    missing = dict((region_name,extent) for (region_name,extent)
+                        in regions.iteritems()
+                        if force or not os.path.exists("%s.tt3" % region_name))
+    if len(missing) > 0:
+        extract_regions(base_bathy_file,region_bathy,missing)
     
     # Plot results
     plot_bathy(['.'.join((name,'tt3')) for name in regions.keys()],
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+r"""Tiled interpolation of scattered points onto a structured grid
+
+The grid is split into tiles of *tile_size* x *tile_size* nodes that are
+interpolated independently, optionally in a pool of processes, using only
+the points within a margin of *overlap* grid cells around each tile.  Memory
+and time per tile are bounded by the points near it rather than by all the
+points and the whole grid, so grids far larger than a single call of
+scipy.interpolate.griddata allows can be built.
+
+The methods available are
+
+    - *nearest* - Value of the nearest point.
+    - *linear* - Linear interpolation on a Delaunay triangulation.
+    - *inverse_distance* - Inverse distance weighting of the *num_neighbors*
+      nearest points.
+
+The nearest and inverse distance results are the same as without tiles: the
+margin of a tile is doubled until the neighbors found for every node lie
+within it.  The linear result is the same as with a triangulation of all the
+points wherever the triangle of a node in the triangulation of the points
+near its tile has its circumcircle within them, otherwise the node is retried
+with a doubled margin up to *max_doublings* times.  The nodes inside the
+convex hull of the points left after that, e.g. where the points are sparse
+compared to the margin, are interpolated in a triangulation of all of the
+points built once per process.  Where several triangulations are equally
+valid, e.g. on a regular grid of points, either may be picked.
+
+:Available Routines:
+    - :func:`grid_data` - Interpolate points onto the grid of x and y
+"""
+
+import multiprocessing
+
+import numpy as np
+from scipy.spatial import cKDTree, Delaunay, ConvexHull
+
+methods = ['nearest','linear','inverse_distance']
+
+# Points sorted by x shared with the tiles of a process, the equations of
+# the facets of their convex hull and their triangulation once built, see
+# _set_points and _triangulation
+_points = None
+_values = None
+_hull = None
+_all_triangulation = None
+
+
+def _set_points(points, values):
+    r"""Store the points, sorted by x, for the tiles of this process"""
+
+    global _points, _values, _hull, _all_triangulation
+    order = np.argsort(points[:,0], kind='mergesort')
+    _points = points[order]
+    _values = values[order]
+    _hull = None
+    _all_triangulation = None
+    if points.shape[0] >= 3:
+        try:
+            # Nodes on the hull up to round off count as inside
+            _hull = ConvexHull(points).equations
+            _hull[:,2] -= 1e-12 * (1.0 + np.max(np.abs(points)))
+        except Exception:
+            # All of the points lie on a line
+            _hull = None
+
+
+def _in_hull(nodes):
+    r"""Return whether each node lies in the convex hull of all points"""
+
+    if _hull is None:
+        return np.zeros(nodes.shape[0], dtype=bool)
+    return np.all(np.dot(nodes, _hull[:,:2].T) + _hull[:,2] <= 0.0, axis=1)
+
+
+def _triangulation():
+    r"""Return the triangulation of all of the points, None if there is none
+
+    Built on the first call in a process and kept for its later tiles.
+    """
+
+    global _all_triangulation
+    if _all_triangulation is None and _hull is not None:
+        try:
+            _all_triangulation = Delaunay(_points)
+        except Exception:
+            # All of the points lie on a line
+            _all_triangulation = None
+    return _all_triangulation
+
+
+def _select(lower, upper):
+    r"""Return the points and values in the box [lower,upper]
+
+    Also returns whether the box contains all of the points.
+    """
+
+    start = np.searchsorted(_points[:,0], lower[0], side='left')
+    stop = np.searchsorted(_points[:,0], upper[0], side='right')
+    y = _points[start:stop,1]
+    mask = (lower[1] <= y) * (y <= upper[1])
+    everything = start == 0 and stop == _points.shape[0] and np.all(mask)
+    return _points[start:stop][mask], _values[start:stop][mask], everything
+
+
+def _query_tile(nodes, lower, upper, margin, num_neighbors, power):
+    r"""Nearest or inverse distance weighted values at nodes
+
+    The margin around the tile is doubled for the nodes whose neighbors may
+    lie outside of it until the neighbors of every node are found.
+    """
+
+    Z = np.empty(nodes.shape[0])
+    remaining = np.arange(nodes.shape[0])
+    while remaining.shape[0] > 0:
+        points, values, everything = _select(lower - margin, upper + margin)
+        k = min(num_neighbors, points.shape[0])
+        if k == 0:
+            margin *= 2.0
+            continue
+        distance, index = cKDTree(points).query(nodes[remaining], k=k)
+        distance = distance.reshape((remaining.shape[0], k))
+        index = index.reshape((remaining.shape[0], k))
+
+        # A nearer point outside of the box would be further than margin
+        found = distance[:,-1] <= margin
+        if everything:
+            found[:] = True
+        if k < num_neighbors and not everything:
+            found[:] = False
+
+        if num_neighbors == 1:
+            Z[remaining[found]] = values[index[found,0]]
+        else:
+            distance = distance[found]
+            index = index[found]
+            exact = distance[:,0] == 0.0
+            weights = np.empty(distance.shape)
+            weights[~exact] = 1.0 / distance[~exact]**power
+            weights[exact] = 0.0
+            weights[exact,0] = 1.0
+            Z[remaining[found]] = np.sum(weights * values[index], axis=1) \
+                                    / np.sum(weights, axis=1)
+        remaining = remaining[~found]
+        margin *= 2.0
+    return Z
+
+
+def _barycentric(triangulation, simplex, nodes, values):
+    r"""Interpolate values linearly at nodes lying in the given simplices"""
+
+    transform = triangulation.transform[simplex]
+    weights = np.einsum('ijk,ik->ij', transform[:,:2,:],
+                        nodes - transform[:,2,:])
+    weights = np.column_stack((weights, 1.0 - np.sum(weights, axis=1)))
+    return np.sum(weights * values[triangulation.simplices[simplex]], axis=1)
+
+
+def _circumcircles_in_box(triangulation, box_lower, box_upper):
+    r"""Return whether the circumcircle of each simplex lies in the box
+
+    A triangle of the points in the box whose circumcircle lies in the box is
+    also a triangle of the Delaunay triangulation of all of the points.
+    """
+
+    vertices = triangulation.points[triangulation.simplices]
+    a = vertices[:,1,:] - vertices[:,0,:]
+    b = vertices[:,2,:] - vertices[:,0,:]
+    a2 = np.sum(a**2, axis=1)
+    b2 = np.sum(b**2, axis=1)
+    d = 2.0 * (a[:,0] * b[:,1] - a[:,1] * b[:,0])
+    offset = np.column_stack((b[:,1] * a2 - a[:,1] * b2,
+                              a[:,0] * b2 - b[:,0] * a2)) / d[:,np.newaxis]
+    center = vertices[:,0,:] + offset
+    radius = np.sqrt(np.sum(offset**2, axis=1))[:,np.newaxis]
+    return np.all(center - radius >= box_lower, axis=1) * \
+           np.all(center + radius <= box_upper, axis=1)
+
+
+def _linear_tile(nodes, lower, upper, margin, fill_value, max_doublings):
+    r"""Linearly interpolated values at nodes
+
+    Nodes whose triangle in the triangulation of the points near the tile
+    may not be a triangle of the triangulation of all the points, or that
+    are outside of it but inside the convex hull of all the points, are
+    retried with a doubled margin up to max_doublings times.  The nodes
+    left are interpolated in the triangulation of all the points.
+    """
+
+    Z = np.empty(nodes.shape[0])
+    Z.fill(fill_value)
+    remaining = np.arange(nodes.shape[0])
+    remaining = remaining[_in_hull(nodes)]
+    for doubling in xrange(max_doublings + 1):
+        if remaining.shape[0] == 0:
+            return Z
+        box_lower = lower - margin
+        box_upper = upper + margin
+        points, values, everything = _select(box_lower, box_upper)
+        if everything:
+            break
+        if points.shape[0] >= 3:
+            try:
+                triangulation = Delaunay(points)
+            except Exception:
+                # All of the points lie on a line
+                triangulation = None
+            if triangulation is not None:
+                simplex = triangulation.find_simplex(nodes[remaining])
+                done = simplex >= 0
+                exact = _circumcircles_in_box(triangulation, box_lower,
+                                              box_upper)
+                done[done] = exact[simplex[done]]
+                Z[remaining[done]] = _barycentric(triangulation,
+                                                  simplex[done],
+                                                  nodes[remaining[done]],
+                                                  values)
+                remaining = remaining[~done]
+        margin *= 2.0
+
+    triangulation = _triangulation()
+    if remaining.shape[0] > 0 and triangulation is not None:
+        simplex = triangulation.find_simplex(nodes[remaining])
+        found = simplex >= 0
+        Z[remaining[found]] = _barycentric(triangulation, simplex[found],
+                                           nodes[remaining[found]], _values)
+    return Z
+
+
+def _grid_tile(tile):
+    r"""Interpolate a tile, returns its row and column slices and values"""
+
+    rows, columns, x, y, method, options = tile
+    X, Y = np.meshgrid(x, y)
+    nodes = np.column_stack((X.ravel(), Y.ravel()))
+    lower = np.array([x[0], y[0]])
+    upper = np.array([x[-1], y[-1]])
+    margin = options['margin']
+
+    if method == 'nearest':
+        Z = _query_tile(nodes, lower, upper, margin, 1, None)
+    elif method == 'inverse_distance':
+        Z = _query_tile(nodes, lower, upper, margin, options['num_neighbors'],
+                        options['power'])
+    else:
+        Z = _linear_tile(nodes, lower, upper, margin, options['fill_value'],
+                         options['max_doublings'])
+
+    return rows, columns, Z.reshape((y.shape[0], x.shape[0]))
+
+
+def grid_data(points, values, x, y, method='nearest', fill_value=np.nan,
+              tile_size=512, overlap=16, processes=None, num_neighbors=8,
+              power=2.0, max_doublings=3):
+    r"""Interpolate scattered points onto the grid given by x and y
+
+    :Input:
+     *points* (ndarray(n,2)) - x,y coordinates of the points.
+     *values* (ndarray(n)) - Values at the points.
+     *x*, *y* (ndarray) - Increasing, equally spaced coordinates of the
+                          columns and rows of the grid.
+     *method* (string) - One of `nearest`, `linear` or `inverse_distance`,
+                         default is `nearest`.
+     *fill_value* (float) - Value of nodes outside of the triangulation of
+                            the points, only used if `method = 'linear'`.
+                            Default is `nan`.
+     *tile_size* (int) - Number of nodes along each side of a tile, default
+                         is `512`.
+     *overlap* (int) - Initial margin around each tile in grid cells of the
+                       points used to interpolate it, default is `16`.
+     *processes* (int) - Number of processes interpolating tiles, default
+                         is the number of cores.  With `1` the tiles are
+                         interpolated in this process.
+     *num_neighbors* (int) - Number of points weighted by
+                             `inverse_distance`, default is `8`.
+     *power* (float) - Power of the distance weights of `inverse_distance`,
+                       default is `2`.
+     *max_doublings* (int) - Number of times the margin of a tile is doubled
+                             for nodes outside of its triangulation with
+                             `linear` before the triangulation of all the
+                             points is used, default is `3`.
+
+    :Output:
+     *Z* (ndarray(len(y),len(x))) - Interpolated values, Z[i,j] being the
+                                    value at (x[j],y[i]) as with griddata
+                                    given meshgrid(x,y).
+    """
+
+    if method not in methods:
+        raise ValueError("Interpolation method %s is not one of %s."
+                                                            % (method,methods))
+    points = np.asarray(points, dtype=float)
+    values = np.asarray(values, dtype=float)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if points.shape[0] == 0:
+        raise ValueError("No points to interpolate from.")
+
+    delta = max(x[1] - x[0] if x.shape[0] > 1 else 0.0,
+                y[1] - y[0] if y.shape[0] > 1 else 0.0)
+    if delta == 0.0:
+        delta = 1.0
+    options = {'margin':overlap * delta, 'fill_value':fill_value,
+               'num_neighbors':num_neighbors, 'power':power,
+               'max_doublings':max_doublings}
+
+    tiles = []
+    for i in xrange(0, y.shape[0], tile_size):
+        for j in xrange(0, x.shape[0], tile_size):
+            rows = slice(i, min(i + tile_size, y.shape[0]))
+            columns = slice(j, min(j + tile_size, x.shape[0]))
+            tiles.append((rows, columns, x[columns], y[rows], method, options))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tiles))
+
+    Z = np.empty((y.shape[0], x.shape[0]))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=_set_points,
+                                    initargs=(points, values))
+        try:
+            for (rows, columns, Z_tile) in pool.imap_unordered(_grid_tile,
+                                                                tiles):
+                Z[rows, columns] = Z_tile
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _set_points(points, values)
+        try:
+            for tile in tiles:
+                rows, columns, Z_tile = _grid_tile(tile)
+                Z[rows, columns] = Z_tile
+        finally:
+            _set_points(np.empty((0,2)), np.empty(0))
+
+    return Z
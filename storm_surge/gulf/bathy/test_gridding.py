@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+r"""Tests of the tiled interpolation against an untiled griddata
+
+Run with py.test from this directory.
+"""
+
+import numpy as np
+from scipy.interpolate import griddata
+
+import gridding
+
+
+def make_points(num_points=3000,seed=1):
+    random = np.random.RandomState(seed)
+    points = random.rand(num_points,2)
+    values = np.sin(6.0 * points[:,0]) + points[:,1]**2
+    return points,values
+
+
+def compare_linear(x,y,**kargs):
+    points,values = make_points()
+    X,Y = np.meshgrid(x,y)
+    expected = griddata(points,values,(X,Y),method='linear')
+    Z = gridding.grid_data(points,values,x,y,method='linear',**kargs)
+    np.testing.assert_array_equal(np.isnan(Z),np.isnan(expected))
+    inside = ~np.isnan(expected)
+    np.testing.assert_allclose(Z[inside],expected[inside],rtol=0.0,
+                               atol=1e-12)
+
+
+def test_linear_default_tiles():
+    compare_linear(np.linspace(0.0,1.0,1100),np.linspace(0.0,1.0,800),
+                   processes=1)
+
+
+def test_linear_small_tiles():
+    # Small tiles and margins leave nodes for the triangulation of all points
+    x = np.linspace(-0.1,1.1,300)
+    y = np.linspace(-0.1,1.1,200)
+    compare_linear(x,y,tile_size=128,processes=1)
+    compare_linear(x,y,tile_size=32,overlap=2,processes=1)
+    compare_linear(x,y,tile_size=32,overlap=2,processes=2)
+
+
+def test_linear_fill_value():
+    points,values = make_points()
+    x = np.linspace(-0.5,1.5,120)
+    y = np.linspace(-0.5,1.5,100)
+    Z = gridding.grid_data(points,values,x,y,method='linear',
+                           fill_value=999999,tile_size=32,overlap=2,
+                           processes=1)
+    X,Y = np.meshgrid(x,y)
+    outside = np.isnan(griddata(points,values,(X,Y),method='linear'))
+    assert np.all(Z[outside] == 999999)
+    assert np.all(Z[~outside] < 999999)
+
+
+def test_nearest():
+    points,values = make_points()
+    x = np.linspace(0.0,1.0,300)
+    y = np.linspace(0.0,1.0,200)
+    X,Y = np.meshgrid(x,y)
+    expected = griddata(points,values,(X,Y),method='nearest')
+    Z = gridding.grid_data(points,values,x,y,tile_size=64,overlap=2,
+                           processes=1)
+    np.testing.assert_array_equal(Z,expected)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+r"""Round trip tests of the topography formats of write_bathy and read_topo
+
+Run with py.test from this directory.
+"""
+
+import os
+
+import numpy as np
+
+import bathy
+import extract_bathy
+
+lower = (-95.0,29.0)
+delta = 0.01
+num_cells = (53,37)
+
+# File name and topotype of each format written, the binary and NetCDF
+# formats are chosen from the extension
+formats = [('topo.tt3',3),
+           ('topo.tt2',2),
+           ('topo.tt1',1),
+           ('topo.bin',3),
+           ('topo.nc',3)]
+
+
+def make_data():
+    r"""Bathymetry ordered from the lower left corner as write_bathy takes"""
+    x = lower[0] + delta * np.arange(num_cells[0])
+    y = lower[1] + delta * np.arange(num_cells[1])
+    X,Y = np.meshgrid(x,y)
+    return np.round(1000.0 * np.sin(X) * np.cos(Y) - 20.0 * X, 6)
+
+
+def read_grid(path,topo_type):
+    r"""Read path as a grid, reshaping the points of a topotype 1 file"""
+    x,y,Z = bathy.read_topo(path,topo_type=topo_type,cache=False)
+    if topo_type == 1:
+        x = x[:num_cells[0]]
+        y = y[::num_cells[0]]
+        Z = Z.reshape((num_cells[1],num_cells[0]))
+    return x,y,Z
+
+
+def test_round_trip(tmpdir):
+    Z = make_data()
+    x_expected,y_expected = bathy.topo_coordinates(num_cells,lower,delta)
+    for (name,topotype) in formats:
+        path = os.path.join(str(tmpdir),name)
+        extract_bathy.write_bathy(path,Z,lower,delta,topotype=topotype)
+        x,y,Z_read = read_grid(path,topotype)
+
+        assert Z_read.shape == (num_cells[1],num_cells[0]), name
+        np.testing.assert_allclose(Z_read,np.flipud(Z),rtol=1e-12,
+                                   err_msg=name)
+        np.testing.assert_allclose(x,x_expected,rtol=0.0,atol=1e-10,
+                                   err_msg=name)
+        np.testing.assert_allclose(y,y_expected,rtol=0.0,atol=1e-10,
+                                   err_msg=name)
+
+
+def test_coordinates():
+    x,y = bathy.topo_coordinates(num_cells,lower,delta)
+    assert x.shape == (num_cells[0],)
+    assert y.shape == (num_cells[1],)
+    assert x[0] == lower[0]
+    assert y[-1] == lower[1]
+    assert np.all(np.diff(x) > 0.0)
+    assert np.all(np.diff(y) < 0.0)
+
+
+def test_cached_coordinates(tmpdir):
+    r"""The cache of a text file gives the same coordinates as the file"""
+    path = os.path.join(str(tmpdir),'topo.tt3')
+    extract_bathy.write_bathy(path,make_data(),lower,delta)
+    x,y,Z = bathy.read_topo(path,cache=False)
+    for n in range(2):
+        x_cached,y_cached,Z_cached = bathy.read_topo(path,cache=True)
+        np.testing.assert_array_equal(x_cached,x)
+        np.testing.assert_array_equal(y_cached,y)
+        np.testing.assert_array_equal(Z_cached,Z)